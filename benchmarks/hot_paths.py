@@ -0,0 +1,348 @@
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import can
+import canopen
+import numpy as np
+
+from core.axis import Axis
+from core.axis_bank import AxisBank
+from core.cia402 import enable_controlword
+from core.dispatch import CobIdTable
+from core.eds import load_template
+from core.history import HistoryBuffer
+from core.od_store import OdStore
+from core.profile import CYCLIC_SYNC_POSITION
+from core.receiver import PdoReceiver
+from core.rpdo import RpdoMapping, RpdoReceiver
+from core.simulator import Simulator
+from core.topology import Segment, Topology
+from core.tpdo import TpdoScheduler
+from core.trajectory import TrajectoryGenerator
+
+AXES = (5, 50, 500)
+MODES = ("sin", "circle", "line", "lissajous", "step", "triangle")
+BENCHMARKS = ("update_motor", "on_sync", "trajectory", "pdo_decode", "cycle")
+ENGINES = ("scalar", "batched", "batched+rpdo")
+
+MAX_NODES = 127         # 1本の CAN ラインに置ける軸数（これを超える cycle はラインを分ける）
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+RESULT_FORMAT = 1       # JSON の形式を変えたら上げる
+
+
+class _NullBus:
+    """送ったフレームを数えるだけの bus（PDO を詰める時間だけを測る）"""
+
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, msg, timeout=None):
+        self.sent += 1
+
+
+class _ScalarSimulator(Simulator):
+    """軸ごとに Axis.on_sync()（1行ずつ更新 → 全 TPDO 送信）で回す Simulator（比較用）"""
+
+    def _run_drives(self, stats):
+        for axis in self.axes:
+            axis.on_sync()
+
+
+def measure(func, number, repeat):
+    """func() を number 回呼ぶのを repeat 回測り、1回あたりの時間 [s] のリストを返す"""
+    func()      # ウォームアップ
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return times
+
+
+def _result(name, engine, axes, times, number, **params):
+    return {
+        "name": name, "engine": engine, "axes": axes, "params": params,
+        "number": number, "repeat": len(times),
+        "min": min(times), "median": statistics.median(times), "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def _drives(n_axes):
+    """Operation Enabled まで進めた n_axes 軸（ノード ID は 1..127 を繰り返す。送信は _NullBus）"""
+    template = load_template()
+    network = canopen.Network()
+    network.bus = _NullBus()
+    bank = AxisBank(n_axes)
+    axes = []
+    for row in range(n_axes):
+        nid = row % MAX_NODES + 1
+        axes.append(Axis(network.add_node(nid, template.build(nid)), nid, network, bank, row))
+
+    store = bank.store
+    store.column(0x6060)[:] = CYCLIC_SYNC_POSITION
+    for _ in range(4):
+        store.column(0x6040)[:] = enable_controlword(store.column(0x6041))
+        bank.step()
+    store.column(0x607A)[:] = np.arange(n_axes) * 1000 + 100000    # 目標まで遠いので毎周期動く
+    return network, bank, axes
+
+
+# --- 個々の処理 ---
+def bench_update_motor(n_axes, number, repeat):
+    """モーター更新: Axis.update_motor() を軸ごと vs AxisBank.step() で全軸"""
+    _, bank, axes = _drives(n_axes)
+
+    def scalar():
+        for axis in axes:
+            axis.update_motor()
+
+    yield _result("update_motor", "scalar", n_axes, measure(scalar, number, repeat), number)
+    yield _result("update_motor", "batched", n_axes, measure(bank.step, number, repeat), number)
+
+
+def bench_on_sync(n_axes, number, repeat):
+    """SYNC 1回分: Axis.on_sync()（更新 + TPDO を毎回詰める）vs AxisBank.step() + TpdoScheduler"""
+    network, bank, axes = _drives(n_axes)
+    tpdo = TpdoScheduler(axes)
+    send = network.bus.send
+    clock = iter(range(1 << 62))
+
+    def scalar():
+        for axis in axes:
+            axis.on_sync()
+
+    def batched():
+        bank.step()
+        tpdo.on_sync(next(clock) * 0.02, send)
+
+    yield _result("on_sync", "scalar", n_axes, measure(scalar, number, repeat), number)
+    yield _result("on_sync", "batched", n_axes, measure(batched, number, repeat), number)
+
+
+def bench_trajectory(n_axes, number, repeat, block=256):
+    """軌道生成（1周期あたり）: generate() を毎周期 vs generate_block() で block 周期分"""
+    traj = TrajectoryGenerator()
+    traj.n_axes = n_axes
+    for mode in MODES:
+        traj.mode = mode
+        frames = iter(range(1 << 62))
+        blocks = iter(range(0, 1 << 62, block))
+
+        def scalar():
+            traj.generate(next(frames))
+
+        def batched():
+            traj.generate_block(next(blocks), block, n_axes)
+
+        per_block = [t / block for t in measure(batched, max(1, number // block), repeat)]
+        yield _result("trajectory", "scalar", n_axes, measure(scalar, number, repeat), number, mode=mode)
+        yield _result("trajectory", "batched", n_axes, per_block, max(1, number // block),
+                      mode=mode, block=block)
+
+
+def bench_pdo_decode(n_axes, number, repeat):
+    """1周期分（1軸1フレーム）の受信デコード
+
+    tpdo_decode: マスタの受信ループ（PdoReceiver が TPDO を1フレームずつ unpack して履歴へ）
+    rpdo_decode: ドライブ側の RpdoReceiver（届いた RPDO をまとめて np.frombuffer で OdStore へ）
+    受け取るフレームも書き先も違うので名前を分ける（speedups() で比べない）。
+    """
+    _, _, axes = _drives(n_axes)
+    history = HistoryBuffer(range(1, MAX_NODES + 1), capacity=1024)
+    receiver = PdoReceiver(history, CobIdTable.from_axes(axes[:MAX_NODES]))
+    messages = [can.Message(arbitration_id=axis.tpdo_layouts()[0].cob_id,
+                            data=bytes(axis.tpdo_layouts()[0].pack_od().data)) for axis in axes]
+
+    def scalar():
+        for msg in messages:
+            receiver.on_message_received(msg)
+
+    yield _result("tpdo_decode", "scalar", n_axes, measure(scalar, number, repeat), number)
+
+    # RPDO1（controlword + 目標位置）だけを軸ごとに別の COB-ID（0x200 + 行）で受ける
+    template = load_template()
+    nodes = []
+    for row in range(n_axes):
+        node = canopen.LocalNode(row % MAX_NODES + 1, template.build(row % MAX_NODES + 1))
+        node.object_dictionary[0x1400][1].value = 0x200 + row
+        node.object_dictionary[0x1601][0].value = 0
+        nodes.append(node)
+    network = canopen.Network()
+    mapping = RpdoMapping(OdStore(n_axes), nodes)
+    rx = RpdoReceiver(network, mapping)
+    frames = [(0x200 + row, bytes([0x0F, 0, row & 0xFF, 1, 0, 0])) for row in range(n_axes)]
+
+    def batched():
+        rx.subscribe()
+        for cob_id, data in frames:
+            network.notify(cob_id, data, 0.0)   # Notifier が呼ぶのと同じ入口
+        rx.apply()
+
+    yield _result("rpdo_decode", "batched", n_axes, measure(batched, number, repeat), number)
+
+
+def bench_cycle(n_axes, number, repeat, engines=ENGINES):
+    """SYNC 1周期の端から端まで（軌道生成 → (RPDO) → SYNC → 全軸更新 → TPDO → 履歴）
+
+    127 軸を超えるときは CAN ラインを分けて Topology で回す。
+    scalar は Axis.on_sync() を軸ごと、batched は AxisBank + TpdoScheduler、
+    batched+rpdo はさらに目標値を RPDO で送る（既定の Simulator と同じ）。
+    """
+    lines = math.ceil(n_axes / MAX_NODES)
+    sizes = [len(part) for part in np.array_split(np.arange(n_axes), lines)]
+    for engine in engines:
+        cls = _ScalarSimulator if engine == "scalar" else Simulator
+        segments = []
+        try:
+            for i, size in enumerate(sizes):
+                sim = cls(size, history=1024, channel=f"bench-{engine}-{n_axes}-{i}",
+                          rpdo=engine == "batched+rpdo")
+                segments.append(Segment(f"line{i}", sim))
+            topology = Topology(segments, segments[0].sim.period)
+            yield _result("cycle", engine, n_axes, measure(topology.step, number, repeat), number,
+                          lines=lines)
+        finally:
+            for segment in segments:
+                segment.close()
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def environment():
+    return {
+        "revision": _git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "canopen": canopen.__version__,
+        "python-can": can.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run(names=BENCHMARKS, axes=AXES, cycles=200, repeat=5):
+    """ベンチマークを回して結果（JSON にそのまま書ける dict）を返す"""
+    runners = {
+        "update_motor": bench_update_motor, "on_sync": bench_on_sync, "trajectory": bench_trajectory,
+        "pdo_decode": bench_pdo_decode, "cycle": bench_cycle,
+    }
+    results = []
+    for name in names:
+        for n_axes in axes:
+            for result in runners[name](n_axes, cycles, repeat):
+                results.append(result)
+                print(_format(result), flush=True)
+    return {"format": RESULT_FORMAT, "environment": environment(), "results": results}
+
+
+def _key(result):
+    return (result["name"], result["engine"], result["axes"],
+            tuple(sorted(result["params"].items())))
+
+
+def _format(result):
+    params = " ".join(f"{k}={v}" for k, v in result["params"].items())
+    median = result["median"]
+    return (f"{result['name']:<14}{result['engine']:<14}{result['axes']:>5}  {params:<24}"
+            f"{median * 1e6:>12.1f} us{median * 1e6 / result['axes']:>10.2f} us/axis")
+
+
+def compare(current, baseline, threshold=0.1):
+    """baseline（以前の JSON）と中央値を比べた行と、threshold 以上遅くなった数を返す"""
+    old = {_key(result): result for result in baseline["results"]}
+    lines = [f"vs {baseline['environment'].get('revision')} ({baseline['environment'].get('timestamp')})"]
+    slower = 0
+    for result in current["results"]:
+        previous = old.get(_key(result))
+        if previous is None:
+            continue
+        ratio = result["median"] / previous["median"]
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  SLOWER"
+            slower += 1
+        elif ratio < 1 - threshold:
+            mark = "  faster"
+        lines.append(f"{_format(result)}  x{ratio:.2f}{mark}")
+    return lines, slower
+
+
+def speedups(report):
+    """同じ処理・軸数の scalar と batched 系の中央値の比"""
+    def key(result):
+        # batched の block（何周期分まとめるか）は比べる相手を決めるのに使わない
+        params = {k: v for k, v in result["params"].items() if k != "block"}
+        return result["name"], result["axes"], tuple(sorted(params.items()))
+
+    scalar = {key(r): r for r in report["results"] if r["engine"] == "scalar"}
+    lines = []
+    for result in report["results"]:
+        base = scalar.get(key(result))
+        if result["engine"] == "scalar" or base is None:
+            continue
+        params = " ".join(f"{k}={v}" for k, v in key(result)[2])
+        lines.append(f"{result['name']:<14}{result['engine']:<14}{result['axes']:>5}  {params:<24}"
+                     f"x{base['median'] / result['median']:.1f} vs scalar")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot paths (scalar vs batched)")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help="benchmarks to run")
+    parser.add_argument("--axes", nargs="+", type=int, default=list(AXES), help="axis counts")
+    parser.add_argument("--cycles", type=int, default=200, help="calls per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements per benchmark")
+    parser.add_argument("--out", default=None,
+                        help="JSON output path (default: benchmarks/results/<git revision>.json)")
+    parser.add_argument("--compare", default=None, metavar="JSON", help="compare with an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="report a regression when the median is this much slower (0.1 = 10%%)")
+    args = parser.parse_args(argv)
+
+    if any(n < 1 for n in args.axes):
+        parser.error("--axes must be positive")
+
+    report = run(args.only, args.axes, args.cycles, args.repeat)
+
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{report['environment']['revision'] or 'local'}.json")
+    with open(out, "w") as fp:
+        json.dump(report, fp, indent=1)
+    print(f"saved {len(report['results'])} results to {out}")
+
+    for line in speedups(report):
+        print(line)
+
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        lines, slower = compare(report, baseline, args.threshold)
+        print("\n".join(lines))
+        if slower:
+            print(f"{slower} benchmarks slower than {args.compare} by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,30 +1,77 @@
-import can
+import canopen
 
-from canopen.objectdictionary import Variable, ObjectDictionary
+from canopen.sdo import SdoAbortedError
+
+from core.axis_bank import AxisBank
+from core.pdo import (ABORT_CANNOT_MAP, ABORT_PDO_LENGTH, compile_tpdo_map, read_tpdo_cob_ids,
+                      read_tpdo_map)
+from core.tpdo import read_param
+
+TPDO_PARAMETER = 0x1800         # 0x1800〜0x1803: TPDO 通信パラメータ（sub1 が COB-ID）
+TPDO_MAPPING = 0x1A00           # 0x1A00〜0x1A03: TPDO マッピング
+
+# OD に 0x1A00〜0x1A03 が無い TPDO 番号のマッピング
+DEFAULT_TPDO_MAP = {
+    1: [0x6064],                # TPDO1: 位置だけ
+    2: [0x606C, 0x6077]         # TPDO2: vel+torque（pos を入れると 8 byte を超える）
+}
 
 class Axis:
-    def __init__(self, node, node_id, network):
+    def __init__(self, node, node_id, network, bank=None, row=0):
         self.node = node
         self.node_id = node_id
         self.network = network
-        # --- OD の追加（ここが重要） ---
 
-        # Actual Position（既にあるかもしれない）
-        self.node.object_dictionary[0x6064] = Variable("Actual Position", 0x6064, 0)
-            
-        # Actual Velocity（新規追加）
-        self.node.object_dictionary[0x606C] = Variable("Actual Velocity", 0x606C, 0)
+        # 状態は AxisBank の1行に置く（Axis はその行へのビュー）
+        if bank is None:
+            bank = AxisBank(1)
+            row = 0
+        self.bank = bank
+        self.row = row
+        # --- OD の追加（ここが重要） ---
 
-        # Actual Torque（新規追加）
-        self.node.object_dictionary[0x6077] = Variable("Actual Torque",0x6077, 0)
+        # プロセスデータ（0x6040, 0x6041, 0x6060, 0x6064, 0x606C, 0x6077, 0x607A）は
+        # bank.store の配列の行に置き換える（EDS に無いものは追加される）
+        bank.store.attach(self.node.object_dictionary, row)
 
         self.position = 0
         self.velocity = 0
         self.torque = 0
-        self.tpdo_map = {
-            1: [0x6064],                # TPDO1: 位置だけ
-            2: [0x6064, 0x606C, 0x6077] # TPDO2: pos+vel+torque
-        }
+        # TPDO マッピングは OD の 0x1A00〜0x1A03 から（無い TPDO 番号は DEFAULT_TPDO_MAP）、
+        # COB-ID は 0x1800〜0x1803 sub1 から（無い TPDO 番号は既定の COB-ID）。
+        # LocalNode なら SDO で書き換えられたものを次の周期から使う
+        self._od_tpdo = self._applied_tpdo = (self.read_tpdo_map(), self.read_tpdo_cob_ids())
+        self._tpdo_map = dict(self._od_tpdo[0])
+        self._tpdo_cob_ids = self._od_tpdo[1]
+        self._tpdo_pdos = None          # コンパイル済み TPDO（マッピング変更で作り直す）
+        self.tpdo_schedule = None       # この軸を送っている TpdoScheduler（マッピング変更を知らせる）
+        if isinstance(node, canopen.LocalNode):
+            node.add_write_callback(self._on_write)
+
+    # --- AxisBank の行へのビュー ---
+    @property
+    def position(self):
+        return self.bank.position[self.row].item()
+
+    @position.setter
+    def position(self, value):
+        self.bank.position[self.row] = value
+
+    @property
+    def velocity(self):
+        return self.bank.velocity[self.row].item()
+
+    @velocity.setter
+    def velocity(self, value):
+        self.bank.velocity[self.row] = value
+
+    @property
+    def torque(self):
+        return self.bank.torque[self.row].item()
+
+    @torque.setter
+    def torque(self, value):
+        self.bank.torque[self.row] = value
 
     def update(self):
         """1ステップ分モーターを更新する"""
@@ -56,58 +103,111 @@ class Axis:
 
 
     def update_motor(self):
-        target = self.node.object_dictionary[0x607A].value
-        error = target - self.position
-
-        #---P制御---
-        Kp = 0.5 #Gain
-        self.velocity = Kp * error
-
-        # 速度制限
-        vmax = 2000
-        self.velocity = max(min(self.velocity, vmax), -vmax)
-        accel = 10
+        # P制御 + 速度制限 は AxisBank 側で計算（0x607A を読み 0x6064 等に書く）
+        self.bank.step(self.row)
 
-        #---Vlimit---
-        #if self.velocity < vmax:
-        #    self.velocity = vmax
-        #elif self.velocity < -vmax:
-        #        self.velocity = -vmax
-        # 位置更新
-
-        self.position += int(self.velocity)
-
-        #---torque
-        self.torque = self.velocity * 0.5
-
-        # --- od に反映 ---
-        self.node.object_dictionary[0x6064].value = self.position        #Actual Possition
-        self.node.object_dictionary[0X606C].value = int(self.velocity)          #Actual Velocity
-        self.node.object_dictionary[0X6077].value = int(self.velocity * 0.1)    #Actual Torque
+    def store_od(self):
+        """AxisBank の行の値を OD（store の配列）に反映する"""
+        self.bank.store_actuals(self.row)
 
     def on_sync(self):
         self.update_motor()
-
-        # 各TPDO を送信
-        for pdo_num, od_list in self.tpdo_map.items():
-
-
-        #pos = self.node.object_dictionary[0x6064].value
-
-        # 送信するODのリスト（TPDOマッピング)
-        #od_list = [0x6064, 0x606C, 0x6077]
-
-            arb_id = 0x180 + self.node_id + (pdo_num - 1) * 0x100
-            data = bytearray()
-
-        for index in od_list:
-            val = self.node.object_dictionary[index].value
-            data += int(val).to_bytes(4, 'little', signed=True)
-            #arb_id = 0x180 + self.node_id
-            #data = int(pos).to_bytes(4, 'little', signed=True)
-
-        msg = can.Message(arbitration_id=arb_id, data=data, is_extended_id=False)
-        self.network.bus.send(msg)
+        self.send_tpdo()
+
+    @property
+    def tpdo_map(self):
+        """{pdo_num: [index, ...]}（SDO で 0x1A00〜0x1A03 が書かれていたらその内容）"""
+        od_tpdo = self._od_tpdo
+        return self._tpdo_map if od_tpdo is self._applied_tpdo else od_tpdo[0]
+
+    @tpdo_map.setter
+    def tpdo_map(self, value):
+        self._tpdo_map = value
+        self._tpdo_pdos = None
+
+    @property
+    def tpdo_cob_ids(self):
+        """{pdo_num: COB-ID}（SDO で 0x1800〜0x1803 sub1 が書かれていたらその内容）"""
+        od_tpdo = self._od_tpdo
+        return self._tpdo_cob_ids if od_tpdo is self._applied_tpdo else od_tpdo[1]
+
+    def read_tpdo_map(self, value=None):
+        """OD の 0x1A00〜0x1A03 の TPDO マッピング（SDO で書かれた値を優先する）"""
+        if value is None:
+            value = lambda index, subindex: read_param(self.node, index, subindex)
+        tpdo_map = {num: list(od_list) for num, od_list in DEFAULT_TPDO_MAP.items()}
+        tpdo_map.update(read_tpdo_map(self.node.object_dictionary, value))
+        return tpdo_map
+
+    def read_tpdo_cob_ids(self, value=None):
+        """OD の 0x1800〜0x1803 sub1 の COB-ID（SDO で書かれた値を優先する）"""
+        if value is None:
+            value = lambda index, subindex: read_param(self.node, index, subindex)
+        return read_tpdo_cob_ids(self.node.object_dictionary, value)
+
+    def _on_write(self, index, subindex, od, data):
+        # SDO で 0x1A00〜0x1A03 / 0x1800〜0x1803 sub1 が書かれたら、書かれた後のマッピングを
+        # 確かめてから次の周期に組み直す（Notifier のスレッドから、data_store に入る前に呼ばれる）
+        if not (TPDO_MAPPING <= index < TPDO_MAPPING + 4
+                or (TPDO_PARAMETER <= index < TPDO_PARAMETER + 4 and subindex == 1)):
+            return
+        written = od.decode_raw(data)
+
+        def value(i, sub):
+            return written if (i, sub) == (index, subindex) else read_param(self.node, i, sub)
+
+        try:
+            tpdo_map = self.read_tpdo_map(value)
+        except (KeyError, ValueError):
+            raise SdoAbortedError(ABORT_CANNOT_MAP)
+        cob_ids = self.read_tpdo_cob_ids(value)
+        try:
+            compile_tpdo_map(self.node.object_dictionary, self.node_id, tpdo_map, cob_ids)
+        except ValueError:
+            raise SdoAbortedError(ABORT_PDO_LENGTH)
+
+        self._od_tpdo = (tpdo_map, cob_ids)
+        if self.tpdo_schedule is not None:
+            self.tpdo_schedule.invalidate()
+
+    def _apply_od_tpdo_map(self):
+        # SDO で書き換えられたマッピング・COB-ID に切り替える（コンパイル済みは捨てる）。送る側のスレッドから呼ぶ
+        od_tpdo = self._od_tpdo
+        if od_tpdo is not self._applied_tpdo:
+            self._applied_tpdo = od_tpdo
+            self._tpdo_cob_ids = od_tpdo[1]
+            self.tpdo_map = dict(od_tpdo[0])
+        return self._tpdo_map
+
+    def tpdo_pdos(self):
+        """(TPDO 番号, コンパイル済みの TPDO) のリスト（空でない TPDO 番号順）"""
+        tpdo_map = self._apply_od_tpdo_map()
+        pdos = self._tpdo_pdos
+        if pdos is None:
+            pdos = self._tpdo_pdos = _compile_tpdo(self.node.object_dictionary, self.node_id, tpdo_map,
+                                                   self._tpdo_cob_ids)
+        return pdos
+
+    def tpdo_layouts(self):
+        """コンパイル済みの TPDO（空でない TPDO 番号順）"""
+        return [layout for _, layout in self.tpdo_pdos()]
+
+    def send_tpdo(self):
+        # 各TPDO を送信（送信タイプを見ずに全部。送信タイプに従うなら TpdoScheduler）
+        send = self.network.bus.send
+        for layout in self.tpdo_layouts():
+            send(layout.pack_od())
+
+    def set_tpdo_map(self, pdo_num, od_list):
+        """TPDO マッピングを変更する（サイズ超過などは ValueError、元のマッピングは変えない）"""
+        new_map = dict(self._apply_od_tpdo_map())
+        new_map[pdo_num] = list(od_list)
+        pdos = _compile_tpdo(self.node.object_dictionary, self.node_id, new_map, self._tpdo_cob_ids)
+
+        self.tpdo_map = new_map
+        self._tpdo_pdos = pdos
+        if self.tpdo_schedule is not None:
+            self.tpdo_schedule.invalidate()
 
     def slow_stop(self):
         if self.velocity > 0:
@@ -117,3 +217,8 @@ class Axis:
 
         if abs(self.velocity) < 20:
             self.velocity = 0
+
+
+def _compile_tpdo(od, node_id, tpdo_map, cob_ids=None):
+    pdo_nums = [num for num, od_list in sorted(tpdo_map.items()) if od_list]
+    return list(zip(pdo_nums, compile_tpdo_map(od, node_id, tpdo_map, cob_ids)))
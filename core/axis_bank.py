@@ -0,0 +1,206 @@
+import numpy as np
+
+from core.cia402 import (CW_CHANGE_IMMEDIATELY, CW_HALT, CW_NEW_SETPOINT, FAULT_REACTION_ACTIVE,
+                         OPERATION_ENABLED, QUICK_STOP_ACTIVE, SW_SETPOINT_ACK, SW_TARGET_REACHED,
+                         Cia402StateMachine)
+from core.od_store import OdStore
+from core.profile import (CYCLIC_SYNC_POSITION, CYCLIC_SYNC_VELOCITY, PROFILE_POSITION,
+                          PROFILE_VELOCITY, S_CURVE, TRAPEZOID, MotionProfile)
+
+
+class AxisBank:
+    """N 軸分のモーター状態を連続した配列でまとめて持つ
+
+    controlword（0x6040）・モード（0x6060）・目標位置 / 速度（0x607A / 0x60FF）は store から読み、
+    statusword（0x6041）と実位置・速度・トルク（0x6064 / 0x606C / 0x6077）は store に書く。
+    store の行 = bank の行。
+    """
+
+    def __init__(self, n_axes, kp=0.5, vmax=2000, store=None, decel=20, quick_stop_decel=100,
+                 profile_velocity=500, profile_acceleration=20, profile_jerk=2, profile_type=TRAPEZOID,
+                 plant=None):
+        self.n_axes = n_axes
+        self.store = store if store is not None else OdStore(n_axes)
+        self.plant = plant      # PlantModel（None なら1周期1回の簡易モデル）
+
+        # --- 状態（1行 = 1軸） ---
+        self.position = np.zeros(n_axes, dtype=np.float64)
+        self.velocity = np.zeros(n_axes, dtype=np.float64)
+        self.torque = np.zeros(n_axes, dtype=np.float64)
+        self.target = np.zeros(n_axes, dtype=np.float64)
+
+        # --- 軸ごとのパラメータ ---
+        self.kp = np.full(n_axes, kp, dtype=np.float64)      # P制御ゲイン
+        self.vmax = np.full(n_axes, vmax, dtype=np.float64)  # 速度制限
+        self.decel = np.full(n_axes, decel, dtype=np.float64)                        # Halt の減速 [/周期]
+        self.quick_stop_decel = np.full(n_axes, quick_stop_decel, dtype=np.float64)  # Quick Stop の減速 [/周期]
+
+        # --- Profile Position / Velocity のパラメータ（単位は /周期） ---
+        self.profile_velocity = np.full(n_axes, profile_velocity, dtype=np.float64)          # 0x6081
+        self.profile_acceleration = np.full(n_axes, profile_acceleration, dtype=np.float64)  # 0x6083
+        self.profile_deceleration = np.full(n_axes, profile_acceleration, dtype=np.float64)  # 0x6084
+        self.profile_jerk = np.full(n_axes, profile_jerk, dtype=np.float64)                  # 0x60A4
+        self.profile_type = np.full(n_axes, profile_type, dtype=np.int64)                    # 0x6086
+
+        # --- CiA 402 状態遷移 ---
+        self.drive = Cia402StateMachine(n_axes)
+
+        # --- 動作プロファイル（軸ごとの時刻 = step した回数） ---
+        self.profile = MotionProfile(n_axes)
+        self.ticks = np.zeros(n_axes, dtype=np.int64)
+        self._index = np.arange(n_axes)
+        self._planned = np.zeros(n_axes, dtype=bool)
+        self._planned_mode = np.zeros(n_axes, dtype=np.int64)
+        self._planned_velocity = np.zeros(n_axes, dtype=np.int64)
+        self._new_setpoint = np.zeros(n_axes, dtype=bool)
+
+    def __len__(self):
+        return self.n_axes
+
+    def step(self, rows=None):
+        """CiA 402 状態遷移 → 運転モードごとの指令 を全軸まとめて1ステップ進める
+
+        rows を指定するとその行（int または slice）だけを更新する。
+        Operation Enabled の軸だけが 0x6060 のモードで動き、Quick Stop / Fault Reaction と
+        Halt（controlword bit 8）は減速して止まる。それ以外の状態では速度 0。
+        """
+        if rows is None:
+            rows = slice(None)
+        elif isinstance(rows, (int, np.integer)):
+            rows = slice(rows, rows + 1)
+
+        store = self.store
+        position = self.position[rows]
+        previous = self.velocity[rows].copy()      # 1周期前の速度（減速・プロファイルの計画に使う）
+        controlword = store.column(0x6040)[rows]
+        mode = store.column(0x6060)[rows]
+        store.column(0x6061)[rows] = mode
+        self.ticks[rows] += 1
+
+        # ① 状態遷移（0x6040 → 0x6041）
+        standstill = 0.0 if self.plant is None else self.plant.standstill
+        statusword = self.drive.step(controlword, np.abs(previous) <= standstill, rows)
+        state = self.drive.state[rows]
+
+        enabled = state == OPERATION_ENABLED
+        quick = (state == QUICK_STOP_ACTIVE) | (state == FAULT_REACTION_ACTIVE)
+        halt = enabled & ((controlword & CW_HALT) != 0)
+        run = enabled & ~halt
+
+        #---P制御---（Cyclic Synchronous Position）
+        target = self.target[rows] = store.column(0x607A)[rows]
+        follow = self.kp[rows] * (target - position)
+
+        # 速度制限
+        vmax = self.vmax[rows]
+        np.clip(follow, -vmax, vmax, out=follow)
+
+        # Cyclic Synchronous Velocity
+        csv = np.clip(store.column(0x60FF)[rows], -vmax, vmax)
+
+        # 停止中の減速（Quick Stop / Fault Reaction は quick_stop_decel、Halt は decel）
+        decel = np.where(quick, self.quick_stop_decel[rows], self.decel[rows])
+        ramp = np.sign(previous) * np.maximum(np.abs(previous) - decel, 0)
+
+        # Profile Position / Velocity はここでは 0（下でプロファイルの値に置き換える）
+        command = np.select([mode == CYCLIC_SYNC_POSITION, mode == CYCLIC_SYNC_VELOCITY], [follow, csv], 0.0)
+        velocity = np.where(run, command, np.where(quick | halt, ramp, 0.0))
+
+        if self.plant is None:
+            # 位置更新（int() と同じく 0 方向へ切り捨て）
+            self.velocity[rows] = velocity
+            self.position[rows] += np.trunc(velocity)
+
+        profiled = run & ((mode == PROFILE_POSITION) | (mode == PROFILE_VELOCITY))
+        if profiled.any() or self._planned[rows].any():
+            statusword = statusword | self._step_profile(rows, controlword, mode, profiled, previous, velocity)
+        store.column(0x6041)[rows] = statusword
+
+        if self.plant is None:
+            #---torque
+            self.torque[rows] = self.velocity[rows] * 0.5
+        else:
+            # 速度指令をプラントモデルに渡して固定 dt で積分する
+            self.position[rows], self.velocity[rows] = self.plant.step(rows, velocity)
+            self.torque[rows] = self.plant.torque_permille(rows)
+
+        self.store_actuals(rows)
+
+    def _step_profile(self, rows, controlword, mode, profiled, previous_velocity, command):
+        """Profile Position / Velocity の軸を計画し直し、プロファイルの位置・速度にする
+
+        プラントモデルがあるときは位置・速度を直接書かずに、プロファイルに追従する
+        速度指令を command に書く。statusword に足すビット（target reached /
+        set-point acknowledge）を返す。
+        """
+        index = self._index[rows]
+        planned = self._planned[rows]
+        # モードが変わった / 止まっていた軸は計画し直す
+        fresh = profiled & ~(planned & (self._planned_mode[rows] == mode))
+
+        new_setpoint = (controlword & CW_NEW_SETPOINT) != 0
+        rising = new_setpoint & ~self._new_setpoint[rows]
+        self._new_setpoint[rows] = new_setpoint
+
+        t = self.ticks[rows].astype(np.float64)
+        _, _, done = self.profile.evaluate(index, t)
+
+        pp = profiled & (mode == PROFILE_POSITION)
+        pv = profiled & (mode == PROFILE_VELOCITY)
+        immediate = (controlword & CW_CHANGE_IMMEDIATELY) != 0
+        accept = pp & ~fresh & rising & (immediate | done)
+        target_velocity = self.store.column(0x60FF)[rows]
+        retarget = pv & (fresh | (target_velocity != self._planned_velocity[rows]))
+        hold = pp & fresh       # PP に入ったら今の位置で止まって新しい目標を待つ
+
+        jerk = np.where(self.profile_type[rows] == S_CURVE, self.profile_jerk[rows], np.inf)
+        vmax = np.minimum(self.profile_velocity[rows], self.vmax[rows])
+        acc, dec = self.profile_acceleration[rows], self.profile_deceleration[rows]
+        # 今の状態は1周期前（t - 1）のプロファイルの値
+        p0, v0 = self.position[rows], previous_velocity
+
+        if accept.any():
+            m = accept
+            self.profile.plan_position(index[m], t[m] - 1, p0[m], v0[m], self.target[rows][m],
+                                       vmax[m], acc[m], dec[m], jerk[m])
+        if (retarget | hold).any():
+            m = retarget | hold
+            vt = np.where(hold, 0, np.clip(target_velocity, -vmax, vmax))
+            self.profile.plan_velocity(index[m], t[m] - 1, p0[m], v0[m], vt[m], acc[m], dec[m], jerk[m])
+            self._planned_velocity[rows] = np.where(retarget, target_velocity, self._planned_velocity[rows])
+
+        self._planned[rows] = profiled
+        self._planned_mode[rows] = mode
+
+        bits = np.zeros(len(index), dtype=np.int64)
+        if profiled.any():
+            m = profiled
+            position, velocity, done = self.profile.evaluate(index[m], t[m])
+            if self.plant is None:
+                self.position[index[m]] = position
+                self.velocity[index[m]] = velocity
+            else:
+                command[m] = velocity + self.kp[index[m]] * (position - self.position[index[m]])
+            bits[m] = np.where(done, SW_TARGET_REACHED, 0)
+        bits[pp & new_setpoint] |= SW_SETPOINT_ACK
+        return bits
+
+    def store_actuals(self, rows=slice(None)):
+        """実位置・速度・トルクを store（0x6064 / 0x606C / 0x6077）に書く（0 方向へ切り捨て）"""
+        store = self.store
+        store.column(0x6064)[rows] = self.position[rows]
+        store.column(0x606C)[rows] = self.velocity[rows]
+        if self.plant is None:
+            store.column(0x6077)[rows] = self.velocity[rows] * 0.1
+        else:
+            store.column(0x6077)[rows] = self.torque[rows]
+
+    def reset(self, rows=slice(None)):
+        self.position[rows] = 0
+        self.velocity[rows] = 0
+        self.torque[rows] = 0
+        self.target[rows] = 0
+        for index in (0x6064, 0x606C, 0x6077, 0x607A):
+            self.store.column(index)[rows] = 0
+        if self.plant is not None:
+            self.plant.reset(rows)
@@ -0,0 +1,192 @@
+import heapq
+from collections import deque
+from functools import lru_cache
+
+from core.instrumentation import LatencyStats
+
+DEFAULT_BITRATE = 500000
+
+CRC15_POLY = 0x4599
+STUFF_LENGTH = 5        # 同じ値がこのビット数続いたら反転ビットを1つ挟む
+
+# スタッフィングの対象外（CRC デリミタ + ACK 2 + EOF 7 + フレーム間スペース 3）
+_TAIL_BITS = 13
+
+_EPSILON = 1e-9     # 周期の境目の時刻の丸め誤差 [s]
+
+
+def _crc15(bits):
+    crc = 0
+    for bit in bits:
+        if (bit == "1") != bool(crc & 0x4000):
+            crc = ((crc << 1) & 0x7FFF) ^ CRC15_POLY
+        else:
+            crc = (crc << 1) & 0x7FFF
+    return crc
+
+
+def _stuff_bits(bits):
+    """bits に挟まるスタッフビットの数（挟んだビットも次の連続に数える）"""
+    count = 0
+    run = 0
+    last = ""
+    for bit in bits:
+        if bit == last:
+            run += 1
+        else:
+            last, run = bit, 1
+        if run == STUFF_LENGTH:
+            count += 1
+            last, run = ("0" if bit == "1" else "1"), 1
+    return count
+
+
+@lru_cache(maxsize=65536)
+def frame_bits(cob_id, data=b"", extended=False, remote=False):
+    """フレーム1枚がバスを占有するビット数（スタッフビット・フレーム間スペースを含む）
+
+    SOF から CRC までのビット列を作り、CRC-15 を計算してスタッフビットを数える。
+    """
+    dlc = len(data)
+    payload = "" if remote else "".join(f"{b:08b}" for b in data)
+    rtr = "1" if remote else "0"
+    if extended:
+        header = f"0{cob_id >> 18:011b}11{cob_id & 0x3FFFF:018b}{rtr}00{dlc:04b}"
+    else:
+        header = f"0{cob_id:011b}{rtr}00{dlc:04b}"
+    bits = header + payload
+    bits += f"{_crc15(bits):015b}"
+    return len(bits) + _stuff_bits(bits) + _TAIL_BITS
+
+
+def is_pdo(cob_id):
+    """TPDO / RPDO（0x180..0x57F）の COB-ID か"""
+    return 0x180 <= cob_id < 0x580
+
+
+class BusModel:
+    """CAN バス1本の帯域・調停のモデル（BusTap の sink）
+
+    送ったフレームはすぐには届いたことにせず、COB-ID の小さい順（調停）に
+    ビット時間ずつバスを占有させる。周期内に送り切れないフレームは待ち行列に残り、
+    次の周期のフレームと改めて調停する（送信中のフレームは途中で止めない）。
+    clock は送信時刻 [s] を返す callable（シミュレーション時間）。
+    advance(until) で until までバスを進め、周期ごとの使用率と PDO の遅れを記録する。
+    max_queue を超えて待ち行列に入らないフレームは dropped に数える。
+    """
+
+    def __init__(self, bitrate=DEFAULT_BITRATE, clock=None, max_queue=None, size=4096):
+        self.bitrate = bitrate
+        self.clock = clock
+        self.max_queue = max_queue
+
+        self.time = 0.0         # バスが次に空く時刻 [s]
+        self._arrivals = deque()    # (到着時刻, 連番, COB-ID, ビット数)（到着順）
+        self._ready = []            # 調停待ちのヒープ (COB-ID, 連番, 到着時刻, ビット数)
+        self._seq = 0
+        self._window = None         # 今の周期の開始時刻
+        self._carry = 0.0           # 前の周期からはみ出した送信時間 [s]
+
+        # 通算
+        self.frames = 0
+        self.bits = 0
+        self.sent = 0
+        self.dropped = 0
+        self.deferred = 0       # 送った周期の次の周期以降に送り終わったフレーム
+        self.max_backlog = 0
+        self.busy_time = 0.0        # 送信に使った時間 [s]（周期の長さの合計 window_time を超えない）
+        self.window_time = 0.0
+        self.worst_latency = {}     # COB-ID → 送信要求から送り終わるまでの最大 [s]
+
+        # 周期ごと
+        self.load = LatencyStats(size)          # 使用率（0..1）
+        self.pdo_latency = LatencyStats(size)   # その周期に送り終わった PDO の最大の遅れ [s]
+        self.peak_load = 0.0
+
+    @property
+    def backlog(self):
+        return len(self._arrivals) + len(self._ready)
+
+    def record_frame(self, msg):
+        if self.max_queue is not None and self.backlog >= self.max_queue:
+            self.dropped += 1
+            return
+        bits = frame_bits(msg.arbitration_id, bytes(msg.data), msg.is_extended_id, msg.is_remote_frame)
+        self._arrivals.append((self.clock(), self._seq, msg.arbitration_id, bits))
+        self._seq += 1
+        self.frames += 1
+        self.bits += bits
+
+    def advance(self, until):
+        """until までバスを進める（1周期分。前回の until から今回の until までを1周期とする）"""
+        start = self._window if self._window is not None else (
+            self._arrivals[0][0] if self._arrivals else until)
+        period = until - start
+        self._window = until
+
+        busy = min(self._carry, period)
+        self._carry -= busy
+        worst_pdo = 0.0
+        t = max(self.time, start)
+        arrivals, ready = self._arrivals, self._ready
+        while True:
+            while arrivals and arrivals[0][0] <= t:
+                arrival, seq, cob_id, bits = arrivals.popleft()
+                heapq.heappush(ready, (cob_id, seq, arrival, bits))
+            if not ready:
+                if arrivals and arrivals[0][0] < until:
+                    t = arrivals[0][0]
+                    continue
+                break
+            if t >= until:
+                break
+
+            # 一番優先度の高い（COB-ID の小さい）フレームが調停に勝つ
+            cob_id, _, arrival, bits = heapq.heappop(ready)
+            end = t + bits / self.bitrate
+            busy += min(end, until) - t
+            if end > until:
+                self._carry += end - until
+            if arrival < start - _EPSILON:
+                self.deferred += 1
+            latency = end - arrival
+            if latency > self.worst_latency.get(cob_id, 0.0):
+                self.worst_latency[cob_id] = latency
+            if is_pdo(cob_id) and latency > worst_pdo:
+                worst_pdo = latency
+            self.sent += 1
+            t = end
+
+        self.time = max(t, self.time)
+        self.max_backlog = max(self.max_backlog, self.backlog)
+        if period > 0:
+            self.busy_time += busy
+            self.window_time += period
+            load = busy / period
+            self.load.add(load)
+            self.peak_load = max(self.peak_load, load)
+        self.pdo_latency.add(worst_pdo)
+
+    def average_load(self, elapsed):
+        """elapsed 秒あたりの平均の送信要求（送ろうとしたビット数から、帯域を超えると 1 より大きい）"""
+        return self.bits / (self.bitrate * elapsed) if elapsed > 0 else 0.0
+
+    def carried_load(self):
+        """advance() した周期全体の平均使用率（実際に送った時間から、0..1）"""
+        return self.busy_time / self.window_time if self.window_time > 0 else 0.0
+
+    def worst_pdo_latency(self):
+        return max((v for cob_id, v in self.worst_latency.items() if is_pdo(cob_id)), default=0.0)
+
+    def report(self):
+        load = self.load.summary()
+        latency = self.pdo_latency.summary()
+        lines = [
+            f"bus {self.bitrate // 1000} kbit/s: {self.frames} frames, {self.sent} sent, "
+            f"{self.deferred} deferred, {self.dropped} dropped, backlog {self.backlog} (max {self.max_backlog})",
+            f"  load per cycle [%]: p50 {load['p50'] * 100:.1f}  p99 {load['p99'] * 100:.1f}  "
+            f"max {load['max'] * 100:.1f}",
+            f"  PDO latency [us]: p50 {latency['p50'] * 1e6:.1f}  p99 {latency['p99'] * 1e6:.1f}  "
+            f"worst {self.worst_pdo_latency() * 1e6:.1f}",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,174 @@
+import numpy as np
+
+# --- 状態 ---
+NOT_READY_TO_SWITCH_ON = 0
+SWITCH_ON_DISABLED = 1
+READY_TO_SWITCH_ON = 2
+SWITCHED_ON = 3
+OPERATION_ENABLED = 4
+QUICK_STOP_ACTIVE = 5
+FAULT_REACTION_ACTIVE = 6
+FAULT = 7
+
+STATE_NAMES = (
+    "Not Ready to Switch On", "Switch On Disabled", "Ready to Switch On", "Switched On",
+    "Operation Enabled", "Quick Stop Active", "Fault Reaction Active", "Fault",
+)
+
+# --- controlword のコマンド ---
+DISABLE_VOLTAGE = 0
+QUICK_STOP = 1
+SHUTDOWN = 2
+SWITCH_ON = 3           # Operation Enabled からは Disable Operation
+ENABLE_OPERATION = 4
+FAULT_RESET = 5
+
+# よく使う controlword の値
+CW_SHUTDOWN = 0x0006
+CW_SWITCH_ON = 0x0007
+CW_ENABLE_OPERATION = 0x000F
+CW_QUICK_STOP = 0x0002
+CW_DISABLE_VOLTAGE = 0x0000
+CW_FAULT_RESET = 0x0080
+CW_NEW_SETPOINT = 0x0010           # bit 4（Profile Position: 立ち上がりで目標位置を受け付ける）
+CW_CHANGE_IMMEDIATELY = 0x0020     # bit 5（Profile Position: 移動中でもすぐに切り替える）
+CW_HALT = 0x0100        # bit 8（Operation Enabled のまま減速停止）
+
+# statusword のビット
+SW_VOLTAGE_ENABLED = 0x0010
+SW_REMOTE = 0x0200
+SW_TARGET_REACHED = 0x0400
+SW_SETPOINT_ACK = 0x1000       # bit 12（Profile Position: 目標位置を受け付けた）
+
+
+def _command_table():
+    """controlword の bit0〜6 → コマンド（fault reset は立ち上がりで別に判定）"""
+    table = np.empty(128, dtype=np.int8)
+    for cw in range(128):
+        if not cw & 0x02:
+            table[cw] = DISABLE_VOLTAGE         # xxxx xx0x
+        elif not cw & 0x04:
+            table[cw] = QUICK_STOP              # xxxx x01x
+        elif not cw & 0x01:
+            table[cw] = SHUTDOWN                # xxxx x110
+        elif not cw & 0x08:
+            table[cw] = SWITCH_ON               # xxxx 0111
+        else:
+            table[cw] = ENABLE_OPERATION        # xxxx 1111
+    return table
+
+
+def _transition_table():
+    """NEXT[state, command] → 次の状態（CiA 402 の遷移 1〜16）"""
+    S = SWITCH_ON_DISABLED
+    R = READY_TO_SWITCH_ON
+    O = SWITCHED_ON
+    E = OPERATION_ENABLED
+    Q = QUICK_STOP_ACTIVE
+
+    # 列の順: DISABLE_VOLTAGE, QUICK_STOP, SHUTDOWN, SWITCH_ON, ENABLE_OPERATION, FAULT_RESET
+    return np.array([
+        [S, S, S, S, S, S],     # Not Ready → Switch On Disabled（自動、遷移 1）
+        [S, S, R, S, S, S],     # Switch On Disabled（遷移 2）
+        [S, S, R, O, E, R],     # Ready to Switch On（遷移 3, 7、3+4 もまとめて許す）
+        [S, S, R, O, E, O],     # Switched On（遷移 4, 6, 10）
+        [S, Q, R, O, E, E],     # Operation Enabled（遷移 5, 8, 9, 11）
+        [S, Q, Q, Q, E, Q],     # Quick Stop Active（遷移 12, 16）
+        [FAULT_REACTION_ACTIVE] * 6,    # Fault Reaction Active（停止で Fault、遷移 14）
+        [FAULT, FAULT, FAULT, FAULT, FAULT, S],     # Fault（fault reset で遷移 15）
+    ], dtype=np.int8)
+
+
+def _statusword_table():
+    """状態 → statusword（bit 0〜6）"""
+    return np.array([
+        0x0000,                         # Not Ready to Switch On       x0xx 0000
+        0x0040,                         # Switch On Disabled           x1xx 0000
+        0x0021 | SW_VOLTAGE_ENABLED,    # Ready to Switch On           x01x 0001
+        0x0023 | SW_VOLTAGE_ENABLED,    # Switched On                  x01x 0011
+        0x0027 | SW_VOLTAGE_ENABLED,    # Operation Enabled            x01x 0111
+        0x0007 | SW_VOLTAGE_ENABLED,    # Quick Stop Active            x00x 0111
+        0x000F | SW_VOLTAGE_ENABLED,    # Fault Reaction Active        x0xx 1111
+        0x0008,                         # Fault                        x0xx 1000
+    ], dtype=np.int64) | SW_REMOTE
+
+
+COMMANDS = _command_table()
+NEXT_STATE = _transition_table()
+STATUSWORDS = _statusword_table()
+
+# statusword → 状態 の判定（マスク, 値）
+_STATE_MASKS = (
+    (0x4F, 0x00, NOT_READY_TO_SWITCH_ON),
+    (0x4F, 0x40, SWITCH_ON_DISABLED),
+    (0x6F, 0x21, READY_TO_SWITCH_ON),
+    (0x6F, 0x23, SWITCHED_ON),
+    (0x6F, 0x27, OPERATION_ENABLED),
+    (0x6F, 0x07, QUICK_STOP_ACTIVE),
+    (0x4F, 0x0F, FAULT_REACTION_ACTIVE),
+    (0x4F, 0x08, FAULT),
+)
+
+
+def decode_state(statusword):
+    """statusword（配列）→ 状態（配列）。マスタ側で使う"""
+    statusword = np.asarray(statusword)
+    conditions = [(statusword & mask) == value for mask, value, _ in _STATE_MASKS]
+    states = [state for _, _, state in _STATE_MASKS]
+    return np.select(conditions, states, NOT_READY_TO_SWITCH_ON).astype(np.int8)
+
+
+def enable_controlword(statusword, reset_faults=False):
+    """マスタ側: Operation Enabled に向けて次に送る controlword（配列）を返す"""
+    state = decode_state(statusword)
+    cw = np.full(state.shape, CW_SHUTDOWN, dtype=np.int64)
+    cw[(state == READY_TO_SWITCH_ON) | (state == SWITCHED_ON) | (state == OPERATION_ENABLED)] = CW_ENABLE_OPERATION
+    cw[state == QUICK_STOP_ACTIVE] = CW_QUICK_STOP      # 止まりきって Switch On Disabled になるまで待つ
+    if reset_faults:
+        cw[state == FAULT] = CW_FAULT_RESET
+    return cw
+
+
+class Cia402StateMachine:
+    """N 軸分の CiA 402 状態遷移を表引きでまとめて進める"""
+
+    def __init__(self, n_axes):
+        self.state = np.full(n_axes, NOT_READY_TO_SWITCH_ON, dtype=np.int8)
+        self._prev_controlword = np.zeros(n_axes, dtype=np.int64)
+        self._fault = np.zeros(n_axes, dtype=bool)
+
+    def raise_fault(self, rows):
+        """次の step() で Fault Reaction Active に入れる"""
+        self._fault[rows] = True
+
+    def step(self, controlword, stopped, rows=slice(None)):
+        """controlword（0x6040）から状態を進め、statusword（0x6041）を返す
+
+        stopped は各軸が停止しているか（Quick Stop / Fault Reaction の完了判定）。
+        """
+        state = self.state[rows]
+        cw = controlword & 0xFF
+
+        command = COMMANDS[cw & 0x7F]
+        rising = (cw & 0x80) & ~(self._prev_controlword[rows] & 0x80)
+        command = np.where(rising != 0, FAULT_RESET, command)
+        self._prev_controlword[rows] = cw
+
+        state = NEXT_STATE[state, command]
+
+        # 自動遷移: 停止したら Quick Stop → Switch On Disabled、Fault Reaction → Fault
+        state = np.where((state == QUICK_STOP_ACTIVE) & stopped, SWITCH_ON_DISABLED, state)
+        state = np.where((state == FAULT_REACTION_ACTIVE) & stopped, FAULT, state)
+
+        # 新しい異常は Fault 中以外なら Fault Reaction Active へ
+        fault = self._fault[rows]
+        state = np.where(fault & (state != FAULT), FAULT_REACTION_ACTIVE, state)
+        self._fault[rows] = False
+
+        self.state[rows] = state
+        return STATUSWORDS[state]
+
+    def reset(self, rows=slice(None)):
+        self.state[rows] = NOT_READY_TO_SWITCH_ON
+        self._prev_controlword[rows] = 0
+        self._fault[rows] = False
@@ -0,0 +1,163 @@
+import os
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:     # pyarrow が無ければ .npy だけ書く
+    pa = pq = None
+
+# 書き出す信号 → (OD の index, dtype)
+SIGNAL_COLUMNS = {
+    "position": (0x6064, "<i4"),
+    "velocity": (0x606C, "<i4"),
+    "torque": (0x6077, "<i2"),
+    "target": (0x607A, "<i4"),
+    "statusword": (0x6041, "<u2"),
+}
+
+# .npy のヘッダは固定長にしておき、追記のたびに shape だけ書き換える
+_NPY_MAGIC = b"\x93NUMPY\x01\x00"
+_NPY_HEADER_SIZE = 128
+
+PARQUET_NAME = "signals.parquet"
+
+
+def _npy_header(dtype, shape):
+    header = repr({"descr": np.dtype(dtype).str, "fortran_order": False, "shape": tuple(shape)})
+    length = _NPY_HEADER_SIZE - len(_NPY_MAGIC) - 2
+    header = header.ljust(length - 1).encode("latin1") + b"\n"
+    if len(header) != length:
+        raise ValueError(f"shape {shape} does not fit in the .npy header")
+    return _NPY_MAGIC + length.to_bytes(2, "little") + header
+
+
+class _NpyColumn:
+    """行を追記していける .npy ファイル（np.load(mmap_mode="r") でそのまま開ける）"""
+
+    def __init__(self, path, dtype, width=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width      # None なら1次元
+        self.rows = 0
+        self.fp = open(path, "wb")
+        self.fp.write(self._header())
+
+    def _header(self):
+        shape = (self.rows,) if self.width is None else (self.rows, self.width)
+        return _npy_header(self.dtype, shape)
+
+    def append(self, block):
+        self.fp.seek(0, os.SEEK_END)
+        self.fp.write(np.ascontiguousarray(block, dtype=self.dtype).tobytes())
+        self.rows += len(block)
+        self.fp.seek(0)
+        self.fp.write(self._header())
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+
+class SignalExporter:
+    """全軸の位置・速度・トルク・目標位置・statusword を列ごとのファイルに書き出す
+
+    directory に time.npy / tick.npy と信号ごとの <signal>.npy（行 = 周期、列 = 軸）を作り、
+    chunk 周期ごとに追記する。pyarrow があれば signals.parquet にも
+    chunk ごとに1 row group ずつ書く。途中で止まってもそこまでのデータは読める。
+    """
+
+    def __init__(self, directory, node_ids, chunk=1000, parquet=True):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.node_ids = list(node_ids)
+        self.chunk = chunk
+        n_axes = len(self.node_ids)
+
+        self._time = np.zeros(chunk, dtype=np.float64)
+        self._tick = np.zeros(chunk, dtype=np.uint32)
+        self._buffers = {name: np.zeros((chunk, n_axes), dtype=dtype)
+                         for name, (_, dtype) in SIGNAL_COLUMNS.items()}
+        self._n = 0
+        self.rows = 0
+
+        self._columns = {"time": _NpyColumn(os.path.join(directory, "time.npy"), np.float64),
+                         "tick": _NpyColumn(os.path.join(directory, "tick.npy"), np.uint32)}
+        for name, (_, dtype) in SIGNAL_COLUMNS.items():
+            self._columns[name] = _NpyColumn(os.path.join(directory, name + ".npy"), dtype, n_axes)
+        with open(os.path.join(directory, "node_ids.txt"), "w") as fp:
+            fp.write(" ".join(str(nid) for nid in self.node_ids) + "\n")
+
+        self._parquet = None
+        if parquet and pq is not None:
+            fields = [pa.field("time", pa.float64()), pa.field("tick", pa.uint32())]
+            for name, (_, dtype) in SIGNAL_COLUMNS.items():
+                fields += [pa.field(f"{name}_{nid}", pa.from_numpy_dtype(np.dtype(dtype)))
+                           for nid in self.node_ids]
+            self._parquet = pq.ParquetWriter(os.path.join(directory, PARQUET_NAME), pa.schema(fields))
+
+    def append(self, tick, t, store):
+        """OdStore の全軸分の値を1周期分ためる（chunk 周期たまったら書く）"""
+        i = self._n
+        self._time[i] = t
+        self._tick[i] = tick
+        for name, (index, _) in SIGNAL_COLUMNS.items():
+            self._buffers[name][i] = store.column(index)
+        self._n += 1
+        if self._n == self.chunk:
+            self.flush()
+
+    def flush(self):
+        n = self._n
+        if n == 0:
+            return
+        self._columns["time"].append(self._time[:n])
+        self._columns["tick"].append(self._tick[:n])
+        for name, buffer in self._buffers.items():
+            self._columns[name].append(buffer[:n])
+
+        if self._parquet is not None:
+            arrays = [pa.array(self._time[:n]), pa.array(self._tick[:n])]
+            for buffer in self._buffers.values():
+                arrays += [pa.array(buffer[:n, j]) for j in range(len(self.node_ids))]
+            self._parquet.write_table(pa.Table.from_arrays(arrays, schema=self._parquet.schema))
+
+        self.rows += n
+        self._n = 0
+
+    def close(self):
+        if self._columns is None:
+            return
+        self.flush()
+        for column in self._columns.values():
+            column.close()
+        if self._parquet is not None:
+            self._parquet.close()
+        self._columns = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_signals(directory, mmap_mode="r"):
+    """SignalExporter の出力を {名前: 配列} で返す（既定は memmap で開く）
+
+    "node_ids" には列の順番のノード ID が入る。
+    """
+    signals = {"time": None, "tick": None, **dict.fromkeys(SIGNAL_COLUMNS)}
+    for name in signals:
+        signals[name] = np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+    with open(os.path.join(directory, "node_ids.txt")) as fp:
+        signals["node_ids"] = [int(nid) for nid in fp.read().split()]
+    return signals
+
+
+def save_npz(directory, path):
+    """SignalExporter の出力を1つの .npz にまとめる（受け渡し用。memmap では開けない）"""
+    signals = load_signals(directory)
+    signals["node_ids"] = np.asarray(signals["node_ids"])
+    np.savez(path, **signals)
@@ -0,0 +1,76 @@
+import struct
+
+from core.history import SIGNALS
+from core.pdo import PdoLayout, tpdo_cob_id
+
+# OD index → 履歴の信号名
+SIGNAL_OF_INDEX = {
+    0x6064: "position",
+    0x606C: "velocity",
+    0x6077: "torque",
+    0x607A: "target",
+    0x6041: "statusword",
+}
+
+
+class PdoEntry:
+    """1つの COB-ID のデコード情報
+
+    fields は (値の位置, node id, 信号名) のタプル。
+    """
+
+    __slots__ = ("node_id", "pdo_num", "struct", "fields")
+
+    def __init__(self, node_id, pdo_num, struct_, fields):
+        self.node_id = node_id
+        self.pdo_num = pdo_num
+        self.struct = struct_
+        self.fields = tuple(fields)
+
+
+class CobIdTable:
+    """COB-ID → PdoEntry の表（受信時は dict 1回 + unpack_from 1回）"""
+
+    def __init__(self, signals=SIGNALS):
+        self.signals = frozenset(signals)
+        self.entries = {}
+
+    def get(self, cob_id):
+        return self.entries.get(cob_id)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add_tpdo(self, node_id, pdo_num, layout):
+        fields = [(i, node_id, SIGNAL_OF_INDEX.get(index))
+                  for i, index in enumerate(layout.indices)]
+        self._add(layout.cob_id, PdoEntry(node_id, pdo_num, layout.struct, fields))
+
+    def add_axis(self, axis):
+        """axis.tpdo_map の TPDO1〜4 を axis.tpdo_cob_ids の COB-ID で登録する"""
+        od = axis.node.object_dictionary
+        cob_ids = axis.tpdo_cob_ids
+        for pdo_num, od_list in axis.tpdo_map.items():
+            if not od_list:
+                continue
+            cob_id = cob_ids.get(pdo_num, tpdo_cob_id(axis.node_id, pdo_num))
+            layout = PdoLayout.compile(od, cob_id, od_list)
+            self.add_tpdo(axis.node_id, pdo_num, layout)
+
+    def add_multi_axis(self, cob_id, node_ids, signal="position"):
+        """複数軸の値（INTEGER32）を1フレームに並べた PDO を登録する"""
+        node_ids = list(node_ids)
+        fields = [(i, nid, signal) for i, nid in enumerate(node_ids)]
+        self._add(cob_id, PdoEntry(None, None, struct.Struct(f"<{len(node_ids)}i"), fields))
+
+    def _add(self, cob_id, entry):
+        # 履歴に無い信号は最初から外しておく
+        entry.fields = tuple(f for f in entry.fields if f[2] in self.signals)
+        self.entries[cob_id] = entry
+
+    @classmethod
+    def from_axes(cls, axes, signals=SIGNALS):
+        table = cls(signals)
+        for axis in axes:
+            table.add_axis(axis)
+        return table
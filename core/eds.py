@@ -0,0 +1,226 @@
+import hashlib
+import os
+import pickle
+from collections import namedtuple
+from configparser import RawConfigParser
+
+from canopen.objectdictionary import ODArray, ODRecord, ODVariable, ObjectDictionary
+
+DEFAULT_EDS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cia402.eds")
+
+CACHE_SUFFIX = ".edscache"
+CACHE_VERSION = 1       # テンプレートの形式を変えたら上げる
+
+# メモリ上のキャッシュ（path → (hash, template)）
+_templates = {}
+
+
+# EDS の1変数分の定義
+VarSpec = namedtuple("VarSpec", [
+    "index", "subindex", "name", "data_type", "access_type", "pdo_mappable",
+    "default", "value",
+    "relative",     # True なら default / value に node id を足す
+    "low", "high",
+])
+
+# 文字列として扱うデータ型（VISIBLE_STRING / OCTET_STRING / DOMAIN）
+STRING_TYPES = (0x0009, 0x000A, 0x000F)
+
+
+class EdsTemplate:
+    """EDS/DCF を1回だけ解析した結果（変更しない）
+
+    objects は (index, kind, name, members) のタプル。
+    kind は "var" / "record" / "array"、members は VarSpec のタプル。
+    """
+
+    def __init__(self, objects, node_id, baudrates, device_info):
+        self.objects = objects
+        self.node_id = node_id          # EDS に書かれている NodeID（DeviceComissioning）
+        self.baudrates = baudrates      # 対応ビットレート [bit/s]
+        self.device_info = device_info
+
+    def build(self, node_id=None):
+        """node_id 用の ObjectDictionary を作る（$NODEID / COB-ID を置き換える）"""
+        if node_id is None:
+            node_id = self.node_id
+
+        od = ObjectDictionary()
+        od.node_id = node_id
+        od.device_information.allowed_baudrates.update(self.baudrates)
+
+        for index, kind, name, members in self.objects:
+            if kind == "var":
+                od.add_object(_build_var(members[0], node_id))
+                continue
+
+            obj = ODRecord(name, index) if kind == "record" else ODArray(name, index)
+            for spec in members:
+                obj.add_member(_build_var(spec, node_id))
+            od.add_object(obj)
+
+        return od
+
+
+def _build_var(spec, node_id):
+    var = ODVariable(spec.name, spec.index, spec.subindex)
+    var.data_type = spec.data_type
+    var.access_type = spec.access_type
+    var.pdo_mappable = spec.pdo_mappable
+    var.min = spec.low
+    var.max = spec.high
+
+    offset = node_id if spec.relative else 0
+    var.relative = spec.relative
+    if spec.default is not None:
+        var.default = spec.default + offset if spec.relative else spec.default
+    # シミュレータは .value を直接読み書きするので初期値を入れておく
+    value = spec.value if spec.value is not None else spec.default
+    if value is not None:
+        var.value = value + offset if spec.relative else value
+    return var
+
+
+def _is_cob_id(index, subindex):
+    # RPDO / TPDO 通信パラメータの COB-ID（0x1400〜0x15FF, 0x1800〜0x19FF の sub1）
+    return subindex == 1 and (0x1400 <= index <= 0x15FF or 0x1800 <= index <= 0x19FF)
+
+
+def _parse_int(text, index, subindex, eds_node_id):
+    """EDS の数値を (値, node id 相対か) にする
+
+    "$NODEID+0x180" は相対。COB-ID に "0x180+1" のように EDS 上の NodeID を
+    足した形で書かれているものも相対として扱う。
+    """
+    text = text.strip()
+    if not text:
+        return None, False
+
+    terms = [t.strip() for t in text.split("+")]
+    relative = False
+    total = 0
+    for term in terms:
+        if term.upper() == "$NODEID":
+            relative = True
+        else:
+            total += int(term, 0)
+
+    if not relative and len(terms) > 1 and _is_cob_id(index, subindex) and eds_node_id:
+        total -= eds_node_id
+        relative = True
+
+    return total, relative
+
+
+def _parse_var(eds, section, index, subindex, eds_node_id):
+    get = lambda key: eds.get(section, key, fallback="")
+
+    data_type = int(get("DataType"), 0) if get("DataType") else None
+    if data_type in STRING_TYPES:
+        default, value, relative = get("DefaultValue"), get("ParameterValue") or None, False
+    else:
+        default, relative = _parse_int(get("DefaultValue"), index, subindex, eds_node_id)
+        value, value_relative = _parse_int(get("ParameterValue"), index, subindex, eds_node_id)
+        relative = relative or value_relative
+
+    low = int(get("LowLimit"), 0) if get("LowLimit") else None
+    high = int(get("HighLimit"), 0) if get("HighLimit") else None
+
+    return VarSpec(index, subindex, get("ParameterName"), data_type,
+                   (get("AccessType") or "rw").lower(), get("PDOMapping") == "1",
+                   default, value, relative, low, high)
+
+
+def parse_eds(path):
+    """EDS/DCF を解析して EdsTemplate を返す（キャッシュなし）"""
+    eds = RawConfigParser(inline_comment_prefixes=(";",))
+    eds.optionxform = str
+    with open(path) as fp:
+        eds.read_file(fp)
+
+    eds_node_id = None
+    if eds.has_section("DeviceComissioning"):
+        text = eds.get("DeviceComissioning", "NodeID", fallback="")
+        eds_node_id = int(text, 0) if text else None
+
+    device_info = dict(eds.items("DeviceInfo")) if eds.has_section("DeviceInfo") else {}
+
+    # BaudRate_125=1（標準）と BaudRate_0=125（値が kbit/s）の両方に対応
+    baudrates = set()
+    for key, text in device_info.items():
+        if not key.startswith("BaudRate_"):
+            continue
+        rate, flag = int(key[len("BaudRate_"):]), int(text, 0)
+        if flag == 1:
+            baudrates.add(rate * 1000)
+        elif flag > 1:
+            baudrates.add(flag * 1000)
+
+    objects = []
+    for section in eds.sections():
+        if len(section) != 4:
+            continue
+        try:
+            index = int(section, 16)
+        except ValueError:
+            continue
+
+        object_type = int(eds.get(section, "ObjectType", fallback="0x7"), 0)
+        name = eds.get(section, "ParameterName", fallback="")
+
+        if object_type in (0x7, 0x2):
+            objects.append((index, "var", name, (_parse_var(eds, section, index, 0, eds_node_id),)))
+            continue
+
+        members = []
+        for subindex in range(256):
+            sub_section = f"{section}sub{subindex:X}"
+            if not eds.has_section(sub_section):
+                sub_section = f"{section}sub{subindex}"
+            if eds.has_section(sub_section):
+                members.append(_parse_var(eds, sub_section, index, subindex, eds_node_id))
+
+        kind = "array" if object_type == 0x8 else "record"
+        objects.append((index, kind, name, tuple(members)))
+
+    return EdsTemplate(tuple(objects), eds_node_id, frozenset(baudrates), device_info)
+
+
+def load_template(path=DEFAULT_EDS):
+    """EDS のテンプレートを返す（メモリ → EDS 横の .edscache → 解析 の順に探す）
+
+    キャッシュは EDS ファイルの SHA-1 で照合するので、EDS を書き換えれば作り直す。
+    """
+    path = os.path.abspath(path)
+    with open(path, "rb") as fp:
+        digest = hashlib.sha1(fp.read()).hexdigest()
+
+    cached = _templates.get(path)
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+
+    cache_path = path + CACHE_SUFFIX
+    template = None
+    try:
+        with open(cache_path, "rb") as fp:
+            version, cache_digest, cache_template = pickle.load(fp)
+        if version == CACHE_VERSION and cache_digest == digest:
+            template = cache_template
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+        pass
+
+    if template is None:
+        template = parse_eds(path)
+        try:
+            with open(cache_path, "wb") as fp:
+                pickle.dump((CACHE_VERSION, digest, template), fp, pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass    # 書けない場所ならメモリ上のキャッシュだけ使う
+
+    _templates[path] = (digest, template)
+    return template
+
+
+def load_od(path=DEFAULT_EDS, node_id=None):
+    """EDS/DCF から node_id 用の ObjectDictionary を作る（解析は1回だけ）"""
+    return load_template(path).build(node_id)
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import deque
+
+import can
+
+from core.trace import tap_network
+
+# 形式名 → (python-can の Writer, 拡張子)
+FORMATS = {
+    "candump": (can.CanutilsLogWriter, ".log"),
+    "asc": (can.ASCWriter, ".asc"),
+    "blf": (can.BLFWriter, ".blf"),
+}
+
+BATCH = 64      # 書き出しスレッドが GIL を譲るまでに書くフレーム数
+
+
+def format_of(path):
+    """拡張子から形式名を決める"""
+    ext = os.path.splitext(path)[1].lower()
+    for name, (_, suffix) in FORMATS.items():
+        if ext == suffix:
+            return name
+    raise ValueError(f"unknown log format for {path!r} (use {', '.join(s for _, s in FORMATS.values())})")
+
+
+class LogExporter:
+    """送信フレームを candump / ASC / BLF にバックグラウンドで書き出す
+
+    BusTap の sink として使う。送信側は (時刻, COB-ID, データ, フラグ) を上限つきの
+    キューに入れるだけで、Message の生成とファイルへの書き込みは専用スレッドが行う。
+    キューがいっぱいのときは待たずに捨てて dropped を数える（送信周期を優先する）。
+    書き出しスレッドは poll_interval ごとにたまった分をまとめて書く。
+    """
+
+    def __init__(self, path, fmt=None, maxsize=65536, flush_interval=1.0, poll_interval=0.05,
+                 clock=time.time):
+        self.path = path
+        self.format = fmt or format_of(path)
+        writer_class, _ = FORMATS[self.format]
+        self.writer = writer_class(path)
+        self.clock = clock
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+
+        self.written = 0
+        self.dropped = 0
+
+        # deque の append / popleft はスレッドセーフ（ロックも通知も要らない）
+        self.maxsize = maxsize
+        self._queue = deque()
+        self._stop_event = threading.Event()
+        self._tap = None
+        self._thread = threading.Thread(target=self._run, name=f"export-{self.format}", daemon=True)
+        self._thread.start()
+
+    def attach(self, network):
+        """network.bus.send() で送るフレームを書き出す"""
+        self._tap = tap_network(network)
+        self._tap.sinks.append(self.record_frame)
+
+    def detach(self):
+        if self._tap is not None and self.record_frame in self._tap.sinks:
+            self._tap.sinks.remove(self.record_frame)
+        self._tap = None
+
+    def record_frame(self, msg):
+        # msg は使い回されるのでデータはここでコピーする
+        if len(self._queue) >= self.maxsize:
+            self.dropped += 1
+            return
+        self._queue.append((self.clock(), msg.arbitration_id, bytes(msg.data),
+                            msg.is_extended_id, msg.is_remote_frame))
+
+    def close(self, timeout=5.0):
+        """キューに残っている分を書いてからファイルを閉じる"""
+        self.detach()
+        if not self._thread.is_alive():
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        # 1件ずつ起きると送信側と GIL を取り合うので、poll_interval ごとにまとめて書く
+        writer = self.writer
+        next_flush = time.monotonic() + self.flush_interval
+        try:
+            while True:
+                # 止めるときも残りを全部書いてから抜ける
+                stopping = self._stop_event.wait(self.poll_interval)
+                for _ in range(len(self._queue)):
+                    t, cob_id, data, extended, remote = self._queue.popleft()
+                    writer.on_message_received(can.Message(
+                        timestamp=t, arbitration_id=cob_id, data=data, is_rx=False,
+                        is_extended_id=extended, is_remote_frame=remote))
+                    self.written += 1
+                    if self.written % BATCH == 0:
+                        time.sleep(0)       # 送信側に GIL を譲る
+
+                # 定期的にファイルへ書き出す（途中で落ちても直前までは残る）
+                if time.monotonic() >= next_flush:
+                    file = getattr(writer, "file", None)
+                    if file is not None:
+                        file.flush()
+                    next_flush = time.monotonic() + self.flush_interval
+
+                if stopping and not self._queue:
+                    return
+        finally:
+            writer.stop()
@@ -0,0 +1,82 @@
+import numpy as np
+
+SIGNALS = ("position", "velocity", "torque", "target")
+
+
+class HistoryBuffer:
+    """軸ごと・信号ごとの履歴を固定長のリングバッファで持つ
+
+    データは 2 * capacity の領域に同じ値を2か所書き込む（ミラー書き込み）。
+    こうしておくと直近 n 点（n <= capacity）は常に連続した領域になるので、
+    window() はコピーなしのビューを返せる。
+    """
+
+    def __init__(self, node_ids, signals=SIGNALS, capacity=10000):
+        self.node_ids = list(node_ids)
+        self.signals = tuple(signals)
+        self.capacity = capacity
+
+        self._rows = {nid: i for i, nid in enumerate(self.node_ids)}
+        self._cols = {name: i for i, name in enumerate(self.signals)}
+
+        shape = (len(self.node_ids), len(self.signals), 2 * capacity)
+        self._data = np.zeros(shape, dtype=np.float64)
+
+        # 軸・信号ごとの書き込み済みサンプル数（通算）
+        self._count = np.zeros(shape[:2], dtype=np.int64)
+        self._all_rows = np.arange(len(self.node_ids))
+
+    def append(self, nid, signal, value):
+        """1軸・1信号に 1 サンプル追加する"""
+        row = self._rows[nid]
+        col = self._cols[signal]
+
+        count = self._count[row, col]
+        pos = count % self.capacity
+        self._data[row, col, pos] = value
+        self._data[row, col, pos + self.capacity] = value
+        self._count[row, col] = count + 1
+
+    def push(self, signal, values):
+        """全軸分の 1 サンプル（node_ids の順）をまとめて追加する"""
+        col = self._cols[signal]
+        rows = self._all_rows
+
+        pos = self._count[:, col] % self.capacity
+        self._data[rows, col, pos] = values
+        self._data[rows, col, pos + self.capacity] = values
+        self._count[:, col] += 1
+
+    def length(self, nid, signal):
+        """保持しているサンプル数（最大 capacity）"""
+        count = self._count[self._rows[nid], self._cols[signal]]
+        return int(min(count, self.capacity))
+
+    def total(self, nid, signal):
+        """これまでに追加された通算サンプル数"""
+        return int(self._count[self._rows[nid], self._cols[signal]])
+
+    def window(self, nid, signal, n=None):
+        """直近 n サンプルのビュー（コピーなし、古い順）"""
+        row = self._rows[nid]
+        col = self._cols[signal]
+
+        count = int(self._count[row, col])
+        size = self._size(count, n)
+
+        start = (count - size) % self.capacity
+        return self._data[row, col, start:start + size]
+
+    def indices(self, nid, signal, n=None):
+        """window() の各サンプルの通算番号（グラフの x 軸用）"""
+        count = self.total(nid, signal)
+        return np.arange(count - self._size(count, n), count)
+
+    def _size(self, count, n):
+        size = min(count, self.capacity)
+        if n is not None:
+            size = min(size, n)
+        return size
+
+    def clear(self):
+        self._count[:] = 0
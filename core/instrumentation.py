@@ -0,0 +1,110 @@
+import threading
+import time
+
+import numpy as np
+
+# CycleStats が最初から持っている項目（report() はこの順）
+STAGES = ("cycle", "sync", "rpdo", "on_sync", "pdo_rx", "pdo_latency", "redraw", "period", "jitter")
+
+
+class LatencyStats:
+    """直近 size 個の値を固定長のリングバッファに持ち、p50 / p99 / max を出す"""
+
+    def __init__(self, size=4096):
+        self._buf = np.zeros(size, dtype=np.float64)
+        self.count = 0          # 通算の記録数
+        self.max = 0.0          # 通算の最大値
+
+    def add(self, value):
+        self._buf[self.count % len(self._buf)] = value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def values(self):
+        return self._buf[:min(self.count, len(self._buf))]
+
+    def summary(self):
+        values = self.values()
+        if len(values) == 0:
+            return {"count": 0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+        p50, p99 = np.percentile(values, [50, 99])
+        return {"count": self.count, "p50": float(p50), "p99": float(p99), "max": self.max}
+
+    def clear(self):
+        self.count = 0
+        self.max = 0.0
+
+
+class CycleStats:
+    """1周期の各処理時間と SYNC 周期のずれを記録する
+
+    記録する項目（単位は秒）:
+      cycle   … 1周期の処理時間
+      sync    … SYNC 送信
+      rpdo    … RPDO 送信から全軸の OD への反映まで
+      on_sync … TPDO 送信（TpdoScheduler 1周期分）
+      pdo_rx  … 受信 PDO 1フレームのデコード
+      pdo_latency … PDO の送信から受信までの時間
+      redraw  … グラフ再描画
+      period  … SYNC 送信の間隔
+      jitter  … |period - 公称周期|（period=None なら測らない）
+
+    シミュレーション・受信・GUI のスレッドから記録され、GUI のスレッドで summary() を読む。
+    STAGES は最初から作っておき、それ以外の項目は dict を作り直して差し替える（読む側は止めない）。
+    """
+
+    def __init__(self, period, size=4096):
+        self.period = period    # 公称の SYNC 周期 [s]（None なら jitter は記録しない）
+        self.size = size
+        self.stages = {name: LatencyStats(size) for name in STAGES}
+        self._lock = threading.Lock()
+
+        # SYNC 送信時刻（perf_counter）の直近 size 周期分
+        self.sync_times = np.zeros(size, dtype=np.float64)
+        self.sync_count = 0
+
+    def stage(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self.stages.get(name)
+                if stats is None:
+                    stats = LatencyStats(self.size)
+                    self.stages = {**self.stages, name: stats}
+        return stats
+
+    def record(self, name, seconds):
+        self.stage(name).add(seconds)
+
+    def mark_sync(self, t=None):
+        """SYNC を送った時刻を記録し、前回との間隔とジッタを求める"""
+        if t is None:
+            t = time.perf_counter()
+
+        if self.sync_count:
+            last = self.sync_times[(self.sync_count - 1) % self.size]
+            interval = t - last
+            self.record("period", interval)
+            if self.period is not None:
+                self.record("jitter", abs(interval - self.period))
+
+        self.sync_times[self.sync_count % self.size] = t
+        self.sync_count += 1
+
+    def summary(self):
+        """記録のある項目の p50 / p99 / max"""
+        return {name: stats.summary() for name, stats in self.stages.items() if stats.count}
+
+    def report(self):
+        """p50 / p99 / max の一覧（µs）"""
+        lines = [f"{'stage':<12}{'count':>10}{'p50[us]':>12}{'p99[us]':>12}{'max[us]':>12}"]
+        for name, s in self.summary().items():
+            lines.append(f"{name:<12}{s['count']:>10}{s['p50'] * 1e6:>12.1f}"
+                         f"{s['p99'] * 1e6:>12.1f}{s['max'] * 1e6:>12.1f}")
+        return "\n".join(lines)
+
+    def clear(self):
+        for stats in self.stages.values():
+            stats.clear()
+        self.sync_count = 0
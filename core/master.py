@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import os
+import struct
+import time
+from binascii import crc_hqx
+
+import can
+from canopen.objectdictionary import ODVariable
+from canopen.sdo import SdoAbortedError, SdoCommunicationError
+from canopen.sdo.constants import (ABORT_CRC_ERROR, ABORT_INVALID_COMMAND_SPECIFIER,
+                                   ABORT_TIMED_OUT, ABORT_TOGGLE_NOT_ALTERNATED,
+                                   BLOCK_SIZE_SPECIFIED, BLOCK_TRANSFER_RESPONSE, CRC_SUPPORTED,
+                                   END_BLOCK_TRANSFER, EXPEDITED, INITIATE_BLOCK_TRANSFER,
+                                   NO_MORE_BLOCKS, NO_MORE_DATA, REQUEST_BLOCK_DOWNLOAD,
+                                   REQUEST_BLOCK_UPLOAD, REQUEST_DOWNLOAD, REQUEST_SEGMENT_DOWNLOAD,
+                                   REQUEST_SEGMENT_UPLOAD, REQUEST_UPLOAD, RESPONSE_ABORTED,
+                                   RESPONSE_BLOCK_DOWNLOAD, RESPONSE_BLOCK_UPLOAD, RESPONSE_DOWNLOAD,
+                                   RESPONSE_SEGMENT_DOWNLOAD, RESPONSE_SEGMENT_UPLOAD, RESPONSE_UPLOAD,
+                                   SDO_STRUCT, SIZE_SPECIFIED, START_BLOCK_UPLOAD, TOGGLE_BIT)
+
+from core.eds import DEFAULT_EDS, load_template
+from core.profile import CYCLIC_SYNC_POSITION
+from core.sdo import BLOCK_SIZE, PROGRAM_DATA
+
+SDO_TIMEOUT = 0.5       # 1応答あたりの待ち時間 [s]
+MAX_PENDING = 32        # 同時に流す転送の数（ノードをまたいだ合計）
+BLOCK_THRESHOLD = 64    # これより大きいダウンロードはブロック転送にする [byte]
+
+
+class AsyncMaster:
+    """asyncio で SDO を読み書きするマスタ
+
+    1ノードに同時に流す転送は1つだけ（ノードごとの asyncio.Lock）で、
+    別のノードへの転送は応答を待たずに並行して流す（同時に max_pending 個まで。
+    全ノードのブロック転送が一度に流れて応答がタイムアウトしないように）。
+    127 ノードの設定も、かかる時間はノード数の和ではなく一番遅いノードで決まる。
+    od を渡すと read() / write() で値の変換（ODVariable の encode / decode）をする。
+
+        async with AsyncMaster(channel="line1", od=template.build()) as master:
+            await master.configure({nid: [(0x6060, 0, 8)] for nid in node_ids})
+    """
+
+    def __init__(self, channel=None, interface="virtual", od=None, timeout=SDO_TIMEOUT,
+                 block_size=BLOCK_SIZE, max_pending=MAX_PENDING):
+        self.bus = can.interface.Bus(interface=interface, channel=channel)
+        self.od = od
+        self.timeout = timeout
+        self.block_size = block_size
+        self.max_pending = max_pending
+
+        self._loop = None
+        self._notifier = None
+        self._queues = {}       # node_id → 応答の asyncio.Queue
+        self._locks = {}        # node_id → asyncio.Lock（1ノード1転送）
+        self._pending = None    # 同時転送数の asyncio.Semaphore
+        self.transfers = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._pending = asyncio.Semaphore(self.max_pending)
+        self._notifier = can.Notifier(self.bus, [self._on_message])
+
+    def close(self):
+        if self._notifier is not None:
+            self._notifier.stop()
+            self._notifier = None
+        self.bus.shutdown()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def _on_message(self, msg):
+        # Notifier のスレッドから呼ばれる。SDO 応答（0x581..0x5FF）だけイベントループに渡す
+        node_id = msg.arbitration_id - 0x580
+        if msg.is_extended_id or not 1 <= node_id <= 127:
+            return
+        queue = self._queues.get(node_id)
+        if queue is not None:
+            self._loop.call_soon_threadsafe(queue.put_nowait, bytes(msg.data))
+
+    # --- 値での読み書き（od が必要） ---
+    async def read(self, node_id, index, subindex=0, block=False):
+        return self._variable(index, subindex).decode_raw(
+            await self.upload(node_id, index, subindex, block))
+
+    async def write(self, node_id, index, subindex, value, block=None):
+        await self.download(node_id, index, subindex,
+                            self._variable(index, subindex).encode_raw(value), block)
+
+    async def read_all(self, node_ids, index, subindex=0):
+        """全ノードから同じオブジェクトを並行に読む（{node_id: 値}）"""
+        node_ids = list(node_ids)
+        values = await asyncio.gather(*(self.read(nid, index, subindex) for nid in node_ids))
+        return dict(zip(node_ids, values))
+
+    async def write_all(self, node_ids, index, subindex, value):
+        """全ノードに同じ値を並行に書く"""
+        await asyncio.gather(*(self.write(nid, index, subindex, value) for nid in node_ids))
+
+    async def configure(self, plan):
+        """plan = {node_id: [(index, subindex, value), ...]} を書く
+
+        1ノードの中は順番どおり（マッピングの 0 → 設定 → 個数 など）、ノード同士は並行。
+        value が bytes ならそのまま、そうでなければ od で変換する。
+        """
+        async def configure_node(node_id, items):
+            for index, subindex, value in items:
+                if isinstance(value, (bytes, bytearray)):
+                    await self.download(node_id, index, subindex, bytes(value))
+                else:
+                    await self.write(node_id, index, subindex, value)
+
+        await asyncio.gather(*(configure_node(nid, items) for nid, items in plan.items()))
+
+    def _variable(self, index, subindex):
+        if self.od is None:
+            raise ValueError("an ObjectDictionary is needed to convert values (use upload/download)")
+        obj = self.od[index]
+        return obj if isinstance(obj, ODVariable) else obj[subindex]
+
+    # --- 生データの転送 ---
+    async def upload(self, node_id, index, subindex=0, block=False):
+        """オブジェクトを読む（expedited / segmented、block=True ならブロック転送）"""
+        async with self._session(node_id):
+            if block:
+                return await self._block_upload(node_id, index, subindex)
+
+            response = await self._request(node_id, SDO_STRUCT.pack(REQUEST_UPLOAD, index, subindex)
+                                           + bytes(4))
+            command = response[0]
+            self._expect(node_id, command & 0xE0 == RESPONSE_UPLOAD)
+            if command & EXPEDITED:
+                size = 4 - ((command >> 2) & 0x3) if command & SIZE_SPECIFIED else 4
+                return bytes(response[4:4 + size])
+
+            data = bytearray()
+            toggle = 0
+            while True:
+                response = await self._request(node_id, bytes([REQUEST_SEGMENT_UPLOAD | toggle]) + bytes(7))
+                command = response[0]
+                self._expect(node_id, command & 0xE0 == RESPONSE_SEGMENT_UPLOAD)
+                self._expect(node_id, command & TOGGLE_BIT == toggle, ABORT_TOGGLE_NOT_ALTERNATED)
+                data += response[1:8 - ((command >> 1) & 0x7)]
+                toggle ^= TOGGLE_BIT
+                if command & NO_MORE_DATA:
+                    return bytes(data)
+
+    async def download(self, node_id, index, subindex, data, block=None):
+        """オブジェクトに書く（4 byte 以下は expedited、BLOCK_THRESHOLD を超えたらブロック転送）"""
+        if block is None:
+            block = len(data) > BLOCK_THRESHOLD
+        async with self._session(node_id):
+            if block and data:
+                await self._block_download(node_id, index, subindex, data)
+                return
+
+            # 空のデータは expedited では表せない（n = 4 が予約ビットにはみ出す）ので segmented で送る
+            if 0 < len(data) <= 4:
+                command = REQUEST_DOWNLOAD | EXPEDITED | SIZE_SPECIFIED | ((4 - len(data)) << 2)
+                response = await self._request(node_id, SDO_STRUCT.pack(command, index, subindex)
+                                               + data.ljust(4, b"\0"))
+                self._expect(node_id, response[0] & 0xE0 == RESPONSE_DOWNLOAD)
+                return
+
+            response = await self._request(node_id, SDO_STRUCT.pack(REQUEST_DOWNLOAD | SIZE_SPECIFIED,
+                                                                    index, subindex)
+                                           + struct.pack("<L", len(data)))
+            self._expect(node_id, response[0] & 0xE0 == RESPONSE_DOWNLOAD)
+            toggle = 0
+            for pos in range(0, max(len(data), 1), 7):     # 空なら中身の無い最後のセグメントを1つ
+                chunk = data[pos:pos + 7]
+                command = (REQUEST_SEGMENT_DOWNLOAD | toggle | ((7 - len(chunk)) << 1)
+                           | (NO_MORE_DATA if pos + 7 >= len(data) else 0))
+                response = await self._request(node_id, bytes([command]) + chunk.ljust(7, b"\0"))
+                self._expect(node_id, response[0] & 0xE0 == RESPONSE_SEGMENT_DOWNLOAD)
+                self._expect(node_id, response[0] & TOGGLE_BIT == toggle, ABORT_TOGGLE_NOT_ALTERNATED)
+                toggle ^= TOGGLE_BIT
+
+    async def _block_download(self, node_id, index, subindex, data):
+        command = REQUEST_BLOCK_DOWNLOAD | CRC_SUPPORTED | BLOCK_SIZE_SPECIFIED | INITIATE_BLOCK_TRANSFER
+        response = await self._request(node_id, SDO_STRUCT.pack(command, index, subindex)
+                                       + struct.pack("<L", len(data)))
+        self._expect(node_id, response[0] & 0xE3 == RESPONSE_BLOCK_DOWNLOAD | INITIATE_BLOCK_TRANSFER)
+        crc = bool(response[0] & CRC_SUPPORTED)
+        blksize = response[4]
+
+        # サブブロックごとに blksize セグメント送って応答を待つ（届かなかった所から送り直す）
+        pos = 0
+        while pos < len(data):
+            for seqno in range(1, blksize + 1):
+                start = pos + (seqno - 1) * 7
+                last = start + 7 >= len(data)
+                self._send(node_id, bytes([seqno | (NO_MORE_BLOCKS if last else 0)])
+                           + data[start:start + 7].ljust(7, b"\0"))
+                if last:
+                    break
+            response = await self._response(node_id)
+            self._expect(node_id, response[0] == RESPONSE_BLOCK_DOWNLOAD | BLOCK_TRANSFER_RESPONSE)
+            pos += 7 * response[1]
+            blksize = response[2]
+
+        unused = (7 - len(data) % 7) % 7
+        response = await self._request(node_id, struct.pack(
+            "<BH5x", REQUEST_BLOCK_DOWNLOAD | (unused << 2) | END_BLOCK_TRANSFER,
+            crc_hqx(data, 0) if crc else 0))
+        self._expect(node_id, response[0] == RESPONSE_BLOCK_DOWNLOAD | END_BLOCK_TRANSFER)
+
+    async def _block_upload(self, node_id, index, subindex):
+        blksize = self.block_size
+        command = REQUEST_BLOCK_UPLOAD | CRC_SUPPORTED | INITIATE_BLOCK_TRANSFER
+        response = await self._request(node_id, SDO_STRUCT.pack(command, index, subindex)
+                                       + bytes([blksize, 0, 0, 0]))
+        # 開始応答の ss は bit 0 だけ（bit 1 はサイズ指定）
+        self._expect(node_id, response[0] & 0xE1 == RESPONSE_BLOCK_UPLOAD | INITIATE_BLOCK_TRANSFER)
+        crc = bool(response[0] & CRC_SUPPORTED)
+        self._send(node_id, bytes([REQUEST_BLOCK_UPLOAD | START_BLOCK_UPLOAD]) + bytes(7))
+
+        data = bytearray()
+        done = False
+        while not done:
+            # 1サブブロック受けて、順番どおり受け取れた所までを返す
+            expected = 1
+            while True:
+                segment = await self._response(node_id)
+                seqno = segment[0] & 0x7F
+                if seqno == expected:
+                    data += segment[1:8]
+                    expected += 1
+                if segment[0] & NO_MORE_BLOCKS:
+                    done = seqno == expected - 1
+                    break
+                if seqno == blksize:
+                    break
+            self._send(node_id, bytes([REQUEST_BLOCK_UPLOAD | BLOCK_TRANSFER_RESPONSE,
+                                       expected - 1, blksize]) + bytes(5))
+
+        response = await self._response(node_id)
+        self._expect(node_id, response[0] & 0xE3 == RESPONSE_BLOCK_UPLOAD | END_BLOCK_TRANSFER)
+        unused = (response[0] >> 2) & 0x7
+        if unused:
+            del data[-unused:]
+        if crc and struct.unpack_from("<H", response, 1)[0] != crc_hqx(bytes(data), 0):
+            self._abort(node_id, ABORT_CRC_ERROR)
+            raise SdoCommunicationError("CRC mismatch in block upload")
+        self._send(node_id, bytes([REQUEST_BLOCK_UPLOAD | END_BLOCK_TRANSFER]) + bytes(7))
+        return bytes(data)
+
+    # --- 要求・応答 ---
+    def _session(self, node_id):
+        lock = self._locks.get(node_id)
+        if lock is None:
+            lock = self._locks[node_id] = asyncio.Lock()
+            self._queues[node_id] = asyncio.Queue()
+        return _Session(self, node_id, lock)
+
+    def _send(self, node_id, data):
+        self.bus.send(can.Message(arbitration_id=0x600 + node_id, data=data, is_extended_id=False))
+
+    async def _request(self, node_id, data):
+        self._send(node_id, data)
+        return await self._response(node_id)
+
+    async def _response(self, node_id):
+        try:
+            data = await asyncio.wait_for(self._queues[node_id].get(), self.timeout)
+        except asyncio.TimeoutError:
+            self._abort(node_id, ABORT_TIMED_OUT)
+            raise SdoCommunicationError(f"node {node_id}: no SDO response received") from None
+        if data[0] == RESPONSE_ABORTED:
+            raise SdoAbortedError(struct.unpack_from("<L", data, 4)[0])
+        return data
+
+    def _expect(self, node_id, ok, code=ABORT_INVALID_COMMAND_SPECIFIER):
+        if not ok:
+            self._abort(node_id, code)
+            raise SdoCommunicationError(f"node {node_id}: unexpected SDO response")
+
+    def _abort(self, node_id, code):
+        self._send(node_id, struct.pack("<BHBL", RESPONSE_ABORTED, 0, 0, code))
+
+
+class _Session:
+    """1ノード1転送のロックと同時転送数の枠（入るときに前の転送の残りの応答を捨てる）"""
+
+    def __init__(self, master, node_id, lock):
+        self.master = master
+        self.node_id = node_id
+        self.lock = lock
+
+    async def __aenter__(self):
+        await self.lock.acquire()
+        try:
+            await self.master._pending.acquire()
+        except BaseException:
+            # 枠を待っている間にキャンセルされたらノードのロックを返す
+            self.lock.release()
+            raise
+        queue = self.master._queues[self.node_id]
+        while not queue.empty():
+            queue.get_nowait()
+
+    async def __aexit__(self, *exc):
+        self.master.transfers += 1
+        self.master._pending.release()
+        self.lock.release()
+
+
+def commissioning_plan(node_ids, op_mode=CYCLIC_SYNC_POSITION, program=None):
+    """よくある立ち上げ設定（TPDO1 の設定とマッピング・運転モード・0x1F50 へのプログラム）"""
+    plan = {}
+    for nid in node_ids:
+        items = [
+            (0x1800, 2, 1),             # TPDO1: SYNC ごと
+            (0x1A00, 0, 0),             # マッピングは 0 にしてから書き換える
+            (0x1A00, 1, 0x60640020),
+            (0x1A00, 0, 1),
+            (0x6060, 0, op_mode),
+            (0x607A, 0, 0),
+        ]
+        if program is not None:
+            items.append((PROGRAM_DATA, 1, program))
+        plan[nid] = items
+    return plan
+
+
+async def _commission(channel, node_ids, program, sequential):
+    async with AsyncMaster(channel, od=load_template(DEFAULT_EDS).build()) as master:
+        plan = commissioning_plan(node_ids, program=program)
+        start = time.perf_counter()
+        if sequential:
+            for nid, items in plan.items():
+                await master.configure({nid: items})
+        else:
+            await master.configure(plan)
+        elapsed = time.perf_counter() - start
+        transfers = master.transfers
+
+        # ブロック転送で読み戻して確認する
+        if program is not None:
+            programs = await asyncio.gather(*(master.upload(nid, PROGRAM_DATA, 1, block=True)
+                                              for nid in node_ids))
+            for nid, data in zip(node_ids, programs):
+                if data != program:
+                    raise RuntimeError(f"node {nid}: program data mismatch")
+        modes = await master.read_all(node_ids, 0x6060)
+        return elapsed, transfers, set(modes.values())
+
+
+def main(argv=None):
+    from core.simulator import Simulator
+
+    parser = argparse.ArgumentParser(description="Commission simulated drives with a concurrent SDO master")
+    parser.add_argument("--axes", type=int, default=127, help="number of drives (1..127)")
+    parser.add_argument("--channel", default="sdo-master", help="python-can virtual channel")
+    parser.add_argument("--program", type=int, default=1024,
+                        help="bytes block-downloaded to 0x1F50:01 per node (0 = none)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="also time the same plan one node after another")
+    args = parser.parse_args(argv)
+
+    program = os.urandom(args.program) if args.program else None
+    node_ids = range(1, args.axes + 1)
+    with Simulator(args.axes, channel=args.channel) as sim:
+        runs = [("concurrent", False)] + ([("sequential", True)] if args.sequential else [])
+        for name, sequential in runs:
+            elapsed, transfers, modes = asyncio.run(
+                _commission(args.channel, node_ids, program, sequential))
+            print(f"{name}: {args.axes} nodes, {transfers} transfers in {elapsed:.3f} s "
+                  f"(0x6060 = {sorted(modes)})")
+        print(f"drive modes in the simulator: {sorted(set(sim.store.column(0x6060).tolist()))}")
+
+
+if __name__ == "__main__":
+    main()
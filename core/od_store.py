@@ -0,0 +1,80 @@
+import numpy as np
+from canopen.objectdictionary import ODVariable
+
+from core.pdo import CIA402_DATA_TYPES
+
+# 配列に置くプロセスデータ（列の順番）
+PROCESS_OBJECTS = {
+    0x6040: "Controlword",
+    0x6041: "Statusword",
+    0x6060: "Modes of Operation",
+    0x6061: "Modes of Operation Display",
+    0x6064: "Position Actual Value",
+    0x606C: "Velocity Actual Value",
+    0x6077: "Torque Actual Value",
+    0x607A: "Target Position",
+    0x60FF: "Target Velocity",
+}
+
+
+class OdStore:
+    """全ノードのプロセスデータを (node 行, object 列) の int64 配列にまとめて持つ"""
+
+    def __init__(self, n_nodes, objects=PROCESS_OBJECTS, values=None):
+        self.objects = tuple(objects)
+        self.columns = {index: col for col, index in enumerate(self.objects)}
+        if values is None:
+            values = np.zeros((n_nodes, len(self.objects)), dtype=np.int64)
+        elif values.shape != (n_nodes, len(self.objects)) or values.dtype != np.int64:
+            raise ValueError(f"values must be int64 of shape {(n_nodes, len(self.objects))}")
+        self.values = values    # 共有メモリ上の配列なども渡せる
+
+    def column(self, index):
+        """1オブジェクト分（全ノード）のビュー"""
+        return self.values[:, self.columns[index]]
+
+    def attach(self, od, row):
+        """od のプロセスデータを StoreVariable に置き換え、値を row 行に置く"""
+        for index, col in self.columns.items():
+            old = od[index] if index in od else None
+            name = old.name if old is not None else PROCESS_OBJECTS.get(index, "")
+            var = StoreVariable(self, row, col, name, index)
+
+            if old is not None:
+                var.data_type = old.data_type
+                var.access_type = old.access_type
+                var.default = old.default
+                var.pdo_mappable = old.pdo_mappable
+                initial = old.value if old.value is not None else old.default
+            else:
+                var.data_type = CIA402_DATA_TYPES.get(index)
+                initial = None
+
+            if initial is not None:
+                self.values[row, col] = initial
+            od[index] = var
+
+
+class StoreVariable(ODVariable):
+    """値が OdStore の配列の1要素になっている OD 変数
+
+    .value / .raw どちらで読み書きしても配列を直接読み書きする。
+    """
+
+    def __init__(self, store, row, col, name, index, subindex=0):
+        self.store = store
+        self.row = row
+        self.col = col
+        super().__init__(name, index, subindex)
+
+    @property
+    def value(self):
+        return int(self.store.values[self.row, self.col])
+
+    @value.setter
+    def value(self, value):
+        # ODVariable.__init__ の value = None は無視する
+        if value is not None:
+            self.store.values[self.row, self.col] = value
+
+    raw = value
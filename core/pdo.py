@@ -0,0 +1,207 @@
+import struct
+
+import can
+import numpy as np
+
+# CANopen データ型 → struct フォーマット（リトルエンディアン）
+DATA_TYPE_FORMATS = {
+    0x0001: "?",    # BOOLEAN
+    0x0002: "b",    # INTEGER8
+    0x0003: "h",    # INTEGER16
+    0x0004: "i",    # INTEGER32
+    0x0005: "B",    # UNSIGNED8
+    0x0006: "H",    # UNSIGNED16
+    0x0007: "I",    # UNSIGNED32
+    0x0008: "f",    # REAL32
+    0x0011: "d",    # REAL64
+    0x0015: "q",    # INTEGER64
+    0x001B: "Q",    # UNSIGNED64
+}
+
+# マッピングを SDO で書き換えたときの abort コード
+ABORT_CANNOT_MAP = 0x06040041   # マッピングできないオブジェクト
+ABORT_PDO_LENGTH = 0x06040042   # マッピングが PDO の長さ（8 byte）を超える
+
+# CiA 402 で決まっているデータ型（OD 側に data_type が無いとき用）
+CIA402_DATA_TYPES = {
+    0x6040: 0x0006,  # Controlword
+    0x6041: 0x0006,  # Statusword
+    0x6060: 0x0002,  # Modes of Operation
+    0x6061: 0x0002,  # Modes of Operation Display
+    0x6064: 0x0004,  # Position Actual Value
+    0x606C: 0x0004,  # Velocity Actual Value
+    0x6077: 0x0003,  # Torque Actual Value
+    0x607A: 0x0004,  # Target Position
+    0x60FF: 0x0004,  # Target Velocity
+}
+
+PDO_MAX_BYTES = 8
+
+
+def tpdo_cob_id(node_id, pdo_num):
+    """TPDO1〜4 の既定 COB-ID（0x180 / 0x280 / 0x380 / 0x480 + node）"""
+    return 0x180 + (pdo_num - 1) * 0x100 + node_id
+
+
+def rpdo_cob_id(node_id, pdo_num):
+    """RPDO1〜4 の既定 COB-ID（0x200 / 0x300 / 0x400 / 0x500 + node）"""
+    return 0x200 + (pdo_num - 1) * 0x100 + node_id
+
+
+def data_type_of(od, index):
+    var = od[index] if index in od else None
+    if var is not None and getattr(var, "data_type", None) is not None:
+        return var.data_type
+    if index in CIA402_DATA_TYPES:
+        return CIA402_DATA_TYPES[index]
+    raise ValueError(f"unknown data type for object 0x{index:04X}")
+
+
+class PdoLayout:
+    """1つの PDO マッピングをコンパイルしたもの
+
+    struct.Struct とバッファ・can.Message を持っておき、pack() は
+    同じバッファに値を詰め直して同じ Message を返す（定常状態で確保なし）。
+    dtype は同じ並びの NumPy 構造化 dtype（複数フレームをまとめて詰める / 解くとき用）。
+    """
+
+    def __init__(self, cob_id, indices, data_types):
+        self.cob_id = cob_id
+        self.indices = tuple(indices)
+        self.data_types = tuple(data_types)
+
+        fmt = "<" + "".join(DATA_TYPE_FORMATS[dt] for dt in self.data_types)
+        self.struct = struct.Struct(fmt)
+        if self.struct.size > PDO_MAX_BYTES:
+            raise ValueError(
+                f"PDO 0x{cob_id:03X} mapping is {self.struct.size} bytes "
+                f"(max {PDO_MAX_BYTES})")
+
+        self.dtype = np.dtype([(f"f{i}", "<" + DATA_TYPE_FORMATS[dt])
+                               for i, dt in enumerate(self.data_types)])
+
+        self.buffer = bytearray(self.struct.size)
+        self.message = can.Message(arbitration_id=cob_id, data=self.buffer, is_extended_id=False)
+
+        # pack_od() 用に OD の Variable を覚えておく
+        self.variables = ()
+
+        # 全部が同じ OdStore の同じ行なら、その行のビューと列番号から直接詰める
+        self.row_values = None
+        self.columns = None
+
+    @classmethod
+    def compile(cls, od, cob_id, indices):
+        """OD のデータ型から PDO のレイアウトを作る"""
+        missing = [index for index in indices if index not in od]
+        if missing:
+            raise ValueError("object not in dictionary: " +
+                             ", ".join(f"0x{index:04X}" for index in missing))
+
+        layout = cls(cob_id, indices, [data_type_of(od, index) for index in indices])
+        layout.variables = tuple(od[index] for index in indices)
+
+        rows = {(id(getattr(var, "store", None)), getattr(var, "row", None))
+                for var in layout.variables}
+        first = layout.variables[0] if layout.variables else None
+        if len(rows) == 1 and getattr(first, "store", None) is not None:
+            layout.row_values = first.store.values[first.row]
+            layout.columns = np.array([var.col for var in layout.variables])
+        return layout
+
+    def pack(self, values):
+        self.struct.pack_into(self.buffer, 0, *values)
+        return self.message
+
+    def pack_od(self):
+        """コンパイル時の OD の現在値を詰める"""
+        if self.row_values is not None:
+            self.struct.pack_into(self.buffer, 0, *self.row_values[self.columns].tolist())
+        else:
+            self.struct.pack_into(self.buffer, 0, *[int(var.value) for var in self.variables])
+        return self.message
+
+    def unpack(self, data):
+        return self.struct.unpack_from(data)
+
+
+def compile_tpdo_map(od, node_id, tpdo_map, cob_ids=None):
+    """{pdo_num: [index, ...]} を PdoLayout のリストにする（空のマッピングは除く）
+
+    cob_ids（{pdo_num: COB-ID}、read_tpdo_cob_ids() の結果など）に無い TPDO 番号は既定の COB-ID。
+    """
+    cob_ids = cob_ids or {}
+    return [PdoLayout.compile(od, cob_ids.get(pdo_num, tpdo_cob_id(node_id, pdo_num)), od_list)
+            for pdo_num, od_list in sorted(tpdo_map.items()) if od_list]
+
+
+def read_tpdo_cob_ids(od, value=None):
+    """OD の 0x1800〜0x1803 sub1 から {pdo_num: COB-ID} を作る
+
+    11 bit の COB-ID だけを取り出す（bit 31 の無効ビットを見て送らないのは TpdoScheduler）。
+    0x1800〜0x1803 sub1 が無い TPDO 番号は入れない。
+    value(index, subindex) を渡すと OD の値の代わりにそれを使う（SDO で書かれた値など）。
+    """
+    if value is None:
+        value = lambda index, subindex: _od_value(od[index][subindex])
+    cob_ids = {}
+    for pdo_num in range(1, 5):
+        index = 0x1800 + pdo_num - 1
+        if index not in od or 1 not in od[index]:
+            continue
+        cob_id = value(index, 1)
+        if cob_id is not None:
+            cob_ids[pdo_num] = int(cob_id) & 0x7FF
+    return cob_ids
+
+
+def read_tpdo_map(od, value=None):
+    """OD の 0x1A00〜0x1A03（TPDO マッピング）から {pdo_num: [index, ...]} を作る
+
+    EDS を canopen.import_od() で読んだ OD を想定。マッピング値は
+    0xIIIISSLL（index / subindex / bit 長）。subindex 0 の変数のみ対応。
+    value(index, subindex) を渡すと OD の値の代わりにそれを使う（SDO で書かれた値など）。
+    """
+    return _read_pdo_map(od, 0x1A00, value)
+
+
+def read_rpdo_map(od, value=None):
+    """OD の 0x1600〜0x1603（RPDO マッピング）から {pdo_num: [index, ...]} を作る
+
+    value(index, subindex) を渡すと OD の値の代わりにそれを使う（SDO で書かれた値など）。
+    """
+    return _read_pdo_map(od, 0x1600, value)
+
+
+def _read_pdo_map(od, base, value=None):
+    if value is None:
+        value = lambda index, subindex: _od_value(od[index][subindex])
+    pdo_map = {}
+    for pdo_num in range(1, 5):
+        map_index = base + pdo_num - 1
+        if map_index not in od:
+            continue
+
+        count = value(map_index, 0)
+        od_list = []
+        for sub in range(1, count + 1):
+            entry = value(map_index, sub)
+            if entry is None:
+                raise ValueError(f"0x{map_index:04X} has no subindex {sub}")
+            index = entry >> 16
+            subindex = (entry >> 8) & 0xFF
+            bits = entry & 0xFF
+            if subindex != 0:
+                raise ValueError(f"mapping 0x{entry:08X}: only subindex 0 is supported")
+            expected = struct.calcsize(DATA_TYPE_FORMATS[data_type_of(od, index)]) * 8
+            if bits != expected:
+                raise ValueError(f"mapping 0x{entry:08X}: {bits} bits, object is {expected} bits")
+            od_list.append(index)
+
+        pdo_map[pdo_num] = od_list
+
+    return pdo_map
+
+
+def _od_value(var):
+    return var.value if var.value is not None else var.default
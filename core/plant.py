@@ -0,0 +1,127 @@
+import numpy as np
+
+# --- 積分法 ---
+EULER = "euler"
+SEMI_IMPLICIT = "semi-implicit"
+RK4 = "rk4"
+INTEGRATORS = (EULER, SEMI_IMPLICIT, RK4)
+
+_NS = 1_000_000_000
+
+
+class PlantModel:
+    """N 軸分のモーター + 負荷の物理モデル（固定 dt で積分する）
+
+    状態はモーター軸の角度 θ [rad] と角速度 ω [rad/s]。
+    ドライブの速度ループ τ = Kv (ω_cmd - ω) をトルク制限で切り、
+    J dω/dt = τ - b ω - τc sat(ω / ω_band) を dt ごとに積分する。
+    SYNC 周期と dt が割り切れなくても余りを次の周期に持ち越すので、時間はずれない。
+    時間は整数の ns で数え、演算の順番も固定なのでどのマシンでも同じ結果になる。
+
+    外とのやりとりはカウント（負荷側）と周期の単位:
+    速度指令 [counts/周期] → 実位置 [counts]・実速度 [counts/周期]・トルク [‰ of torque_limit]。
+    """
+
+    def __init__(self, n_axes, period, dt=0.001, integrator=SEMI_IMPLICIT,
+                 inertia=1e-4, viscous=1e-4, coulomb=0.005, friction_band=0.1,
+                 torque_limit=1.0, velocity_gain=0.01, gear_ratio=10.0, counts_per_rev=10000,
+                 standstill=0.5):
+        if integrator not in INTEGRATORS:
+            raise ValueError(f"integrator must be one of {INTEGRATORS}, got {integrator!r}")
+
+        self.integrator = integrator
+        self.period_ns = round(period * _NS)
+        self.dt_ns = round(dt * _NS)
+        self.dt = self.dt_ns / _NS
+        self.standstill = standstill    # これより遅ければ停止とみなす [counts/周期]
+
+        # --- 軸ごとのパラメータ（モーター軸換算） ---
+        self.inertia = np.full(n_axes, inertia, dtype=np.float64)           # J [kg·m²]
+        self.viscous = np.full(n_axes, viscous, dtype=np.float64)           # b [N·m·s/rad]
+        self.coulomb = np.full(n_axes, coulomb, dtype=np.float64)           # τc [N·m]
+        self.friction_band = np.full(n_axes, friction_band, dtype=np.float64)  # ω_band [rad/s]
+        self.torque_limit = np.full(n_axes, torque_limit, dtype=np.float64)  # [N·m]
+        self.velocity_gain = np.full(n_axes, velocity_gain, dtype=np.float64)  # Kv [N·m·s/rad]
+        self.gear_ratio = np.full(n_axes, gear_ratio, dtype=np.float64)     # モーター回転 / 負荷回転
+        self.counts_per_rev = np.full(n_axes, counts_per_rev, dtype=np.float64)  # 負荷1回転のカウント
+
+        # --- 状態 ---
+        self.angle = np.zeros(n_axes, dtype=np.float64)       # θ [rad]
+        self.speed = np.zeros(n_axes, dtype=np.float64)       # ω [rad/s]
+        self.torque = np.zeros(n_axes, dtype=np.float64)      # τ [N·m]（最後の dt の指令）
+        self._carry_ns = np.zeros(n_axes, dtype=np.int64)     # 前の周期から持ち越した時間
+
+    def counts_per_rad(self, rows=slice(None)):
+        """モーター角 [rad] → 負荷側カウント の係数"""
+        return self.counts_per_rev[rows] / (2 * np.pi * self.gear_ratio[rows])
+
+    def step(self, rows, velocity_command):
+        """1 SYNC 周期分積分して (実位置 [counts], 実速度 [counts/周期]) を返す"""
+        scale = self.counts_per_rad(rows)
+        period = self.period_ns / _NS
+        speed_command = velocity_command / (scale * period)
+
+        # この周期に回す dt の数（余りは持ち越す）
+        carry = self._carry_ns[rows] + self.period_ns
+        n = carry // self.dt_ns
+        self._carry_ns[rows] = carry - n * self.dt_ns
+
+        angle, speed = self.angle[rows], self.speed[rows]
+        params = (self.inertia[rows], self.viscous[rows], self.coulomb[rows],
+                  self.friction_band[rows])
+        gain, limit = self.velocity_gain[rows], self.torque_limit[rows]
+        torque = self.torque[rows]
+
+        n_max = int(n.max()) if len(n) else 0
+        uniform = n_max == int(n.min()) if len(n) else True
+        for k in range(n_max):
+            # 速度ループ（dt の間はトルク一定）
+            tau = np.clip(gain * (speed_command - speed), -limit, limit)
+            new_angle, new_speed = self._integrate(angle, speed, tau, params)
+            if uniform:
+                angle, speed, torque = new_angle, new_speed, tau
+            else:
+                active = k < n
+                angle = np.where(active, new_angle, angle)
+                speed = np.where(active, new_speed, speed)
+                torque = np.where(active, tau, torque)
+
+        self.angle[rows], self.speed[rows], self.torque[rows] = angle, speed, torque
+        return angle * scale, speed * scale * period
+
+    def torque_permille(self, rows=slice(None)):
+        """トルク実値（0x6077 の単位: torque_limit の ‰）"""
+        return self.torque[rows] / self.torque_limit[rows] * 1000
+
+    def reset(self, rows=slice(None)):
+        self.angle[rows] = 0
+        self.speed[rows] = 0
+        self.torque[rows] = 0
+        self._carry_ns[rows] = 0
+
+    def _integrate(self, angle, speed, tau, params):
+        dt = self.dt
+        if self.integrator == EULER:
+            return angle + speed * dt, speed + _acceleration(speed, tau, *params) * dt
+
+        if self.integrator == SEMI_IMPLICIT:
+            speed = speed + _acceleration(speed, tau, *params) * dt
+            return angle + speed * dt, speed
+
+        # RK4（角度の微分は速度、速度の微分は加速度）
+        k1 = _acceleration(speed, tau, *params)
+        s2 = speed + k1 * (dt / 2)
+        k2 = _acceleration(s2, tau, *params)
+        s3 = speed + k2 * (dt / 2)
+        k3 = _acceleration(s3, tau, *params)
+        s4 = speed + k3 * dt
+        k4 = _acceleration(s4, tau, *params)
+        angle = angle + (speed + 2 * s2 + 2 * s3 + s4) * (dt / 6)
+        speed = speed + (k1 + 2 * k2 + 2 * k3 + k4) * (dt / 6)
+        return angle, speed
+
+
+def _acceleration(speed, tau, inertia, viscous, coulomb, friction_band):
+    """dω/dt（クーロン摩擦は ±ω_band の間で直線にして 0 付近で振動しないようにする）"""
+    friction = viscous * speed + coulomb * np.clip(speed / friction_band, -1, 1)
+    return (tau - friction) / inertia
@@ -0,0 +1,84 @@
+import math
+
+import numpy as np
+
+
+class BlitPlotter:
+    """HistoryBuffer の直近 window サンプルを blitting で描くライブプロット
+
+    背景（軸・目盛・凡例・グリッド）は draw_event のたびに1回だけキャッシュし、
+    refresh() では背景を戻してライン artist だけを描き直す。
+    x 軸は固定幅のスライド窓（0〜window、右端が最新）なので軸の再描画は不要。
+    点数は描画幅のピクセル数まで間引く。
+    """
+
+    def __init__(self, canvas, ax, history, node_ids, signal="position",
+                 window=1000, colors=None, ylim=(-1500, 1500)):
+        self.canvas = canvas
+        self.ax = ax
+        self.history = history
+        self.signal = signal
+        self.window = window
+
+        colors = colors or {}
+        self.lines = {}
+        for nid in node_ids:
+            line, = ax.plot([], [], color=colors.get(nid), label=f"Axis {nid}", animated=True)
+            self.lines[nid] = line
+
+        # 背景側は最初に1回だけ設定する
+        ax.set_xlim(0, window)
+        ax.set_ylim(*ylim)
+        ax.legend(loc="upper right")
+        ax.grid(True)
+
+        self._x = np.arange(window, dtype=np.float64)
+        self._background = None
+        canvas.mpl_connect("draw_event", self._on_draw)
+
+    def _on_draw(self, event):
+        # 全体再描画（初回・リサイズ・スケール変更）のあとに背景を取り直す
+        self._background = self.canvas.copy_from_bbox(self.ax.figure.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for line in self.lines.values():
+            self.ax.draw_artist(line)
+
+    def refresh(self):
+        """ライン artist だけを描き直す（表示タイマーから呼ぶ）"""
+        if self._background is None:
+            self.canvas.draw()
+            return
+
+        width = max(1, int(self.ax.bbox.width))
+        lo, hi = self.ax.get_ylim()
+        ymin, ymax = lo, hi
+
+        for nid, line in self.lines.items():
+            y = self.history.window(nid, self.signal, self.window)
+            n = len(y)
+            if n == 0:
+                line.set_data([], [])
+                continue
+
+            # 描画幅まで間引く（最新のサンプルは必ず残す）
+            stride = max(1, math.ceil(n / width))
+            start = (n - 1) % stride
+            y = y[start::stride]
+            x = self._x[self.window - n + start::stride]
+            line.set_data(x, y)
+
+            ymin = min(ymin, y.min())
+            ymax = max(ymax, y.max())
+
+        # 表示範囲を超えたときだけ y 軸を広げて全体を描き直す
+        if ymin < lo or ymax > hi:
+            margin = 0.1 * (ymax - ymin)
+            self.ax.set_ylim(ymin - margin, ymax + margin)
+            self.canvas.draw_idle()
+            return
+
+        self.canvas.restore_region(self._background)
+        self._draw_lines()
+        self.canvas.blit(self.ax.figure.bbox)
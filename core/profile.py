@@ -0,0 +1,184 @@
+import numpy as np
+
+# --- Modes of Operation（0x6060） ---
+PROFILE_POSITION = 1
+PROFILE_VELOCITY = 3
+CYCLIC_SYNC_POSITION = 8
+CYCLIC_SYNC_VELOCITY = 9
+
+MODE_NAMES = {
+    PROFILE_POSITION: "pp",
+    PROFILE_VELOCITY: "pv",
+    CYCLIC_SYNC_POSITION: "csp",
+    CYCLIC_SYNC_VELOCITY: "csv",
+}
+
+# --- Motion Profile Type（0x6086） ---
+TRAPEZOID = 0       # 直線ランプ（台形速度）
+S_CURVE = 3         # ジャーク制限（S字）
+
+# 区間の並び: 停止 ×3, 加速 ×3, 定速, 減速 ×3, 保持（最後は終わりなし）
+N_SEGMENTS = 11
+_STOP, _ACCEL, _CRUISE, _DECEL, _HOLD = 0, 3, 6, 7, 10
+
+_GRID = 32      # S字の到達速度を探す格子の分割数
+
+
+def ramp_times(dv, amax, jerk):
+    """速度を dv（>= 0）変えるときの (Tj, Ta, alim)
+
+    Tj はジャーク区間の長さ、Ta はランプ全体の長さ、alim は実際の最大加速度。
+    jerk = inf なら台形（Tj = 0）になる。
+    """
+    with np.errstate(invalid="ignore"):     # jerk = inf の inf * 0 は使わない側
+        full = dv >= amax * amax / jerk     # 最大加速度まで届く
+        tj = np.where(full, amax / jerk, np.sqrt(dv / jerk))
+        ta = np.where(full, tj + dv / amax, 2 * tj)
+        alim = np.where(full, amax, jerk * tj)
+    return tj, ta, alim
+
+
+def _ramp_distance(v_start, v_end, amax, jerk):
+    _, ta, _ = ramp_times(np.abs(v_end - v_start), amax, jerk)
+    return (v_start + v_end) / 2 * ta
+
+
+def _put_ramp(T, A, J, k, dv, sign, amax, jerk):
+    """k 列目から3区間に速度を sign 方向へ dv 変えるランプを書き、ランプの長さを返す"""
+    tj, ta, alim = ramp_times(dv, amax, jerk)
+    T[:, k], T[:, k + 1], T[:, k + 2] = tj, ta - 2 * tj, tj
+    A[:, k], A[:, k + 1], A[:, k + 2] = 0, sign * alim, sign * alim
+    with np.errstate(invalid="ignore"):     # 0 * inf は長さ 0 の区間なので _store で消す
+        J[:, k], J[:, k + 1], J[:, k + 2] = sign * jerk, 0, -sign * jerk
+    return ta
+
+
+def _peak_velocity(u0, vhi, length, acc, dec, jerk):
+    """u0 から加速してすぐ減速し、ちょうど length で止まる到達速度
+
+    台形は閉じた式。S字は距離が速度の単調増加関数なので、格子で4回絞り込む。
+    """
+    vpeak = np.sqrt((length + u0 * u0 / (2 * acc)) / (1 / (2 * acc) + 1 / (2 * dec)))
+
+    s_curve = np.isfinite(jerk)
+    if s_curve.any():
+        u, l = u0[s_curve, None], length[s_curve, None]
+        a, d, j = acc[s_curve, None], dec[s_curve, None], jerk[s_curve, None]
+        lo, width = u0[s_curve], vhi[s_curve] - u0[s_curve]
+        grid = np.arange(_GRID + 1) / _GRID
+        for _ in range(4):
+            v = lo[:, None] + width[:, None] * grid
+            short = _ramp_distance(u, v, a, j) + _ramp_distance(v, 0, d, j) <= l
+            width = width / _GRID
+            lo = lo + (short.sum(axis=1) - 1) * width
+        vpeak[s_curve] = lo
+
+    return np.clip(vpeak, u0, vhi)
+
+
+class MotionProfile:
+    """N 軸分の動作プロファイルを区間ごとの閉じた式で持つ
+
+    1軸は N_SEGMENTS 個の区間（開始時刻, 位置, 速度, 加速度, ジャーク）で表す。
+    計画は新しい目標が来たときだけ行い、各周期は evaluate() で区間を1つ選んで
+    3次式を計算するだけなので、移動が長くても1サンプル O(1)。時間の単位は周期。
+    """
+
+    def __init__(self, n_axes):
+        shape = (n_axes, N_SEGMENTS)
+        self.t0 = np.zeros(shape)
+        self.p = np.zeros(shape)
+        self.v = np.zeros(shape)
+        self.a = np.zeros(shape)
+        self.j = np.zeros(shape)
+
+    def plan_position(self, idx, t, p0, v0, target, vmax, acc, dec, jerk):
+        """idx の軸を (p0, v0) から target で止まるように計画する（Profile Position）
+
+        逆向きに動いている / 止まりきれないときは一度止まってから動き直す。
+        今の速度が vmax より速いときはその速度を上限にする。
+        """
+        T, A, J = self._empty(len(idx))
+
+        # ① 止まる必要があれば先に止まる
+        distance = target - p0
+        direction = np.where(distance < 0, -1.0, 1.0)
+        u0 = v0 * direction                 # 進む向きの速度
+        need_stop = (u0 < 0) | (_ramp_distance(np.maximum(u0, 0), 0, dec, jerk) > np.abs(distance))
+        stop_dv = np.where(need_stop, np.abs(v0), 0)
+        stop_time = _put_ramp(T, A, J, _STOP, stop_dv, -np.sign(v0), dec, jerk)
+
+        p_start = np.where(need_stop, p0 + v0 / 2 * stop_time, p0)
+        distance = target - p_start
+        direction = np.where(distance < 0, -1.0, 1.0)
+        u0 = np.where(need_stop, 0, u0)
+        length = np.abs(distance)
+
+        # ② 到達速度を決める（届かなければ三角 / S字の頂点まで下げる）
+        vhi = np.maximum(vmax, u0)
+        covered = _ramp_distance(u0, vhi, acc, jerk) + _ramp_distance(vhi, 0, dec, jerk)
+        reach = covered <= length
+        vpeak = np.where(reach, vhi, _peak_velocity(u0, vhi, length, acc, dec, jerk))
+        cruise = np.where(reach & (vpeak > 0), (length - covered) / np.where(vpeak > 0, vpeak, 1), 0)
+
+        # ③ 加速 → 定速 → 減速
+        _put_ramp(T, A, J, _ACCEL, vpeak - u0, direction, acc, jerk)
+        T[:, _CRUISE] = cruise
+        _put_ramp(T, A, J, _DECEL, vpeak, -direction, dec, jerk)
+
+        self._store(idx, t, p0, v0, T, A, J)
+        self.p[idx, _HOLD] = target     # 丸め誤差を残さない
+        self.v[idx, _HOLD] = 0
+
+    def plan_velocity(self, idx, t, p0, v0, target_velocity, acc, dec, jerk):
+        """idx の軸を v0 から target_velocity まで変えてその速度を保つ（Profile Velocity）"""
+        T, A, J = self._empty(len(idx))
+        speed_up = np.abs(target_velocity) >= np.abs(v0)
+        amax = np.where(speed_up, acc, dec)
+        _put_ramp(T, A, J, _STOP, np.abs(target_velocity - v0), np.sign(target_velocity - v0), amax, jerk)
+
+        self._store(idx, t, p0, v0, T, A, J)
+        self.v[idx, _HOLD] = target_velocity
+
+    def evaluate(self, idx, t):
+        """時刻 t の (位置, 速度, 保持区間に入ったか) を返す"""
+        t0 = self.t0[idx]
+        k = (t0 <= t[:, None]).sum(axis=1) - 1
+        rows = np.arange(len(idx))
+        dt = t - t0[rows, k]
+
+        p, v = self.p[idx, k], self.v[idx, k]
+        a, j = self.a[idx, k], self.j[idx, k]
+        position = p + dt * (v + dt * (a / 2 + dt * j / 6))
+        velocity = v + dt * (a + dt * j / 2)
+        return position, velocity, k == _HOLD
+
+    def _empty(self, n):
+        T = np.zeros((n, N_SEGMENTS))
+        T[:, _HOLD] = np.inf
+        return T, np.zeros((n, N_SEGMENTS)), np.zeros((n, N_SEGMENTS))
+
+    def _store(self, idx, t, p0, v0, T, A, J):
+        """区間の長さ・加速度・ジャークから各区間の開始時刻・位置・速度を埋める"""
+        J[T == 0] = 0       # 長さ 0 の区間（台形の jerk = inf など）は使わない
+        T, A, J = T[:, :_HOLD], A[:, :_HOLD], J[:, :_HOLD]
+        t0 = _accumulate(t, T)
+        v = _accumulate(v0, T * (A + T * J / 2))
+        p = _accumulate(p0, T * (v[:, :_HOLD] + T * (A / 2 + T * J / 6)))
+
+        self.t0[idx] = t0
+        self.p[idx] = p
+        self.v[idx] = v
+        self.a[idx, :_HOLD] = A
+        self.a[idx, _HOLD] = 0
+        self.j[idx, :_HOLD] = J
+        self.j[idx, _HOLD] = 0
+
+
+def _accumulate(start, delta):
+    """区間ごとの増分 delta（n, K-1）から各区間の始めの値（n, K）を作る"""
+    out = np.empty((len(delta), N_SEGMENTS))
+    out[:, 0] = start
+    np.cumsum(delta, axis=1, out=out[:, 1:])
+    out[:, 1:] += out[:, :1]
+    return out
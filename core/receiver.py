@@ -0,0 +1,62 @@
+import time
+
+import can
+import numpy as np
+
+from core.dispatch import CobIdTable
+
+
+class PdoReceiver(can.Listener):
+    """受信した PDO を can.Notifier のスレッド上でデコードして履歴に書き込む
+
+    history に書き込むのはこのリスナーだけ（書き手は1スレッド）なので、
+    GUI 側はロックなしで history.window() や latest を読んでよい。
+    table はマッピング変更時に丸ごと差し替える（参照の代入だけ）。
+    """
+
+    def __init__(self, history, table=None, stats=None):
+        self.history = history
+        self.stats = stats      # CycleStats（あれば pdo_rx / pdo_latency を記録）
+        self.table = table if table is not None else CobIdTable(history.signals)
+
+        # ノードごとの最新位置（GUI のラベル用、index = node id）
+        self.latest = np.zeros(128, dtype=np.int64)
+
+        self.received = 0       # 受信フレーム数
+        self.ignored = 0        # 対象外のフレーム数
+        self.error = None       # 最後に起きた例外
+
+    def on_message_received(self, msg):
+        if self.stats is not None:
+            start = time.perf_counter()
+            self._decode(msg)
+            self.stats.record("pdo_rx", time.perf_counter() - start)
+            self.stats.record("pdo_latency", time.time() - msg.timestamp)
+        else:
+            self._decode(msg)
+
+    def _decode(self, msg):
+        self.received += 1
+
+        entry = self.table.get(msg.arbitration_id)
+        if entry is None or len(msg.data) < entry.struct.size:
+            self.ignored += 1
+            return
+
+        values = entry.struct.unpack_from(msg.data)
+        append = self.history.append
+        for i, nid, signal in entry.fields:
+            value = values[i]
+            append(nid, signal, value)
+            if signal == "position":
+                self.latest[nid] = value
+
+    def on_error(self, exc):
+        self.error = exc
+
+
+def start_receiver(bus, history, table=None, stats=None):
+    """bus に PdoReceiver を付けたバックグラウンド受信を開始する（notifier, receiver を返す）"""
+    receiver = PdoReceiver(history, table, stats)
+    notifier = can.Notifier(bus, [receiver])
+    return notifier, receiver
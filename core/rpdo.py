@@ -0,0 +1,277 @@
+import functools
+import logging
+import time
+from collections import deque
+
+import can
+import canopen
+import numpy as np
+from canopen.sdo import SdoAbortedError
+
+from core.pdo import (ABORT_CANNOT_MAP, ABORT_PDO_LENGTH, PdoLayout, data_type_of, read_rpdo_map,
+                      rpdo_cob_id)
+from core.tpdo import COB_ID_INVALID, read_param
+
+logger = logging.getLogger(__name__)
+
+RPDO_COMMUNICATION = 0x1400     # 0x1400〜0x1403: RPDO 通信パラメータ（sub1 = COB-ID）
+RPDO_MAPPING = 0x1600           # 0x1600〜0x1603: RPDO マッピング
+
+# OD に 0x1600 が無いノードのマッピング（RPDO1: controlword + 目標位置、RPDO2: 目標速度）
+DEFAULT_RPDO_MAP = {1: [0x6040, 0x607A], 2: [0x60FF]}
+
+
+class _Group:
+    """RPDO 番号とマッピング（OdStore の列）が同じ軸の集まり（まとめて詰める / 解く）"""
+
+    def __init__(self, pdo_num, layout, columns):
+        self.pdo_num = pdo_num
+        self.dtype = layout.dtype
+        self.size = layout.struct.size
+        self.columns = columns
+        self.rows = []
+        self.messages = []      # マスタが送る Message（軸ごとに使い回す）
+
+    def add(self, row, cob_id):
+        self.rows.append(row)
+        self.messages.append(can.Message(arbitration_id=cob_id, data=bytearray(self.size),
+                                         is_extended_id=False))
+
+
+class RpdoMapping:
+    """全軸の RPDO マッピング（0x1400〜0x1403 / 0x1600〜0x1603）
+
+    nodes[row] が store の row 行の軸のノード。マスタ（RpdoMaster）とドライブ（RpdoReceiver）で
+    同じものを使う。OD に 0x1600 が無いノードは DEFAULT_RPDO_MAP、0x1400 が無ければ
+    既定の COB-ID（0x200 + node など）。マッピングできるのは OdStore の列のオブジェクトだけ。
+    LocalNode に SDO で 0x1400〜/0x1600〜 が書かれたら、書かれた後の設定を確かめてから
+    （使えなければ SDO abort）次の周期に組み直す。
+    """
+
+    def __init__(self, store, nodes):
+        self.store = store
+        self.nodes = list(nodes)
+        self.version = 0        # 組み直すたびに増える
+        self._written = {}      # (row, index, subindex) → SDO で書かれた値（data_store に入る前から使う）
+        self._generation = 0    # 設定が変わるたびに増える
+        self._built = None      # _groups を作ったときの _generation
+        self._groups = None
+        for row, node in enumerate(self.nodes):
+            if isinstance(node, canopen.LocalNode):
+                node.add_write_callback(functools.partial(self._on_write, row))
+
+    def invalidate(self):
+        """次の周期に組み直す"""
+        self._generation += 1
+
+    @property
+    def groups(self):
+        # 組み直している間に invalidate() されても、次に呼ばれたときにもう一度組み直す
+        generation = self._generation
+        if generation != self._built:
+            try:
+                self._groups = self._build()
+                self.version += 1
+            except ValueError:
+                if self._groups is None:
+                    raise
+                logger.exception("RPDO mapping not applied, keeping the previous one")
+            self._built = generation
+        return self._groups
+
+    @property
+    def count(self):
+        """1周期に送る RPDO のフレーム数"""
+        return sum(len(group.rows) for group in self.groups)
+
+    def _param(self, row, index, subindex):
+        written = self._written.get((row, index, subindex))
+        return written if written is not None else read_param(self.nodes[row], index, subindex)
+
+    def _node_pdos(self, row, value):
+        """row 行のノードの [(pdo_num, COB-ID, [index, ...]), ...]（OdStore に無いものは ValueError）"""
+        node = self.nodes[row]
+        od = node.object_dictionary
+        rpdo_map = read_rpdo_map(od, value) if RPDO_MAPPING in od else DEFAULT_RPDO_MAP
+        pdos = []
+        for pdo_num, indices in sorted(rpdo_map.items()):
+            if not indices:
+                continue
+            cob_id = value(RPDO_COMMUNICATION + pdo_num - 1, 1)
+            if cob_id is None:
+                cob_id = rpdo_cob_id(node.id, pdo_num)
+            elif cob_id & COB_ID_INVALID:
+                continue
+            missing = [index for index in indices if index not in self.store.columns]
+            if missing:
+                raise ValueError(f"RPDO{pdo_num} of node {node.id} maps objects outside the "
+                                 "process data: " + ", ".join(f"0x{i:04X}" for i in missing))
+            pdos.append((pdo_num, cob_id & 0x7FF, indices))
+        return pdos
+
+    def _layout(self, row, cob_id, indices):
+        od = self.nodes[row].object_dictionary
+        return PdoLayout(cob_id, indices, [data_type_of(od, i) for i in indices])
+
+    def _build(self):
+        columns_of = self.store.columns
+        groups = {}
+        for row in range(len(self.nodes)):
+            value = functools.partial(self._param, row)
+            for pdo_num, cob_id, indices in self._node_pdos(row, value):
+                layout = self._layout(row, cob_id, indices)
+                key = (pdo_num, layout.indices, layout.data_types)
+                group = groups.get(key)
+                if group is None:
+                    columns = np.array([columns_of[index] for index in indices])
+                    group = groups[key] = _Group(pdo_num, layout, columns)
+                group.add(row, layout.cob_id)
+
+        for group in groups.values():
+            group.rows = np.array(group.rows)
+        return list(groups.values())
+
+    def _on_write(self, row, index, subindex, od, data):
+        # SDO で 0x1400〜0x1403 / 0x1600〜0x1603 が書かれたら組み直す（Notifier のスレッドから、
+        # data_store に入る前に呼ばれるので、書かれた値は _written から使う）
+        if not (RPDO_COMMUNICATION <= index < RPDO_COMMUNICATION + 4
+                or RPDO_MAPPING <= index < RPDO_MAPPING + 4):
+            return
+        written = od.decode_raw(data)
+
+        def value(i, sub):
+            return written if (i, sub) == (index, subindex) else self._param(row, i, sub)
+
+        try:
+            pdos = self._node_pdos(row, value)
+        except (KeyError, ValueError):
+            raise SdoAbortedError(ABORT_CANNOT_MAP)
+        try:
+            for _, cob_id, indices in pdos:
+                self._layout(row, cob_id, indices)
+        except ValueError:
+            raise SdoAbortedError(ABORT_PDO_LENGTH)
+
+        self._written[(row, index, subindex)] = written
+        self.invalidate()
+
+
+class RpdoMaster:
+    """マスタ側: 全軸の目標値を RPDO に詰めて送る
+
+    image はマスタが持つ目標値（OdStore と同じ並びの (軸, オブジェクト) の配列）。
+    RPDO 番号・マッピングごとに全軸分を構造化配列に一度に詰め、フレームに切り分けて送る。
+    """
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.sent = 0
+
+    def send(self, image, send):
+        """全軸の RPDO を send(msg) する（送ったフレーム数を返す）"""
+        count = 0
+        for group in self.mapping.groups:
+            block = image[group.rows[:, None], group.columns]
+            packed = np.empty(len(group.rows), dtype=group.dtype)
+            for j, name in enumerate(group.dtype.names):
+                packed[name] = block[:, j]      # データ型の幅に切り詰める（CAN に載る値）
+            raw = packed.tobytes()
+            size = group.size
+            for i, msg in enumerate(group.messages):
+                msg.data[:] = raw[i * size:(i + 1) * size]
+                send(msg)
+            count += len(group.messages)
+        self.sent += count
+        return count
+
+
+class RpdoReceiver:
+    """ドライブ側: 受け取った RPDO をためておき、apply() でまとめて OdStore に書く
+
+    network に RPDO の COB-ID を購読して列に積むだけ（同じチャネルの他のマスタから
+    届いたものは Notifier のスレッドで積まれる）。シミュレータのマスタは loopback_send() で
+    周期のスレッドのまま渡すので、apply()（SYNC の前）は待たずにそこまでに届いた分を、
+    RPDO 番号・マッピングごとに np.frombuffer で一度に解いて store の列に書く。
+    同じ COB-ID が何回も届いていれば最後のもの。マッピングより短いフレームは errors に数える。
+    """
+
+    def __init__(self, network, mapping):
+        self.network = network
+        self.mapping = mapping
+
+        self.received = 0       # 受け取ったフレーム数
+        self.applied = 0        # store に書いたフレーム数
+        self.errors = 0
+
+        self._queue = deque()
+        self._lookup = {}       # COB-ID → (_Group, 行の位置)
+        self._version = None
+
+    def subscribe(self):
+        """マッピングが変わっていたら購読し直す（マスタが送る前に呼ぶ）"""
+        groups = self.mapping.groups
+        if self._version == self.mapping.version:
+            return
+        for cob_id in self._lookup:
+            self.network.unsubscribe(cob_id, self._on_message)
+        self._lookup = {msg.arbitration_id: (group, i)
+                        for group in groups for i, msg in enumerate(group.messages)}
+        for cob_id in self._lookup:
+            self.network.subscribe(cob_id, self._on_message)
+        self._version = self.mapping.version
+
+    def _on_message(self, can_id, data, timestamp):
+        # マスタは Message を使い回すので中身をコピーしておく
+        self._queue.append((can_id, bytes(data)))
+        self.received += 1
+
+    def apply(self):
+        """届いている RPDO を store に書く（書いたフレーム数を返す）"""
+        queue = self._queue
+        latest = {}
+        for _ in range(len(queue)):
+            can_id, data = queue.popleft()
+            latest[can_id] = data
+
+        pending = {}
+        for can_id, data in latest.items():
+            entry = self._lookup.get(can_id)
+            if entry is None:
+                continue
+            group, i = entry
+            if len(data) < group.size:
+                self.errors += 1
+                continue
+            positions, chunks = pending.setdefault(group, ([], []))
+            positions.append(i)
+            chunks.append(data[:group.size])
+
+        values = self.mapping.store.values
+        count = 0
+        for group, (positions, chunks) in pending.items():
+            decoded = np.frombuffer(b"".join(chunks), dtype=group.dtype)
+            rows = group.rows[positions]
+            for name, col in zip(group.dtype.names, group.columns):
+                values[rows, col] = decoded[name]
+            count += len(positions)
+        self.applied += count
+        return count
+
+    def close(self):
+        for cob_id in self._lookup:
+            self.network.unsubscribe(cob_id, self._on_message)
+        self._lookup = {}
+        self._version = None
+
+
+def loopback_send(network):
+    """network.bus で送り、同じ network のノード（ドライブ）にも呼んだスレッドのまま渡す send
+
+    仮想バスは自分で送ったフレームを自分の Notifier に返さないので、購読している
+    RpdoReceiver には network.notify() で直接渡す（Notifier のスレッドを待たない）。
+    network.bus が BusTap なら記録・書き出し・BusModel にも載る（あとで tap されてもよいよう毎回引く）。
+    """
+    def send(msg):
+        network.bus.send(msg)
+        network.notify(msg.arbitration_id, msg.data, time.time())
+    return send
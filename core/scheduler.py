@@ -0,0 +1,85 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SPIN = 0.0005   # 最後の 0.5ms は sleep せずに待つ（sleep の粒度対策）
+
+
+def wait_until(deadline, spin=SPIN):
+    """perf_counter() が deadline になるまで待つ（sleep + 最後だけビジーウェイト）"""
+    delay = deadline - time.perf_counter() - spin
+    if delay > 0:
+        time.sleep(delay)
+    while time.perf_counter() < deadline:
+        pass
+
+
+class SimThread(threading.Thread):
+    """step() を period 周期で呼び続けるシミュレーション専用スレッド
+
+    周期は絶対時刻のデッドラインで管理するので、1回遅れても後ろにずれない。
+    1周期以上遅れたときは overruns を数えてデッドラインを今に合わせ直す。
+    GUI など他スレッドからの操作は call() で渡し、周期の頭でこのスレッドが実行する。
+    step() や call() の関数が例外を出したら、error に入れて on_error(exc) を呼び、スレッドを止める。
+    """
+
+    def __init__(self, step, period, spin=SPIN, stats=None, on_error=None):
+        super().__init__(name="sim", daemon=True)
+        self.step = step
+        self.period = period
+        self.spin = spin
+        self.stats = stats      # CycleStats（あれば1周期の処理時間を "cycle" に記録）
+        self.on_error = on_error    # このスレッドから呼ばれる（GUI なら Qt のシグナルで渡す）
+        self.error = None
+
+        self.cycles = 0
+        self.overruns = 0
+
+        self._calls = queue.SimpleQueue()
+        self._stop_event = threading.Event()
+
+    def call(self, fn, *args):
+        """fn(*args) を次の周期の頭にシミュレーションスレッドで実行する"""
+        self._calls.put((fn, args))
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        deadline = time.perf_counter()
+        while not self._stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                self._run_calls()
+                self.step()
+            except Exception as exc:
+                logger.exception("simulation step failed, stopping")
+                self.error = exc
+                self._stop_event.set()
+                if self.on_error is not None:
+                    self.on_error(exc)
+                return
+            self.cycles += 1
+            if self.stats is not None:
+                self.stats.record("cycle", time.perf_counter() - start)
+
+            deadline += self.period
+            now = time.perf_counter()
+            if now > deadline + self.period:
+                self.overruns += 1
+                deadline = now
+                continue
+            wait_until(deadline, self.spin)
+
+    def _run_calls(self):
+        while True:
+            try:
+                fn, args = self._calls.get_nowait()
+            except queue.Empty:
+                return
+            fn(*args)
@@ -0,0 +1,209 @@
+import logging
+import struct
+from binascii import crc_hqx
+
+import canopen
+from canopen import objectdictionary
+from canopen.objectdictionary import ODArray, ODVariable
+from canopen.sdo import SdoAbortedError, SdoServer
+from canopen.sdo.constants import (ABORT_CRC_ERROR, ABORT_INVALID_BLOCK_SIZE,
+                                   ABORT_INVALID_COMMAND_SPECIFIER, BLOCK_SIZE_SPECIFIED,
+                                   BLOCK_TRANSFER_RESPONSE, CRC_SUPPORTED, END_BLOCK_TRANSFER,
+                                   INITIATE_BLOCK_TRANSFER, NO_MORE_BLOCKS, REQUEST_ABORTED,
+                                   REQUEST_BLOCK_DOWNLOAD, REQUEST_BLOCK_UPLOAD,
+                                   RESPONSE_BLOCK_DOWNLOAD, RESPONSE_BLOCK_UPLOAD, SDO_STRUCT,
+                                   START_BLOCK_UPLOAD)
+
+from core.od_store import StoreVariable
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 127        # ブロック転送の1ブロックのセグメント数（最大 127）
+PROGRAM_DATA = 0x1F50   # 大きなデータ（プログラムなど）を置く DOMAIN（CiA 302）
+
+
+class BlockSdoServer(SdoServer):
+    """ブロック転送（CiA 301）にも答える SDO サーバー
+
+    canopen.SdoServer は expedited / segmented だけなので、
+    ブロックダウンロード・ブロックアップロードをここで足す（CRC あり / なし両方）。
+    """
+
+    def __init__(self, rx_cobid, tx_cobid, node):
+        super().__init__(rx_cobid, tx_cobid, node)
+        self._block = None      # ブロック転送中の状態（"download" / "upload" の dict）
+
+    def on_request(self, can_id, data, timestamp):
+        block = self._block
+        if block is not None and block["mode"] == "download" and block["receiving"]:
+            # サブブロック中のセグメントは先頭バイトがシーケンス番号なので、コマンドとして見ない
+            try:
+                self._download_segment(data)
+            except SdoAbortedError as exc:
+                self._block = None
+                self.abort(exc.code)
+            return
+
+        ccs = data[0] & 0xE0
+        if ccs == REQUEST_ABORTED:
+            self._block = None
+        elif ccs in (REQUEST_BLOCK_DOWNLOAD, REQUEST_BLOCK_UPLOAD) or block is not None:
+            try:
+                if ccs == REQUEST_BLOCK_DOWNLOAD:
+                    self._block_download(data)
+                elif ccs == REQUEST_BLOCK_UPLOAD:
+                    self._block_upload(data)
+                else:
+                    raise SdoAbortedError(ABORT_INVALID_COMMAND_SPECIFIER)
+            except SdoAbortedError as exc:
+                self._block = None
+                self.abort(exc.code)
+            except Exception as exc:
+                self._block = None
+                self.abort()
+                logger.exception(exc)
+            return
+        super().on_request(can_id, data, timestamp)
+
+    # --- ブロックダウンロード（マスタ → ドライブ） ---
+    def _block_download(self, data):
+        command = data[0]
+        block = self._block
+        if block is None:
+            if command & 0x1 != INITIATE_BLOCK_TRANSFER:
+                raise SdoAbortedError(ABORT_INVALID_COMMAND_SPECIFIER)
+            _, index, subindex = SDO_STRUCT.unpack_from(data)
+            self._index, self._subindex = index, subindex
+            self._node._find_object(index, subindex)        # 無ければここで abort
+            self._block = {"mode": "download", "receiving": True, "buffer": bytearray(),
+                           "crc": bool(command & CRC_SUPPORTED), "seqno": 0}
+            response = bytearray(8)
+            SDO_STRUCT.pack_into(response, 0, RESPONSE_BLOCK_DOWNLOAD | CRC_SUPPORTED
+                                 | INITIATE_BLOCK_TRANSFER, index, subindex)
+            response[4] = BLOCK_SIZE
+            self.send_response(response)
+            return
+
+        # 最後のサブブロックのあとの終了要求
+        if block["receiving"] or command & 0x1 != END_BLOCK_TRANSFER:
+            raise SdoAbortedError(ABORT_INVALID_COMMAND_SPECIFIER)
+        unused = (command >> 2) & 0x7
+        buffer = block["buffer"]
+        if unused:
+            del buffer[-unused:]
+        crc, = struct.unpack_from("<H", data, 1)
+        if block["crc"] and crc != crc_hqx(bytes(buffer), 0):
+            raise SdoAbortedError(ABORT_CRC_ERROR)
+        self._block = None
+        self._node.set_data(self._index, self._subindex, bytes(buffer), check_writable=True)
+        self.send_response(bytes([RESPONSE_BLOCK_DOWNLOAD | END_BLOCK_TRANSFER, 0, 0, 0, 0, 0, 0, 0]))
+
+    def _download_segment(self, data):
+        block = self._block
+        seqno = data[0] & 0x7F
+        last = bool(data[0] & NO_MORE_BLOCKS)
+        if seqno == block["seqno"] + 1:
+            block["seqno"] = seqno
+            block["buffer"].extend(data[1:8])
+        # 番号が飛んだセグメントは捨て、ブロックの最後で受け取れた所までを返す
+        if last or seqno == BLOCK_SIZE:
+            self.send_response(bytes([RESPONSE_BLOCK_DOWNLOAD | BLOCK_TRANSFER_RESPONSE,
+                                      block["seqno"], BLOCK_SIZE, 0, 0, 0, 0, 0]))
+            if last and block["seqno"] == seqno:
+                block["receiving"] = False
+            block["seqno"] = 0
+
+    # --- ブロックアップロード（ドライブ → マスタ） ---
+    def _block_upload(self, data):
+        command = data[0]
+        cs = command & 0x3
+        block = self._block
+        if block is None:
+            if cs != INITIATE_BLOCK_TRANSFER:
+                raise SdoAbortedError(ABORT_INVALID_COMMAND_SPECIFIER)
+            _, index, subindex = SDO_STRUCT.unpack_from(data)
+            blksize = data[4]
+            if not 1 <= blksize <= 127:
+                raise SdoAbortedError(ABORT_INVALID_BLOCK_SIZE)
+            self._index, self._subindex = index, subindex
+            payload = self._node.get_data(index, subindex, check_readable=True)
+            self._block = {"mode": "upload", "data": payload, "pos": 0,
+                           "blksize": blksize, "crc": bool(command & CRC_SUPPORTED)}
+            response = bytearray(8)
+            SDO_STRUCT.pack_into(response, 0, RESPONSE_BLOCK_UPLOAD | CRC_SUPPORTED | BLOCK_SIZE_SPECIFIED
+                                 | INITIATE_BLOCK_TRANSFER, index, subindex)
+            struct.pack_into("<L", response, 4, len(payload))
+            self.send_response(response)
+            return
+
+        if cs == START_BLOCK_UPLOAD:
+            self._send_upload_block()
+        elif cs == BLOCK_TRANSFER_RESPONSE:
+            ackseq, blksize = data[1], data[2]
+            block["pos"] += 7 * ackseq
+            block["blksize"] = blksize
+            if block["pos"] >= len(block["data"]):
+                payload = block["data"]
+                unused = (7 - len(payload) % 7) % 7 if payload else 0
+                crc = crc_hqx(payload, 0) if block["crc"] else 0
+                self.send_response(struct.pack("<BH5x", RESPONSE_BLOCK_UPLOAD | (unused << 2)
+                                               | END_BLOCK_TRANSFER, crc))
+            else:
+                self._send_upload_block()
+        elif cs == END_BLOCK_TRANSFER:
+            self._block = None
+        else:
+            raise SdoAbortedError(ABORT_INVALID_COMMAND_SPECIFIER)
+
+    def _send_upload_block(self):
+        block = self._block
+        payload, pos = block["data"], block["pos"]
+        for seqno in range(1, block["blksize"] + 1):
+            chunk = payload[pos:pos + 7]
+            pos += 7
+            last = pos >= len(payload)
+            self.send_response(bytes([seqno | (NO_MORE_BLOCKS if last else 0)]) + chunk.ljust(7, b"\0"))
+            if last:
+                return
+
+
+def _read_store(index, subindex, od):
+    # OdStore の配列に置いた変数は data_store ではなく配列から読む
+    if isinstance(od, StoreVariable):
+        return od.value
+    return None
+
+
+def _write_store(index, subindex, od, data):
+    if isinstance(od, StoreVariable):
+        od.value = od.decode_raw(data)
+
+
+def _add_program_data(od):
+    if PROGRAM_DATA in od:
+        return
+    program = ODArray("Program data", PROGRAM_DATA)
+    count = ODVariable("Number of entries", PROGRAM_DATA, 0)
+    count.data_type = objectdictionary.UNSIGNED8
+    count.access_type = "ro"
+    count.default = 1
+    program.add_member(count)
+    data = ODVariable("Program 1", PROGRAM_DATA, 1)
+    data.data_type = objectdictionary.DOMAIN
+    data.access_type = "rw"
+    program.add_member(data)
+    od.add_object(program)
+
+
+def drive_node(node_id, object_dictionary):
+    """SDO に答えるドライブ側のノード（LocalNode + ブロック転送）
+
+    OdStore に置いた変数は SDO で読み書きしても配列の値になる。
+    大きなデータの転送先として 0x1F50:01（DOMAIN）が無ければ足す。
+    """
+    _add_program_data(object_dictionary)
+    node = canopen.LocalNode(node_id, object_dictionary)
+    node.sdo = BlockSdoServer(0x600 + node_id, 0x580 + node_id, node)
+    node.add_read_callback(_read_store)
+    node.add_write_callback(_write_store)
+    return node
@@ -0,0 +1,318 @@
+import hashlib
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import can
+import canopen
+import numpy as np
+from canopen.node.base import BaseNode
+
+from core.axis import Axis
+from core.axis_bank import AxisBank
+from core.eds import load_template
+from core.od_store import PROCESS_OBJECTS, OdStore
+from core.plant import PlantModel
+from core.simulator import Simulator
+from core.tpdo import TpdoScheduler
+from core.trace import FLAG_EXTENDED, FLAG_REMOTE, FRAME_DTYPE, FRAME_STRUCT
+
+SPIN_WAIT = 0.002       # この時間までは sleep せずに待つ [s]
+RING_CAPACITY = 1 << 16     # ワーカー1つ分の TPDO リング [frames]
+
+# control 配列の並び: [SYNC カウンタ, 停止フラグ, ready ×W, done ×W, head ×W, tail ×W, dropped ×W]
+_SYNC, _STOP = 0, 1
+
+
+def shard_ranges(n_axes, workers):
+    """行 0..n_axes-1 を workers 個の連続した範囲に分ける"""
+    bounds = np.linspace(0, n_axes, workers + 1).round().astype(int)
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+
+def _wait(predicate, stop=lambda: False, spin=SPIN_WAIT):
+    """predicate() が真になるまで待つ
+
+    spin 秒までは回し続け（コアが足りないときは spin=0 で CPU を譲りながら）、
+    長引いたら少しずつ sleep する。
+    """
+    start = time.perf_counter()
+    while not predicate():
+        if stop():
+            return False
+        elapsed = time.perf_counter() - start
+        if elapsed > max(spin, SPIN_WAIT):
+            time.sleep(0.0001)
+        elif elapsed > spin:
+            time.sleep(0)
+    return True
+
+
+class _Control:
+    """共有メモリ上の制御カウンタ（int64）"""
+
+    def __init__(self, buf, workers):
+        self.array = np.ndarray(2 + 5 * workers, dtype=np.int64, buffer=buf)
+        w = workers
+        self.ready = self.array[2:2 + w]
+        self.done = self.array[2 + w:2 + 2 * w]
+        self.head = self.array[2 + 2 * w:2 + 3 * w]
+        self.tail = self.array[2 + 3 * w:2 + 4 * w]
+        self.dropped = self.array[2 + 4 * w:2 + 5 * w]
+
+    @staticmethod
+    def size(workers):
+        return (2 + 5 * workers) * 8
+
+
+class _RingBus:
+    """ワーカー側の bus の代わり。send() したフレームを共有メモリのリングに詰める
+
+    1周期分詰め終わったら publish() で head を進める（読む側は head までを読む）。
+    """
+
+    def __init__(self, buf, control, worker):
+        self.buf = buf
+        self.control = control
+        self.worker = worker
+        self.capacity = len(buf) // FRAME_STRUCT.size
+        self.head = 0
+        self.time = 0.0
+
+    def send(self, msg, timeout=None):
+        if self.head - self.control.tail[self.worker] >= self.capacity:
+            self.control.dropped[self.worker] += 1
+            return
+        flags = (FLAG_EXTENDED if msg.is_extended_id else 0) | (FLAG_REMOTE if msg.is_remote_frame else 0)
+        FRAME_STRUCT.pack_into(self.buf, (self.head % self.capacity) * FRAME_STRUCT.size, self.time,
+                               msg.arbitration_id, msg.dlc, flags, 0, bytes(msg.data))
+        self.head += 1
+
+    def publish(self):
+        self.control.head[self.worker] = self.head
+
+
+def _worker_main(worker, lo, hi, n_axes, period, names, options):
+    """ワーカープロセス: 行 lo..hi-1 の軸を持ち、SYNC カウンタが進むたびに1周期進める"""
+    control_shm = shared_memory.SharedMemory(names["control"])
+    store_shm = shared_memory.SharedMemory(names["store"])
+    ring_shm = shared_memory.SharedMemory(names["rings"][worker])
+    try:
+        control = _Control(control_shm.buf, options["workers"])
+        values = np.ndarray((n_axes, len(PROCESS_OBJECTS)), dtype=np.int64, buffer=store_shm.buf)
+        store = OdStore(hi - lo, values=values[lo:hi])
+
+        integrator = options["integrator"]
+        plant = PlantModel(hi - lo, period, options["dt"], integrator) if integrator else None
+        bank = AxisBank(hi - lo, store=store, profile_type=options["profile_type"], plant=plant)
+
+        # この bus は送信だけ（共有メモリのリングに書く）
+        network = canopen.Network()
+        bus = _RingBus(ring_shm.buf, control, worker)
+        network.bus = bus
+
+        template = load_template(options["eds"])
+        axes = []
+        for row, nid in enumerate(options["node_ids"][lo:hi]):
+            node = network.add_node(nid, template.build(nid))
+            axes.append(Axis(node, nid, network, bank, row))
+        tpdo = TpdoScheduler(axes)
+        if options["tpdo"]:
+            tpdo.configure(**options["tpdo"])
+
+        control.ready[worker] = 1
+        seen = 0
+        stopped = lambda: control.array[_STOP] != 0
+        while _wait(lambda: control.array[_SYNC] > seen, stopped, options["spin"]):
+            seen = int(control.array[_SYNC])
+            bus.time = seen * period
+            bank.step()
+            tpdo.on_sync(bus.time, bus.send)
+            bus.publish()
+            control.done[worker] = seen
+    finally:
+        # ndarray が共有メモリを参照したままだと close できない
+        control = values = store = bank = bus = network = axes = tpdo = None
+        control_shm.close()
+        store_shm.close()
+        ring_shm.close()
+
+
+class _AxisView:
+    """コーディネータ側の軸（OD の配列から実値を読むだけ）"""
+
+    def __init__(self, store, node_id, row):
+        self.store = store
+        self.node_id = node_id
+        self.row = row
+
+    @property
+    def position(self):
+        return int(self.store.column(0x6064)[self.row])
+
+    @property
+    def velocity(self):
+        return int(self.store.column(0x606C)[self.row])
+
+    @property
+    def torque(self):
+        return int(self.store.column(0x6077)[self.row])
+
+
+class ShardedSimulator(Simulator):
+    """軸をワーカープロセスに分けて回す Simulator（API は Simulator と同じ）
+
+    ノード ID を workers 個の連続した範囲に分け、各ワーカーが自分の範囲の
+    core.axis.Axis と AxisBank を持つ。OD のプロセスデータ（OdStore）は共有メモリに置き、
+    コーディネータが目標値・controlword を書いて SYNC カウンタを進めると、
+    全ワーカーが並列に1周期進めて実値を書き戻す。TPDO はワーカーごとの
+    共有メモリのリングに詰め、コーディネータが周期ごとにまとめて回収する（last_frames）。
+    forward=True（または export / bitrate あり）なら回収したフレームをコーディネータの bus にも流す。
+    digest() は OD の整数値から作るので、1プロセスの Simulator の digest とは一致しない。
+    """
+
+    def __init__(self, n_axes=5, workers=2, period=0.02, mode="sin", history=10000, stats=False,
+                 forward=False, **kwargs):
+        if kwargs.get("node_ids") is not None:
+            n_axes = len(kwargs["node_ids"])
+        self.workers = min(workers, n_axes)
+        self.forward = forward
+        self._processes = []
+        self._shms = []
+        super().__init__(n_axes, period, mode, history, stats, **kwargs)
+
+    def _build_drives(self, n_axes, eds, profile_type, integrator, dt):
+        ranges = shard_ranges(n_axes, self.workers)
+        self.workers = len(ranges)
+
+        control_shm = self._create_shm(_Control.size(self.workers))
+        store_shm = self._create_shm(n_axes * len(PROCESS_OBJECTS) * 8)
+        ring_shms = [self._create_shm(RING_CAPACITY * FRAME_STRUCT.size) for _ in ranges]
+
+        self.control = _Control(control_shm.buf, self.workers)
+        self.control.array[:] = 0
+        values = np.ndarray((n_axes, len(PROCESS_OBJECTS)), dtype=np.int64, buffer=store_shm.buf)
+        values[:] = 0
+        self.store = OdStore(n_axes, values=values)
+        self.bank = None
+        self._rings = [np.ndarray(RING_CAPACITY, dtype=FRAME_DTYPE, buffer=shm.buf) for shm in ring_shms]
+        self.last_frames = np.zeros(0, dtype=FRAME_DTYPE)
+        self.dropped = 0
+
+        names = {"control": control_shm.name, "store": store_shm.name,
+                 "rings": [shm.name for shm in ring_shms]}
+        # ワーカー + コーディネータ分のコアが無ければ回し続けずに CPU を譲る
+        self._spin = SPIN_WAIT if (os.cpu_count() or 1) > self.workers else 0
+        options = {"workers": self.workers, "eds": eds, "profile_type": profile_type,
+                   "integrator": integrator, "dt": dt, "spin": self._spin,
+                   "node_ids": self.node_ids, "tpdo": self.tpdo_config}
+
+        # Windows と同じ spawn で起動する（fork だと親のスレッドの状態を引き継いでしまう）
+        ctx = multiprocessing.get_context("spawn")
+        for worker, (lo, hi) in enumerate(ranges):
+            process = ctx.Process(target=_worker_main, name=f"shard-{worker}", daemon=True,
+                                  args=(worker, lo, hi, n_axes, self.period, names, options))
+            process.start()
+            self._processes.append(process)
+
+        # 全ワーカーが EDS の初期値を書き終わるまで待つ（その後で 0x6060 などを上書きする）
+        if not _wait(lambda: self.control.ready.all(), self._worker_died):
+            # 記録・書き出しなどはまだ作っていないので、ワーカーと共有メモリ・バスだけ片付ける
+            self._shutdown()
+            self.network.disconnect()
+            raise RuntimeError("shard worker failed to start")
+
+        self.axes = [_AxisView(self.store, nid, row) for row, nid in enumerate(self.node_ids)]
+
+    def _rpdo_nodes(self, eds):
+        # ドライブの OD はワーカー側にあるので、RPDO の設定は EDS から作った OD で読む
+        # （受け取った RPDO はコーディネータが共有メモリの OdStore に書く）
+        template = load_template(eds)
+        return [BaseNode(nid, template.build(nid)) for nid in self.node_ids]
+
+    def _create_shm(self, size):
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        self._shms.append(shm)
+        return shm
+
+    def _worker_died(self):
+        return any(not process.is_alive() for process in self._processes)
+
+    def _run_drives(self, stats):
+        # SYNC を全ワーカーに配り、全員が終わるまで待つ
+        control = self.control
+        frame = self.frame
+        t = time.perf_counter()
+        control.array[_SYNC] = frame
+        if not _wait(lambda: (control.done == frame).all(), self._worker_died, self._spin):
+            raise RuntimeError("shard worker died")
+        if stats is not None:
+            stats.record("on_sync", time.perf_counter() - t)
+
+        # 書き出し先（candump など）やバスモデルがあれば bus に流す（記録もそちらの BusTap で行われる）
+        self.last_frames = self._drain()
+        if self.forward or self.exporters or self.bus_model is not None:
+            send = self.network.bus.send
+            for msg in self._messages(self.last_frames):
+                send(msg)
+        elif self.recorder is not None:
+            self.recorder.record_frames(self.last_frames)
+
+    def _drain(self):
+        """全ワーカーのリングからこの周期までのフレームを取り出す"""
+        control = self.control
+        chunks = []
+        for worker, ring in enumerate(self._rings):
+            head, tail = int(control.head[worker]), int(control.tail[worker])
+            if head == tail:
+                continue
+            idx = np.arange(tail, head) % len(ring)
+            chunks.append(ring[idx])
+            control.tail[worker] = head
+        self.dropped = int(control.dropped.sum())
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=FRAME_DTYPE)
+
+    @staticmethod
+    def _messages(frames):
+        for t, cob_id, dlc, flags, _, data in FRAME_STRUCT.iter_unpack(frames.tobytes()):
+            yield can.Message(timestamp=t, arbitration_id=cob_id, dlc=dlc, data=data[:dlc],
+                              is_extended_id=bool(flags & FLAG_EXTENDED),
+                              is_remote_frame=bool(flags & FLAG_REMOTE))
+
+    def _push_history(self):
+        store = self.store
+        self.history.push("position", store.column(0x6064))
+        self.history.push("velocity", store.column(0x606C))
+        self.history.push("torque", store.column(0x6077))
+        self.history.push("target", store.column(0x607A))
+
+    def digest(self):
+        """全軸の実位置・速度・トルク（OD の値）の SHA-1"""
+        h = hashlib.sha1()
+        for index in (0x6064, 0x606C, 0x6077):
+            h.update(np.ascontiguousarray(self.store.column(index)).tobytes())
+        return h.hexdigest()
+
+    def close(self):
+        self._shutdown()
+        if getattr(self, "network", None) is not None:
+            super().close()
+
+    def _shutdown(self):
+        """ワーカーを止めて共有メモリを解放する"""
+        if getattr(self, "control", None) is not None:
+            self.control.array[_STOP] = 1
+        for process in self._processes:
+            process.join(2.0)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+        # 共有メモリを参照している配列を外してから解放する
+        self.control = self.store = self._rings = None
+        self.last_frames = np.zeros(0, dtype=FRAME_DTYPE)
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self._shms = []
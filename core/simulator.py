@@ -0,0 +1,373 @@
+import argparse
+import hashlib
+import time
+
+import can
+import canopen
+
+from core.axis import Axis
+from core.axis_bank import AxisBank
+from core.bus_model import BusModel
+from core.columns import SignalExporter
+from core.cia402 import CW_CHANGE_IMMEDIATELY, CW_NEW_SETPOINT, enable_controlword
+from core.eds import DEFAULT_EDS, load_template
+from core.export import LogExporter
+from core.history import HistoryBuffer
+from core.instrumentation import CycleStats
+from core.od_store import OdStore
+from core.plant import INTEGRATORS, PlantModel
+from core.profile import (CYCLIC_SYNC_POSITION, CYCLIC_SYNC_VELOCITY, MODE_NAMES, PROFILE_POSITION,
+                          PROFILE_VELOCITY, S_CURVE, TRAPEZOID)
+from core.rpdo import RpdoMapping, RpdoMaster, RpdoReceiver, loopback_send
+from core.scheduler import wait_until
+from core.sdo import drive_node
+from core.tpdo import TpdoScheduler
+from core.trace import TraceRecorder, tap_network
+from core.trajectory import TrajectoryGenerator
+
+
+class Simulator:
+    """GUI なしで SYNC 周期を回すシミュレータ（QTimer / FuncAnimation 不要）"""
+
+    def __init__(self, n_axes=5, period=0.02, mode="sin", history=10000, stats=False,
+                 eds=DEFAULT_EDS, op_mode=CYCLIC_SYNC_POSITION, profile_type=TRAPEZOID,
+                 integrator=None, dt=0.001, record=None, export=(), columns=None, chunk=1000,
+                 channel=None, node_ids=None, bitrate=None, tpdo=None, rpdo=True):
+        # node_ids を指定したらそのノード ID で軸を作る（n_axes は使わない）
+        if node_ids is None:
+            if not 1 <= n_axes <= 127:
+                raise ValueError(f"n_axes must be 1..127, got {n_axes}")
+            node_ids = range(1, n_axes + 1)
+        self.node_ids = [int(nid) for nid in node_ids]
+        if not self.node_ids or len(set(self.node_ids)) != len(self.node_ids) \
+                or not all(1 <= nid <= 127 for nid in self.node_ids):
+            raise ValueError(f"node_ids must be unique node IDs 1..127, got {self.node_ids}")
+        n_axes = len(self.node_ids)
+        baudrates = load_template(eds).baudrates
+        if bitrate is not None and baudrates and bitrate not in baudrates:
+            raise ValueError(f"bitrate {bitrate} is not one of the EDS baud rates {sorted(baudrates)}")
+
+        self.period = period    # SYNC 周期 [s]（シミュレーション時間）
+        self.frame = 0
+
+        # --- CANopen Network（channel ごとに別の仮想バス） ---
+        self.channel = channel
+        self.network = canopen.Network()
+        self.network.connect(interface='virtual', channel=channel)
+
+        # --- 軸（self.bank / self.store / self.axes） ---
+        # tpdo は全軸の TPDO 送信タイプの上書き（TpdoScheduler.configure() の引数）
+        self.tpdo_config = dict(tpdo or {})
+        self._build_drives(n_axes, eds, profile_type, integrator, dt)
+
+        # 運転モード（0x6060）。PV / CSV では目標値の差分を目標速度にする
+        self.op_mode = op_mode
+        self.store.column(0x6060)[:] = op_mode
+        self._prev_targets = None
+
+        # --- RPDO（マスタ → ドライブ）。rpdo=False なら目標値を OD の配列に直接書く ---
+        # マスタは目標値を self.setpoints に書いて network.bus から RPDO で送り（記録・BusModel にも載る）、
+        # ドライブ側にはこの周期のスレッドのまま渡す（Notifier のスレッドを待たない）
+        self.setpoints = self.store
+        self.rpdo = self.rpdo_rx = None
+        if rpdo:
+            mapping = RpdoMapping(self.store, self._rpdo_nodes(eds))
+            self.rpdo = RpdoMaster(mapping)
+            self.rpdo_rx = RpdoReceiver(self.network, mapping)
+            self.setpoints = OdStore(n_axes, self.store.objects, self.store.values.copy())
+            self._rpdo_send = loopback_send(self.network)
+
+        # --- 履歴（直近 history 周期分） ---
+        self.history = HistoryBuffer(self.node_ids, capacity=history)
+
+        # --- 軌道生成器 ---
+        self.traj = TrajectoryGenerator()
+        self.traj.mode = mode
+        self.traj.n_axes = n_axes
+
+        # 目標値は block_size 周期分まとめて先に計算しておく
+        self.block_size = 256
+        self._block = None
+        self._block_start = 0
+        self._block_key = None
+
+        # 周期ごとの処理時間・SYNC ジッタの計測（stats=True のときだけ）。
+        # ジッタは run(realtime=...) で実時間の周期が決まったときだけ測る
+        self.stats = CycleStats(None) if stats else None
+
+        # SYNC フレームは使い回す
+        self.sync_msg = can.Message(arbitration_id=0x80, data=[1, 0], is_extended_id=False)
+
+        # 送ったフレームと周期ごとの状態をファイルに記録する（record=パス のときだけ）
+        self.recorder = None
+        if record:
+            self.recorder = TraceRecorder(record, clock=lambda: self.sim_time)   # シミュレーション時間で記録
+            self.recorder.attach(self.network)
+        self._node_ids = [axis.node_id for axis in self.axes]
+
+        # candump / ASC / BLF への書き出し（形式は拡張子で決める）。時刻は開始時刻 + シミュレーション時間
+        start = time.time()
+        self.exporters = [LogExporter(path, clock=lambda: start + self.sim_time) for path in export]
+        for exporter in self.exporters:
+            exporter.attach(self.network)
+
+        # 位置・速度・トルク・目標・statusword を chunk 周期ごとに列ファイルへ追記する
+        self.signals = SignalExporter(columns, self._node_ids, chunk) if columns else None
+
+        # bitrate を指定したらバスの帯域・調停をモデル化して使用率と PDO の遅れを測る
+        self.bus_model = None
+        if bitrate is not None:
+            self.bus_model = BusModel(bitrate, clock=lambda: self.sim_time)
+            tap_network(self.network).sinks.append(self.bus_model.record_frame)
+
+    def _build_drives(self, n_axes, eds, profile_type, integrator, dt):
+        template = load_template(eds)      # EDS の解析は1回だけ
+        # integrator を指定したら物理モデル（固定 dt）で動かす
+        plant = PlantModel(n_axes, self.period, dt, integrator) if integrator else None
+        self.bank = AxisBank(n_axes, profile_type=profile_type, plant=plant)
+        self.store = self.bank.store
+        self.axes = []
+        for row, nid in enumerate(self.node_ids):
+            # ドライブは SDO サーバー付きの LocalNode（core.master から設定できる）
+            node = self.network.add_node(drive_node(nid, template.build(nid)))
+            self.axes.append(Axis(node, nid, self.network, self.bank, row))
+        # TPDO は 0x1800〜 の送信タイプに従って送る（変わっていない TPDO は詰めない）
+        self.tpdo = TpdoScheduler(self.axes)
+        if self.tpdo_config:
+            self.tpdo.configure(**self.tpdo_config)
+
+    def _rpdo_nodes(self, eds):
+        """store の行順のドライブのノード（RPDO のマッピングと COB-ID を読む）"""
+        return [axis.node for axis in self.axes]
+
+    @property
+    def sim_time(self):
+        return self.frame * self.period
+
+    def step(self):
+        """1 SYNC 周期分進める"""
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+
+        self.frame += 1
+
+        # ① 軌道生成
+        targets = self._targets(self.frame)
+        store = self.store
+        setpoints = self.setpoints
+        setpoints.column(0x607A)[:] = targets     # 全軸の 0x607A に一度に書く
+        if self.op_mode in (PROFILE_VELOCITY, CYCLIC_SYNC_VELOCITY):
+            previous = self._prev_targets if self._prev_targets is not None else targets
+            setpoints.column(0x60FF)[:] = targets - previous
+        self._prev_targets = targets
+
+        # マスタとして全軸を Operation Enabled まで進める（0x6041 → 0x6040）
+        controlword = enable_controlword(store.column(0x6041))
+        if self.op_mode == PROFILE_POSITION and self.frame % 2:
+            controlword |= CW_NEW_SETPOINT | CW_CHANGE_IMMEDIATELY     # 2周期に1回新しい目標位置
+        setpoints.column(0x6040)[:] = controlword
+
+        # ② RPDO 送信（ドライブは SYNC の前にまとめて受け取る）→ SYNC送信
+        if self.rpdo is not None:
+            self._send_rpdo(stats)
+        if stats is None:
+            self.network.bus.send(self.sync_msg)
+        else:
+            t = time.perf_counter()
+            self.network.bus.send(self.sync_msg)
+            stats.record("sync", time.perf_counter() - t)
+            stats.mark_sync(t)
+
+        # ③ 全軸まとめて状態遷移 + モーター更新（OD の配列に直接書く）→ 各軸 TPDO 送信
+        self._run_drives(stats)
+
+        # ④ 履歴に追加
+        self._push_history()
+
+        if self.recorder is not None:
+            self.recorder.record_state(self.frame, store, self._node_ids)
+        if self.signals is not None:
+            self.signals.append(self.frame, self.sim_time, store)
+        if self.bus_model is not None:
+            self.bus_model.advance(self.sim_time + self.period)
+
+        if stats is not None:
+            stats.record("cycle", time.perf_counter() - start)
+
+    def _send_rpdo(self, stats):
+        if stats is not None:
+            t = time.perf_counter()
+
+        rx = self.rpdo_rx
+        rx.subscribe()
+        self.rpdo.send(self.setpoints.values, self._rpdo_send)
+        rx.apply()
+
+        if stats is not None:
+            stats.record("rpdo", time.perf_counter() - t)
+
+    def _run_drives(self, stats):
+        self.bank.step()
+        if stats is None:
+            self.tpdo.on_sync(self.sim_time, self.network.bus.send)
+        else:
+            t = time.perf_counter()
+            self.tpdo.on_sync(self.sim_time, self.network.bus.send)
+            stats.record("on_sync", time.perf_counter() - t)
+
+    def _push_history(self):
+        bank = self.bank
+        self.history.push("position", bank.position)
+        self.history.push("velocity", bank.velocity)
+        self.history.push("torque", bank.torque)
+        self.history.push("target", bank.target)
+
+    def _targets(self, frame):
+        """frame の目標値（全軸分の行）を返す"""
+        traj = self.traj
+        key = (traj.mode, traj.amplitude, traj.period, traj.phase)
+        i = frame - self._block_start
+
+        # モード等が変わったか、ブロックを使い切ったら作り直す
+        if self._block is None or key != self._block_key or not 0 <= i < len(self._block):
+            self._block = traj.generate_block(frame, self.block_size, len(self.axes))
+            self._block_start = frame
+            self._block_key = key
+            i = 0
+
+        return self._block[i]
+
+    def digest(self):
+        """全軸の位置・速度・トルクの SHA-1（回帰比較用。同じ設定なら毎回同じ値）"""
+        bank = self.bank
+        h = hashlib.sha1()
+        for values in (bank.position, bank.velocity, bank.torque):
+            h.update(values.tobytes())
+        return h.hexdigest()
+
+    def run(self, cycles, realtime=None):
+        """cycles 周期分進める
+
+        realtime=None なら CPU の許す限り速く、realtime=1.0 なら実時間、
+        realtime=10.0 なら実時間の10倍速で回す。
+        """
+        if realtime is None:
+            if self.stats is not None:
+                self.stats.period = None        # 待たずに回すので目標の周期が無い（ジッタは測らない）
+            for _ in range(cycles):
+                self.step()
+            return
+
+        interval = self.period / realtime
+        if self.stats is not None:
+            self.stats.period = interval    # ジッタは実時間の周期に対して測る
+        deadline = time.perf_counter()
+        for _ in range(cycles):
+            self.step()
+
+            # 次の SYNC 時刻まで待つ（遅れても周期の基準はずらさない）
+            deadline += interval
+            wait_until(deadline)
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        for exporter in self.exporters:
+            exporter.close()
+        if self.signals is not None:
+            self.signals.close()
+        if self.rpdo_rx is not None:
+            self.rpdo_rx.close()
+        self.network.disconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless CANopen axis simulator")
+    parser.add_argument("--cycles", type=int, default=1000, help="number of SYNC cycles")
+    parser.add_argument("--axes", type=int, default=5, help="number of axes (1..127)")
+    parser.add_argument("--period", type=float, default=0.02, help="SYNC period [s]")
+    parser.add_argument("--mode", default="sin",
+                        choices=["sin", "circle", "line", "lissajous", "step", "triangle"])
+    parser.add_argument("--op-mode", default="csp", choices=list(MODE_NAMES.values()),
+                        help="modes of operation (0x6060)")
+    parser.add_argument("--profile", default="trapezoid", choices=["trapezoid", "s-curve"],
+                        help="motion profile for pp / pv")
+    parser.add_argument("--plant", default="none", choices=["none", *INTEGRATORS],
+                        help="integrate a physical plant model with this integrator")
+    parser.add_argument("--dt", type=float, default=0.001, help="plant integration step [s]")
+    parser.add_argument("--record", default=None,
+                        help="record frames and axis state to PATH.frames / PATH.state")
+    parser.add_argument("--export", action="append", default=[], metavar="PATH",
+                        help="also write frames as candump (.log), ASC (.asc) or BLF (.blf); repeatable")
+    parser.add_argument("--columns", default=None, metavar="DIR",
+                        help="write per-axis signals as .npy columns (and Parquet with pyarrow) to DIR")
+    parser.add_argument("--chunk", type=int, default=1000, help="cycles per column write")
+    parser.add_argument("--bitrate", type=int, default=None,
+                        help="model bus bandwidth and arbitration at this bit rate [bit/s]")
+    parser.add_argument("--tpdo-type", type=int, default=None,
+                        help="override the TPDO transmission type (0x1800sub2) of every axis")
+    parser.add_argument("--inhibit", type=float, default=None, help="TPDO inhibit time [ms]")
+    parser.add_argument("--event-timer", type=float, default=None, help="TPDO event timer [ms]")
+    parser.add_argument("--no-rpdo", dest="rpdo", action="store_false",
+                        help="write setpoints straight into the drives' OD instead of sending RPDOs")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="run the axes in N worker processes (0 = single process)")
+    parser.add_argument("--history", type=int, default=10000,
+                        help="history capacity per axis and signal [cycles]")
+    parser.add_argument("--stats", action="store_true",
+                        help="print per-stage latency and SYNC jitter (p50/p99/max; jitter needs --realtime)")
+    parser.add_argument("--realtime", type=float, default=None,
+                        help="real-time ratio (1.0 = real time); omit to run as fast as possible")
+    args = parser.parse_args(argv)
+
+    op_mode = {name: code for code, name in MODE_NAMES.items()}[args.op_mode]
+    profile_type = S_CURVE if args.profile == "s-curve" else TRAPEZOID
+
+    options = dict(op_mode=op_mode, profile_type=profile_type,
+                   integrator=None if args.plant == "none" else args.plant, dt=args.dt,
+                   record=args.record, export=args.export,
+                   columns=args.columns, chunk=args.chunk, bitrate=args.bitrate, rpdo=args.rpdo,
+                   tpdo={key: value for key, value in (
+                       ("trans_type", args.tpdo_type),
+                       ("inhibit", None if args.inhibit is None else args.inhibit * 1e-3),
+                       ("event_timer", None if args.event_timer is None else args.event_timer * 1e-3),
+                   ) if value is not None})
+    if args.workers > 0:
+        from core.sharding import ShardedSimulator    # core.sharding は core.simulator を import する
+        sim = ShardedSimulator(args.axes, args.workers, args.period, args.mode, args.history,
+                               args.stats, **options)
+    else:
+        sim = Simulator(args.axes, args.period, args.mode, args.history, args.stats, **options)
+
+    with sim:
+        start = time.perf_counter()
+        sim.run(args.cycles, args.realtime)
+        elapsed = time.perf_counter() - start
+
+        print(f"{args.cycles} cycles / {args.axes} axes: "
+              f"sim {sim.sim_time:.3f} s, wall {elapsed:.3f} s "
+              f"({sim.sim_time / elapsed:.1f}x real time)")
+        for axis in sim.axes:
+            print(f"Axis {axis.node_id}: {axis.position:.0f}")
+        print(f"state digest: {sim.digest()}")
+        for exporter in sim.exporters:
+            exporter.close()
+            print(f"{exporter.path}: {exporter.written} frames ({exporter.dropped} dropped)")
+        if sim.rpdo is not None:
+            rx = sim.rpdo_rx
+            print(f"RPDO: {sim.rpdo.sent} sent, {rx.applied} applied, {rx.errors} errors")
+        if sim.bus_model is not None:
+            print(sim.bus_model.report())
+        if sim.stats is not None:
+            print(sim.stats.report())
+
+
+if __name__ == "__main__":
+    main()
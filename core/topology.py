@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import time
+
+try:
+    import yaml
+except ImportError:     # PyYAML が無ければ JSON だけ読める
+    yaml = None
+
+from core.bus_model import DEFAULT_BITRATE
+from core.plant import INTEGRATORS
+from core.profile import MODE_NAMES, S_CURVE, TRAPEZOID
+from core.scheduler import wait_until
+from core.simulator import Simulator
+
+
+class Segment:
+    """1本の CAN ライン（専用の仮想チャネル・Network・SYNC・ノード・BusModel）"""
+
+    def __init__(self, name, sim, divisor=1):
+        self.name = name
+        self.sim = sim
+        self.divisor = divisor      # 基本周期の何回に1回 SYNC を出すか
+
+    @property
+    def bus(self):
+        return self.sim.bus_model
+
+    def step(self):
+        self.sim.step()
+
+    def close(self):
+        self.sim.close()
+
+
+class Topology:
+    """複数の CAN ラインを1つのスケジューラで回す
+
+    ラインごとに仮想チャネルが別なので、同じノード ID を別のラインで使ってよい。
+    基本周期は一番短い SYNC 周期で、各ラインはその整数倍の周期で進む。
+    各ラインのバスは BusModel（帯域・調停）で、使用率と PDO の遅れを report() で出す。
+
+    設定（JSON / YAML）の例:
+
+        {"period": 0.01,
+         "segments": [
+           {"name": "line1", "axes": 20, "bitrate": 1000000},
+           {"name": "line2", "node_ids": [1, 2, 3, 10], "period": 0.02,
+            "op_mode": "pp", "plant": "rk4"}]}
+
+    segment のキー: name, channel（既定は name）, axes か node_ids, bitrate, period,
+    mode, op_mode, profile, plant, dt, history, record, export, columns, chunk, workers,
+    rpdo（false なら目標値を RPDO で送らない）。
+    """
+
+    def __init__(self, segments, period):
+        names = [segment.name for segment in segments]
+        if len(set(names)) != len(names):
+            raise ValueError(f"segment names must be unique, got {names}")
+        channels = [segment.sim.channel for segment in segments]
+        if len(set(channels)) != len(channels):
+            raise ValueError(f"segment channels must be unique, got {channels}")
+
+        self.segments = segments
+        self.period = period    # 基本周期 [s]
+        self.tick = 0
+
+    @classmethod
+    def from_config(cls, config, stats=False):
+        specs = config.get("segments")
+        if not specs:
+            raise ValueError("topology needs at least one segment")
+        periods = [spec.get("period", config.get("period", 0.02)) for spec in specs]
+        period = min(periods)
+
+        segments = []
+        try:
+            for i, (spec, seg_period) in enumerate(zip(specs, periods)):
+                divisor = round(seg_period / period)
+                if abs(divisor * period - seg_period) > 1e-9:
+                    raise ValueError(f"segment period {seg_period} is not a multiple of {period}")
+                name = spec.get("name", f"seg{i}")
+                segments.append(Segment(name, _build_sim(spec, name, seg_period, stats), divisor))
+            return cls(segments, period)
+        except Exception:
+            for segment in segments:
+                segment.close()
+            raise
+
+    @classmethod
+    def load(cls, path, stats=False):
+        """JSON か YAML（.yaml / .yml、PyYAML が必要）の設定ファイルから作る"""
+        with open(path) as fp:
+            if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+                if yaml is None:
+                    raise ImportError("PyYAML is required to read YAML topologies")
+                config = yaml.safe_load(fp)
+            else:
+                config = json.load(fp)
+        return cls.from_config(config, stats)
+
+    @property
+    def sim_time(self):
+        return self.tick * self.period
+
+    def step(self):
+        """基本周期1回分進める（周期が来たラインだけ SYNC を出す）"""
+        self.tick += 1
+        for segment in self.segments:
+            if self.tick % segment.divisor == 0:
+                segment.step()
+
+    def run(self, cycles, realtime=None):
+        """基本周期 cycles 回分進める（realtime は Simulator.run と同じ）"""
+        if realtime is None:
+            self._set_stats_period(None)        # 待たずに回すので目標の周期が無い（ジッタは測らない）
+            for _ in range(cycles):
+                self.step()
+            return
+
+        interval = self.period / realtime
+        self._set_stats_period(interval)    # ジッタは実時間の周期に対して測る
+        deadline = time.perf_counter()
+        for _ in range(cycles):
+            self.step()
+            deadline += interval
+            wait_until(deadline)
+
+    def _set_stats_period(self, interval):
+        # 各ラインは基本周期の divisor 回に1回進むので、そのラインの実時間の周期にする
+        for segment in self.segments:
+            stats = segment.sim.stats
+            if stats is not None:
+                stats.period = None if interval is None else interval * segment.divisor
+
+    def report(self):
+        """ラインごとのノード数・フレーム数・バス使用率・PDO の最大遅れ
+
+        offered は送ろうとしたビット数の平均（帯域を超えると 100% を超える）、carried は実際に
+        送った時間の平均、peak は1周期の最大（carried と peak は 100% まで）。
+        """
+        lines = [f"{'segment':<12}{'channel':<12}{'kbit/s':>7}{'nodes':>6}{'frames':>10}"
+                 f"{'offered[%]':>11}{'carried[%]':>11}{'peak[%]':>9}{'deferred':>10}{'pdo[us]':>10}"]
+        for segment in self.segments:
+            sim, bus = segment.sim, segment.bus
+            lines.append(f"{segment.name:<12}{str(sim.channel):<12}{bus.bitrate // 1000:>7}"
+                         f"{len(sim.axes):>6}{bus.frames:>10}"
+                         f"{bus.average_load(sim.sim_time) * 100:>11.1f}{bus.carried_load() * 100:>11.1f}"
+                         f"{bus.peak_load * 100:>9.1f}"
+                         f"{bus.deferred:>10}{bus.worst_pdo_latency() * 1e6:>10.0f}")
+        return "\n".join(lines)
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _build_sim(spec, name, period, stats):
+    """segment の設定から Simulator（workers があれば ShardedSimulator）を作る"""
+    if "node_ids" in spec:
+        node_ids = spec["node_ids"]
+    else:
+        node_ids = range(1, spec.get("axes", 5) + 1)
+
+    op_modes = {mode: code for code, mode in MODE_NAMES.items()}
+    plant = spec.get("plant", "none")
+    if plant != "none" and plant not in INTEGRATORS:
+        raise ValueError(f"segment {name}: unknown plant integrator {plant!r}")
+    options = dict(
+        op_mode=op_modes[spec.get("op_mode", "csp")],
+        profile_type=S_CURVE if spec.get("profile", "trapezoid") == "s-curve" else TRAPEZOID,
+        integrator=None if plant == "none" else plant,
+        dt=spec.get("dt", 0.001),
+        record=spec.get("record"),
+        export=spec.get("export", ()),
+        columns=spec.get("columns"),
+        chunk=spec.get("chunk", 1000),
+        channel=spec.get("channel", name),
+        node_ids=node_ids,
+        bitrate=spec.get("bitrate", DEFAULT_BITRATE),
+        rpdo=spec.get("rpdo", True),
+    )
+    mode = spec.get("mode", "sin")
+    history = spec.get("history", 10000)
+
+    workers = spec.get("workers", 0)
+    if workers > 0:
+        from core.sharding import ShardedSimulator      # core.sharding は core.simulator を import する
+        return ShardedSimulator(workers=workers, period=period, mode=mode, history=history,
+                                stats=stats, forward=True, **options)
+    return Simulator(period=period, mode=mode, history=history, stats=stats, **options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several CAN lines from a topology file")
+    parser.add_argument("config", help="topology file (.json, or .yaml / .yml with PyYAML)")
+    parser.add_argument("--cycles", type=int, default=1000, help="number of base periods")
+    parser.add_argument("--stats", action="store_true", help="print per-segment latency stats")
+    parser.add_argument("--realtime", type=float, default=None,
+                        help="real-time ratio (1.0 = real time); omit to run as fast as possible")
+    args = parser.parse_args(argv)
+
+    with Topology.load(args.config, args.stats) as topology:
+        start = time.perf_counter()
+        topology.run(args.cycles, args.realtime)
+        elapsed = time.perf_counter() - start
+
+        n_nodes = sum(len(segment.sim.axes) for segment in topology.segments)
+        print(f"{args.cycles} cycles / {len(topology.segments)} segments / {n_nodes} nodes: "
+              f"sim {topology.sim_time:.3f} s, wall {elapsed:.3f} s "
+              f"({topology.sim_time / elapsed:.1f}x real time)")
+        print(topology.report())
+        for segment in topology.segments:
+            print(f"{segment.name} state digest: {segment.sim.digest()}")
+            if segment.sim.stats is not None:
+                print(segment.sim.stats.report())
+
+
+if __name__ == "__main__":
+    main()
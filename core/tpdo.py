@@ -0,0 +1,198 @@
+import functools
+
+import canopen
+import numpy as np
+
+# 0x1800〜0x1803 sub2（送信タイプ）
+TRANS_SYNC_ACYCLIC = 0          # SYNC のとき、値が変わっていれば送る
+TRANS_SYNC_MAX = 240            # 1〜240: n 回目の SYNC ごとに送る
+TRANS_RTR_SYNC = 252            # RTR のみ（このシミュレータでは送らない）
+TRANS_RTR_EVENT = 253
+TRANS_EVENT_MANUFACTURER = 254  # イベント駆動（値が変わったとき / event timer）
+TRANS_EVENT_PROFILE = 255
+
+DEFAULT_TRANS_TYPE = 1          # 0x1800 が無い TPDO は毎 SYNC 送る（今までどおり）
+
+COB_ID_INVALID = 0x80000000     # 0x1800 sub1 の bit 31 が立っていたら PDO は無効
+
+
+class _Group:
+    """TPDO 番号とマッピング（OdStore の列）が同じ軸の集まり（まとめて判定する）"""
+
+    def __init__(self, pdo_num, layouts, values, columns):
+        self.pdo_num = pdo_num
+        self.layouts = layouts
+        self.values = values        # OdStore.values（columns が None なら使わない）
+        self.columns = columns
+        n = len(layouts)
+        self.rows = np.array([layout.variables[0].row for layout in layouts]) if columns is not None else None
+
+        # 通信パラメータ（軸ごと）
+        self.trans_type = np.full(n, DEFAULT_TRANS_TYPE, dtype=np.int64)
+        self.inhibit = np.zeros(n, dtype=np.float64)        # [s]
+        self.event_timer = np.zeros(n, dtype=np.float64)    # [s]（0 なら使わない）
+        self.valid = np.ones(n, dtype=bool)
+
+        # 最後に送った値と時刻（まだ送っていない軸は変化ありとみなす）
+        self.sent = np.zeros((n, len(columns)), dtype=np.int64) if columns is not None else [None] * n
+        self.unsent = np.ones(n, dtype=bool)
+        self.last_sent = np.full(n, -np.inf)
+
+    def changed(self):
+        """(変化ありの bool 配列, 今の値)"""
+        if self.columns is None:
+            # OdStore に無い変数を含むマッピングは詰めてから比べる
+            current = [bytes(layout.pack_od().data) for layout in self.layouts]
+            return np.array([c != s for c, s in zip(current, self.sent)]) | self.unsent, current
+        current = self.values[self.rows[:, None], self.columns]
+        return (current != self.sent).any(axis=1) | self.unsent, current
+
+
+class TpdoScheduler:
+    """全軸の TPDO を送信タイプ（0x1800〜0x1803）に従って送る
+
+    送信タイプ:
+      0       … SYNC のとき、マッピングした値が変わっていれば送る
+      1〜240  … n 回目の SYNC ごとに送る
+      252/253 … RTR のみ（送らない）
+      254/255 … 値が変わったとき（inhibit time 以上あけて）と event timer ごとに送る
+    通信パラメータは各軸の OD（sub1 の bit 31、sub2、sub3 = inhibit [100 µs]、
+    sub5 = event timer [ms]）から読み、SDO で書き換えられたら次の周期に読み直す。
+    configure() で全軸まとめて上書きもできる。
+
+    変化の判定は TPDO 番号・マッピングごとに全軸分を OdStore の配列でまとめて行い、
+    送らない TPDO は詰めもしない（止まっている軸はほぼ何もしない）。
+    """
+
+    def __init__(self, axes):
+        self.axes = list(axes)
+        self.sync_count = 0
+        self.sent = 0           # 送ったフレーム数
+        self.skipped = 0        # 送らなかった TPDO の数
+        self._overrides = {}    # pdo_num（None は全部）→ configure() の値
+        self._written = {}      # (id(node), index, subindex) → SDO で書かれた値（data_store に入る前から使う）
+        self._generation = 0    # 設定が変わるたびに増える
+        self._built = None      # _groups を作ったときの _generation
+        self._groups = None
+        self._hooked = set()
+
+    def invalidate(self):
+        """マッピングや通信パラメータが変わったので次の周期に組み直す"""
+        self._generation += 1
+
+    def configure(self, pdo_num=None, trans_type=None, inhibit=None, event_timer=None):
+        """全軸の TPDO の送信タイプ・inhibit time [s]・event timer [s] を上書きする（pdo_num=None なら全部）"""
+        if trans_type is not None and not 0 <= trans_type <= 255:
+            raise ValueError(f"transmission type must be 0..255, got {trans_type}")
+        override = self._overrides.setdefault(pdo_num, {})
+        for key, value in (("trans_type", trans_type), ("inhibit", inhibit), ("event_timer", event_timer)):
+            if value is not None:
+                override[key] = value
+        self.invalidate()
+
+    def on_sync(self, t, send):
+        """SYNC 1回分。送る TPDO だけ詰めて send(msg) する（t は今の時刻 [s]）"""
+        # 組み直している間に invalidate() されても、次の SYNC でもう一度組み直す
+        generation = self._generation
+        if generation != self._built:
+            self._groups = self._build()
+            self._built = generation
+        self.sync_count += 1
+        sync_count = self.sync_count
+
+        for group in self._groups:
+            changed, current = group.changed()
+            tt = group.trans_type
+            cyclic = (tt >= 1) & (tt <= TRANS_SYNC_MAX) & (sync_count % np.maximum(tt, 1) == 0)
+            acyclic = (tt == TRANS_SYNC_ACYCLIC) & changed
+            elapsed = t - group.last_sent
+            event = ((tt >= TRANS_EVENT_MANUFACTURER)
+                     & (changed | ((group.event_timer > 0) & (elapsed >= group.event_timer)))
+                     & (elapsed >= group.inhibit))
+            due = np.flatnonzero((cyclic | acyclic | event) & group.valid)
+
+            layouts = group.layouts
+            for i in due.tolist():
+                send(layouts[i].pack_od())
+            if len(due):
+                if group.columns is not None:
+                    group.sent[due] = current[due]
+                else:
+                    for i in due.tolist():
+                        group.sent[i] = current[i]
+                group.last_sent[due] = t
+                group.unsent[due] = False
+            self.sent += len(due)
+            self.skipped += len(layouts) - len(due)
+
+    def _build(self):
+        groups = {}
+        for axis in self.axes:
+            axis.tpdo_schedule = self
+            node = axis.node
+            if isinstance(node, canopen.LocalNode) and id(node) not in self._hooked:
+                node.add_write_callback(functools.partial(self._on_write, id(node)))
+                self._hooked.add(id(node))
+
+            for pdo_num, layout in axis.tpdo_pdos():
+                if layout.columns is not None:
+                    store = layout.variables[0].store
+                    key = (pdo_num, tuple(layout.columns.tolist()), id(store))
+                    entry = groups.setdefault(key, (pdo_num, [], [], store.values, layout.columns))
+                else:
+                    entry = groups.setdefault((pdo_num, None, id(axis)), (pdo_num, [], [], None, None))
+                entry[1].append(layout)
+                entry[2].append(axis)
+
+        result = []
+        for pdo_num, layouts, axes, values, columns in groups.values():
+            group = _Group(pdo_num, layouts, values, columns)
+            for i, axis in enumerate(axes):
+                params = self._params(axis.node, pdo_num)
+                group.trans_type[i] = params["trans_type"]
+                group.inhibit[i] = params["inhibit"]
+                group.event_timer[i] = params["event_timer"]
+                group.valid[i] = params["valid"]
+            result.append(group)
+        return result
+
+    def _params(self, node, pdo_num):
+        index = 0x1800 + pdo_num - 1
+        trans_type = self._param(node, index, 2)
+        inhibit = self._param(node, index, 3)
+        event_timer = self._param(node, index, 5)
+        cob_id = self._param(node, index, 1)
+        params = {
+            "trans_type": DEFAULT_TRANS_TYPE if trans_type is None else trans_type,
+            "inhibit": (inhibit or 0) * 100e-6,
+            "event_timer": (event_timer or 0) * 1e-3,
+            "valid": cob_id is None or not cob_id & COB_ID_INVALID,
+        }
+        for key in (None, pdo_num):
+            params.update(self._overrides.get(key, {}))
+        return params
+
+    def _param(self, node, index, subindex):
+        written = self._written.get((id(node), index, subindex))
+        return written if written is not None else read_param(node, index, subindex)
+
+    def _on_write(self, node_key, index, subindex, od, data):
+        # SDO で 0x1800〜0x1803 が書かれたら組み直す（Notifier のスレッドから、
+        # data_store に入る前に呼ばれるので、書かれた値は _written から使う）
+        if 0x1800 <= index <= 0x1803:
+            self._written[(node_key, index, subindex)] = od.decode_raw(data)
+            self.invalidate()
+
+
+def read_param(node, index, subindex):
+    """通信パラメータを読む（無ければ None。LocalNode なら SDO で書かれた値を優先する）"""
+    od = node.object_dictionary
+    if index not in od or subindex not in od[index]:
+        return None
+    var = od[index][subindex]
+    if isinstance(node, canopen.LocalNode):
+        data = node.data_store.get(index, {}).get(subindex)
+        if data is not None:
+            return var.decode_raw(data)
+    value = var.value if var.value is not None else var.default
+    return None if value is None else int(value)
@@ -0,0 +1,335 @@
+import argparse
+import os
+import struct
+import time
+
+import can
+import numpy as np
+
+from core.scheduler import wait_until
+
+# ファイル = ヘッダ（16 byte）+ 固定長レコードの列。np.memmap でそのまま開ける
+MAGIC_FRAMES = b"CANSIMFR"
+MAGIC_STATE = b"CANSIMST"
+MAGIC_PAYLOAD = b"CANSIMPL"
+TRACE_VERSION = 1
+HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("record_size", "<u4")])
+
+FRAMES_SUFFIX = ".frames"
+STATE_SUFFIX = ".state"
+PAYLOAD_SUFFIX = ".payload"
+
+# CAN フレーム1枚（24 byte）。データが 8 byte を超えるフレームは FLAG_PAYLOAD を立て、
+# data に .payload ファイル内の位置（<u8）を入れて中身はそちらに書く
+FRAME_DTYPE = np.dtype([
+    ("time", "<f8"),        # 時刻 [s]（TraceRecorder の clock）
+    ("cob_id", "<u4"),
+    ("dlc", "u1"),          # データの長さ [byte]
+    ("flags", "u1"),        # FLAG_*
+    ("pad", "<u2"),
+    ("data", "u1", 8),
+])
+
+# FRAME_DTYPE と同じ並び（1枚ずつ書くときは struct で詰める）
+FRAME_STRUCT = struct.Struct("<dIBBH8s")
+
+REPLAY_CHUNK = 4096     # 再生時に一度に読むフレーム数
+
+FLAG_EXTENDED = 0x01
+FLAG_REMOTE = 0x02
+FLAG_ERROR = 0x04
+FLAG_PAYLOAD = 0x08     # データは .payload ファイルにある
+
+MAX_DATA = 64           # 記録できるデータの最大長（CAN FD。複数軸をまとめた PDO など）
+_OFFSET = struct.Struct("<Q")
+PAYLOAD_DTYPE = np.dtype("u1")  # .payload はヘッダ + データを続けたもの
+
+# 1周期・1軸分の状態（32 byte）
+STATE_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("tick", "<u4"),
+    ("node_id", "u1"),
+    ("pad", "u1"),
+    ("statusword", "<u2"),
+    ("position", "<i4"),
+    ("velocity", "<i4"),
+    ("target", "<i4"),
+    ("torque", "<i2"),
+    ("mode", "i1"),
+    ("pad2", "u1"),
+])
+
+# STATE_DTYPE のフィールド → OD の index
+STATE_OBJECTS = {
+    "statusword": 0x6041,
+    "position": 0x6064,
+    "velocity": 0x606C,
+    "target": 0x607A,
+    "torque": 0x6077,
+    "mode": 0x6061,
+}
+
+
+class BusTap:
+    """bus.send() を横取りして sinks に渡してから本物の bus に送るラッパー
+
+    network.bus と差し替えて使う。send 以外の属性は元の bus のものを返す。
+    sinks は msg を1つ受け取る callable（送信前に呼ぶので msg を使い回しても良い）。
+    """
+
+    def __init__(self, bus, sinks=()):
+        self.bus = bus
+        self.sinks = list(sinks)
+
+    def send(self, msg, timeout=None):
+        for sink in self.sinks:
+            sink(msg)
+        self.bus.send(msg, timeout)
+
+    def __getattr__(self, name):
+        return getattr(self.bus, name)
+
+
+def tap_network(network):
+    """network.bus を BusTap にして返す（すでに BusTap ならそのまま）"""
+    if not isinstance(network.bus, BusTap):
+        network.bus = BusTap(network.bus)
+    return network.bus
+
+
+def _write_header(fp, magic, dtype):
+    header = np.zeros(1, dtype=HEADER)
+    header["magic"] = magic
+    header["version"] = TRACE_VERSION
+    header["record_size"] = dtype.itemsize
+    fp.write(header.tobytes())
+
+
+def _open_records(path, magic, dtype, mode):
+    """記録ファイルを np.memmap で開く（ヘッダを確認する）"""
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    if len(header) != 1 or header["magic"][0] != magic:
+        raise ValueError(f"{path}: not a trace file")
+    if header["version"][0] != TRACE_VERSION or header["record_size"][0] != dtype.itemsize:
+        raise ValueError(f"{path}: unsupported trace version {header['version'][0]}")
+
+    count = (os.path.getsize(path) - HEADER.itemsize) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, offset=HEADER.itemsize, shape=(count,))
+
+
+class TraceRecorder:
+    """CAN フレームと周期ごとの軸状態を追記専用のバイナリファイルに書く
+
+    path + ".frames" にフレーム、path + ".state" に状態を固定長レコードで書く。
+    データが 8 byte を超えるフレーム（MAX_DATA まで）の中身だけは path + ".payload" に続けて書く
+    （そういうフレームが無ければ作らない）。
+    レコードは buffer_size 件ずつまとめて書くので、何時間回してもメモリは増えない。
+    clock は時刻 [s] を返す callable（None なら記録開始からの実時間）。
+    記録と状態の書き込みは同じスレッドから行う。
+    """
+
+    def __init__(self, path, buffer_size=4096, clock=None):
+        self.path = path
+        self.frames_path = path + FRAMES_SUFFIX
+        self.state_path = path + STATE_SUFFIX
+        self.payload_path = path + PAYLOAD_SUFFIX
+
+        self._frames_fp = open(self.frames_path, "wb")
+        self._state_fp = open(self.state_path, "wb")
+        _write_header(self._frames_fp, MAGIC_FRAMES, FRAME_DTYPE)
+        _write_header(self._state_fp, MAGIC_STATE, STATE_DTYPE)
+
+        self._frames = bytearray(buffer_size * FRAME_STRUCT.size)
+        self._frames_end = 0
+        self._state = None          # 軸数がわかってから確保する
+        self._n_state = 0
+        self._payload_fp = None     # 8 byte を超えるフレームが来たら開く
+        self._payload_end = 0
+
+        self.frames_written = 0
+        self.states_written = 0
+        if clock is None:
+            start = time.perf_counter()
+            clock = lambda: time.perf_counter() - start
+        self.clock = clock
+        self._tap = None
+
+    def attach(self, network):
+        """network.bus.send() で送るフレームを記録する"""
+        self._tap = tap_network(network)
+        self._tap.sinks.append(self.record_frame)
+
+    def detach(self):
+        if self._tap is not None and self.record_frame in self._tap.sinks:
+            self._tap.sinks.remove(self.record_frame)
+        self._tap = None
+
+    def record_frame(self, msg):
+        if self._frames_end == len(self._frames):
+            self._flush_frames()
+        flags = ((FLAG_EXTENDED if msg.is_extended_id else 0)
+                 | (FLAG_REMOTE if msg.is_remote_frame else 0)
+                 | (FLAG_ERROR if msg.is_error_frame else 0))
+        data = bytes(msg.data)
+        if len(data) > 8:
+            data = self._record_payload(msg.arbitration_id, data)
+            flags |= FLAG_PAYLOAD
+        FRAME_STRUCT.pack_into(self._frames, self._frames_end, self.clock(),
+                               msg.arbitration_id, msg.dlc, flags, 0, data)
+        self._frames_end += FRAME_STRUCT.size
+
+    def _record_payload(self, cob_id, data):
+        """.payload に data を書き、レコードの data に入れる位置を返す"""
+        if len(data) > MAX_DATA:
+            raise ValueError(f"frame 0x{cob_id:X}: {len(data)} bytes of data, "
+                             f"at most {MAX_DATA} can be recorded")
+        if self._payload_fp is None:
+            self._payload_fp = open(self.payload_path, "wb")
+            _write_header(self._payload_fp, MAGIC_PAYLOAD, PAYLOAD_DTYPE)
+        offset = self._payload_end
+        self._payload_fp.write(data)
+        self._payload_end += len(data)
+        return _OFFSET.pack(offset)
+
+    def record_frames(self, frames):
+        """FRAME_DTYPE の配列をまとめて書く（別プロセスで集めたフレームなど）"""
+        self._flush_frames()
+        self._frames_fp.write(np.ascontiguousarray(frames, dtype=FRAME_DTYPE).tobytes())
+        self.frames_written += len(frames)
+
+    def record_state(self, tick, store, node_ids):
+        """OdStore の全ノード分の状態を1周期分書く"""
+        n = len(node_ids)
+        if self._state is None:
+            self._state = np.zeros(max(len(self._frames) // FRAME_STRUCT.size, n), dtype=STATE_DTYPE)
+        if self._n_state + n > len(self._state):
+            self._flush_state()
+
+        recs = self._state[self._n_state:self._n_state + n]
+        recs["time"] = self.clock()
+        recs["tick"] = tick
+        recs["node_id"] = node_ids
+        for field, index in STATE_OBJECTS.items():
+            recs[field] = store.column(index)
+        self._n_state += n
+
+    def flush(self):
+        self._flush_frames()
+        self._flush_state()
+        self._frames_fp.flush()
+        self._state_fp.flush()
+        if self._payload_fp is not None:
+            self._payload_fp.flush()
+
+    def close(self):
+        self.detach()
+        if self._frames_fp.closed:
+            return
+        self.flush()
+        self._frames_fp.close()
+        self._state_fp.close()
+        if self._payload_fp is not None:
+            self._payload_fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _flush_frames(self):
+        self._frames_fp.write(memoryview(self._frames)[:self._frames_end])
+        self.frames_written += self._frames_end // FRAME_STRUCT.size
+        self._frames_end = 0
+
+    def _flush_state(self):
+        if self._state is None:
+            return
+        self._state_fp.write(self._state[:self._n_state].tobytes())
+        self.states_written += self._n_state
+        self._n_state = 0
+
+
+class TraceReplayer:
+    """TraceRecorder で書いたファイルを読む・バスに流し直す
+
+    frames / states は np.memmap なので、大きなファイルでも必要な所だけ読む。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = _open_records(path + FRAMES_SUFFIX, MAGIC_FRAMES, FRAME_DTYPE, "r")
+        state_path = path + STATE_SUFFIX
+        self.states = (_open_records(state_path, MAGIC_STATE, STATE_DTYPE, "r")
+                       if os.path.exists(state_path) else np.zeros(0, dtype=STATE_DTYPE))
+        payload_path = path + PAYLOAD_SUFFIX
+        self.payload = (_open_records(payload_path, MAGIC_PAYLOAD, PAYLOAD_DTYPE, "r")
+                        if os.path.exists(payload_path) else np.zeros(0, dtype=PAYLOAD_DTYPE))
+
+    def messages(self, start=0, stop=None):
+        """記録したフレームを can.Message にして順に返す"""
+        frames = self.frames[start:stop]
+        for i in range(0, len(frames), REPLAY_CHUNK):
+            chunk = frames[i:i + REPLAY_CHUNK].tobytes()
+            for t, cob_id, dlc, flags, _, data in FRAME_STRUCT.iter_unpack(chunk):
+                if flags & FLAG_PAYLOAD:
+                    offset, = _OFFSET.unpack(data)
+                    data = self.payload[offset:offset + dlc].tobytes()
+                yield can.Message(
+                    timestamp=t,
+                    arbitration_id=cob_id,
+                    is_extended_id=bool(flags & FLAG_EXTENDED),
+                    is_remote_frame=bool(flags & FLAG_REMOTE),
+                    is_error_frame=bool(flags & FLAG_ERROR),
+                    dlc=dlc,
+                    data=data[:dlc],
+                )
+
+    def replay(self, bus, speed=1.0, start=0, stop=None):
+        """bus にフレームを送り直す。speed=1.0 で記録と同じ間隔、None なら待たずに全速
+
+        送ったフレーム数を返す。
+        """
+        sent = 0
+        origin = None
+        for msg in self.messages(start, stop):
+            if speed is not None:
+                if origin is None:
+                    origin = time.perf_counter() - msg.timestamp / speed
+                wait_until(origin + msg.timestamp / speed)
+            bus.send(msg)
+            sent += 1
+        return sent
+
+    def state(self, tick):
+        """tick 周期目の全軸分の状態レコード"""
+        return self.states[self.states["tick"] == tick]
+
+    def node_state(self, node_id):
+        """node_id の全周期分の状態レコード"""
+        return self.states[self.states["node_id"] == node_id]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded CAN trace onto a virtual bus")
+    parser.add_argument("path", help="trace path (without .frames / .state)")
+    parser.add_argument("--speed", default="1",
+                        help="replay speed (1 = as recorded, 'max' = as fast as possible)")
+    parser.add_argument("--channel", default=None, help="python-can virtual channel")
+    args = parser.parse_args(argv)
+
+    replayer = TraceReplayer(args.path)
+    speed = None if args.speed == "max" else float(args.speed)
+
+    with can.interface.Bus(interface="virtual", channel=args.channel) as bus:
+        start = time.perf_counter()
+        sent = replayer.replay(bus, speed)
+        elapsed = time.perf_counter() - start
+
+    print(f"{sent} frames / {len(replayer.states)} state records replayed in {elapsed:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,84 @@
 import math
 
+import numpy as np
+
 class TrajectoryGenerator:
     def __init__(self):
         self.mode = "sin"  # "sin", "circle", "line", "lissajous", "step"
         self.amplitude = 500    #振幅
         self.period = 200       #周期
+        self.n_axes = 5         #軸数
+        self.phase = 0.0        #軸ごとの位相ずれ [rad]（軸 i は i * phase ずれる）
 
     def generate(self, t):
        # t = frame / 50.0
 
-        if self.mode == "sin":
+        if self.mode in ("sin", "circle"):
+            if self.phase:
+                return [int(self.amplitude * math.sin(2 * math.pi * t / self.period + i * self.phase))
+                        for i in range(self.n_axes)]
             val = int(self.amplitude * math.sin(2 * math.pi * t / self.period))
-            return [val] * 5
+            return [val] * self.n_axes
+
         if self.mode == "triangle":
+            if self.phase:
+                shift = self.period * self.phase / (2 * math.pi)
+                return [self.triangle(t + i * shift, self.amplitude, self.period)
+                        for i in range(self.n_axes)]
             val = self.triangle(t, self.amplitude, self.period)
-            return [val] * 5
-        
-        if self.mode == "circle":
-            val = int(self.amplitude * math.sin(2 * math.pi * t / self.period))
-            return [val] * 5
+            return [val] * self.n_axes
 
         if self.mode == "line":
             v = int((t % 4 - 2) * 500)
-            return [v] * 5
+            return [v] * self.n_axes
 
         if self.mode == "lissajous":
             x = int(1000 * math.sin(t))
             y = int(1000 * math.sin(2*t))
-            return [x, y, 0, 0, 0]
+            return ([x, y] + [0] * self.n_axes)[:self.n_axes]
 
         if self.mode == "step":
             step = 1000 if (t // 100) % 2 == 0 else -1000
-            return [step]  * 5
+            return [step] * self.n_axes
+
+        return [0] * self.n_axes
+
+    def generate_block(self, t_start, n_samples, n_axes=None):
+        """t_start から n_samples 点分の目標値を (n_samples, n_axes) の int32 配列で返す
+
+        generate(t_start), generate(t_start + 1), ... を縦に並べたものと同じ。
+        """
+        if n_axes is None:
+            n_axes = self.n_axes
+
+        t = (t_start + np.arange(n_samples, dtype=np.float64))[:, None]
+        axis = np.arange(n_axes, dtype=np.float64)[None, :]
+        out = np.zeros((n_samples, n_axes), dtype=np.int32)
+
+        if self.mode in ("sin", "circle"):
+            val = self.amplitude * np.sin(2 * np.pi * t / self.period + axis * self.phase)
+            out[:] = val
+
+        elif self.mode == "triangle":
+            shift = self.period * self.phase / (2 * math.pi)
+            saw = ((t + axis * shift) % self.period) / self.period
+            tri = 2 * np.abs(2 * saw - 1) - 1
+            out[:] = tri * self.amplitude
+
+        elif self.mode == "line":
+            out[:] = (t % 4 - 2) * 500
+
+        elif self.mode == "lissajous":
+            if n_axes > 0:
+                out[:, 0] = 1000 * np.sin(t[:, 0])
+            if n_axes > 1:
+                out[:, 1] = 1000 * np.sin(2 * t[:, 0])
+
+        elif self.mode == "step":
+            out[:] = np.where((t // 100) % 2 == 0, 1000, -1000)
+
+        return out
 
-        return [0] * 5
-    
     def triangle(self, t, amplitude=500, period=200):
         # 0〜1 の sawtooth を作る
         saw = (t % period) / period  # 0〜1
@@ -1,8 +1,15 @@
 import can
 import canopen
+import itertools
 import math
 import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
+
+from core.history import HistoryBuffer
+from core.receiver import start_receiver
+from core.dispatch import CobIdTable
+from core.pdo import PdoLayout, tpdo_cob_id
+from core.plot import BlitPlotter
+from core.eds import load_od
 
 # ============================================
 # Trajectory Generator（軌道生成器）
@@ -96,25 +103,9 @@ rx_bus = can.interface.Bus(bustype='virtual', receive_own_messages=True)
 # 5軸ノード
 axes = []
 
-from canopen.objectdictionary import Variable, ObjectDictionary
-
 for nid in range(1, 6):
-    od = ObjectDictionary()
-
-    # 6064h Actual Position
-    var_6064 = Variable("Position actual value", 0x6064, 0)
-    var_6064.data_type = 0x0007 # INTEGER32
-    od[0x6064] = var_6064
-    #od.add_object(var_6064)
-
-    # 607Ah Target Position
-    var_607A = Variable("Target position", 0x607A, 0)
-    var_607A.data_type = 0x0007 # INTEGER32
-    od[0x607A] = var_607A
-
-    #od.add_object(var_607A)
-
-    node = network.add_node(nid, od)
+    # OD は cia402.eds から（解析は1回だけ、ノードごとに複製）
+    node = network.add_node(nid, load_od(node_id=nid))
 
     # ★ Object Dictionary を手動で追加
     #node.sdo.add_variable(0x6064, 0, 'Position actual value', 'i32')
@@ -125,8 +116,16 @@ for nid in range(1, 6):
 # 軌道生成器
 traj = TrajectoryGenerator()
 
-# 履歴
-history = {i: [] for i in range(1, 6)}
+# 履歴（固定長リングバッファ）
+history = HistoryBuffer(range(1, 6), capacity=200)
+
+# PDO 受信（バックグラウンド）
+# 各軸の TPDO1 = Actual Position（INTEGER32）
+cob_table = CobIdTable()
+for nid in range(1, 6):
+    cob_table.add_tpdo(nid, 1, PdoLayout(tpdo_cob_id(nid, 1), [0x6064], [0x0004]))
+
+notifier, receiver = start_receiver(rx_bus, history, cob_table)
 
 # ============================================
 # SYNC 送信
@@ -145,16 +144,7 @@ def update(frame):
     for axis, target in zip(axes, targets):
         #axis.node.sdo[0x607A].raw = target
         axis.node.object_dictionary[0x607A].value = target
-    # ② PDO受信
-    while True:
-        msg = rx_bus.recv(timeout=0.001)
-        if msg is None:
-            break
-
-        if 0x180 <= msg.arbitration_id <= 0x185:
-            nid = msg.arbitration_id - 0x180
-            actual = int.from_bytes(msg.data[:4], 'little', signed=True)
-            history[nid].append(actual)
+    # ② PDO受信は receiver（Notifier スレッド）が history に書き込む
 
     # ③ SYNC送信
     send_sync()
@@ -163,18 +153,23 @@ def update(frame):
     for axis in axes:
         axis.on_sync()
 
-    # ⑤ グラフ更新
-    ax.clear()
-    for nid in range(1, 6):
-        ax.plot(history[nid][-200:], label=f"Axis {nid}")
-
-    ax.legend()
-    ax.set_ylim(-1500, 1500)
+    # ⑤ グラフ更新は表示タイマー（plotter.refresh）で行う
 
 
 # ============================================
 # グラフ描画
 # ============================================
 fig, ax = plt.subplots()
-ani = FuncAnimation(fig, update, interval=20)
+plotter = BlitPlotter(fig.canvas, ax, history, range(1, 6), window=200)
+
+# シミュレーションは 20ms、表示は約30Hz で別々に回す
+frames = itertools.count()
+sim_timer = fig.canvas.new_timer(interval=20)
+sim_timer.add_callback(lambda: update(next(frames)))
+sim_timer.start()
+
+display_timer = fig.canvas.new_timer(interval=33)
+display_timer.add_callback(plotter.refresh)
+display_timer.start()
+
 plt.show()
@@ -1,46 +1,77 @@
 import sys
+import time
+import can
 import canopen
 
 from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QVBoxLayout, QHBoxLayout, QPushButton, QComboBox,QLabel,QGroupBox
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QTimer, pyqtSignal
 from matplotlib.axis import Axis
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 from matplotlib.figure import Figure
 
 from core.trajectory import TrajectoryGenerator
 from core.axis import Axis
+from core.axis_bank import AxisBank
+from core.cia402 import CW_HALT, CW_QUICK_STOP, enable_controlword
+from core.history import HistoryBuffer
+from core.profile import CYCLIC_SYNC_POSITION
+from core.receiver import start_receiver
+from core.dispatch import CobIdTable
+from core.plot import BlitPlotter
+from core.scheduler import SimThread
+from core.instrumentation import CycleStats
+from core.eds import load_od
+from core.od_store import OdStore
+from core.rpdo import RpdoMapping, RpdoMaster, RpdoReceiver, loopback_send
+from core.pdo import compile_tpdo_map
+from core.tpdo import TpdoScheduler
+from core.trace import TraceRecorder
+from core.columns import SignalExporter
 
 class MainWindow(QMainWindow):
+    # シミュレーションスレッドの例外（GUI スレッドで受ける）
+    sim_failed = pyqtSignal(str)
+
     def __init__(self):
 
         # --- CANopen Network ---
         self.network = canopen.Network()
-        self.network.connect(bustype='virtual')
+        self.network.connect(interface='virtual')
 
         # 受信用バス
-        self.rx_bus = can.interface.Bus(bustype='virtual', receive_own_messages=True)
+        self.rx_bus = can.interface.Bus(interface='virtual', receive_own_messages=True)
 
-        # --- 5軸の履歴（グラフ用） ---
-        self.history = {i: [] for i in range(1, 6)}
+        # --- 5軸の履歴（グラフ用、固定長リングバッファ） ---
+        self.history = HistoryBuffer(range(1, 6), capacity=5000)
 
-        #② 5軸ノード生成（OD を手動追加）
+        #② 5軸ノード生成（OD は EDS から、解析は1回だけ）
         self.axes = []
+        self.bank = AxisBank(5)   # 5軸分の状態をまとめて持つ
 
         for nid in range(1, 6):
-            od = ObjectDictionary()
-
-            # 6064h Actual Position
-            var_6064 = Variable("Position actual value", 0x6064, 0)
-            var_6064.data_type = 0x0007
-            od[0x6064] = var_6064
-
-            # 607Ah Target Position
-            var_607A = Variable("Target position", 0x607A, 0)
-            var_607A.data_type = 0x0007
-            od[0x607A] = var_607A
-
-            node = self.network.add_node(nid, od)
-            self.axes.append(Axis(node, nid, self.network))
+            node = self.network.add_node(nid, load_od(node_id=nid))
+            self.axes.append(Axis(node, nid, self.network, self.bank, nid - 1))
+        self.tpdo = TpdoScheduler(self.axes)    # TPDO は 0x1800〜 の送信タイプに従って送る
+
+        # 軌道を毎周期そのまま送るので Cyclic Synchronous Position で動かす
+        self.bank.store.column(0x6060)[:] = CYCLIC_SYNC_POSITION
+
+        # マスタの目標値（0x607A / 0x6040）は setpoints に書き、network.bus から RPDO で送る
+        # （Rec 中は TraceRecorder / 書き出しにも載る。ドライブにはシミュレーションスレッドのまま渡す）
+        store = self.bank.store
+        self.setpoints = OdStore(5, store.objects, store.values.copy())
+        mapping = RpdoMapping(store, [axis.node for axis in self.axes])
+        self.rpdo = RpdoMaster(mapping)
+        self.rpdo_rx = RpdoReceiver(self.network, mapping)     # ドライブ側（SYNC の前にまとめて反映）
+        self.rpdo_send = loopback_send(self.network)
+
+        # PDO 受信はバックグラウンドスレッドでデコードして rx_history に書き込む
+        self.rx_history = HistoryBuffer(range(1, 6), capacity=5000)
+        # 周期の処理時間・SYNC ジッタの計測
+        self.stats = CycleStats(0.020)
+
+        self.notifier, self.receiver = start_receiver(
+            self.rx_bus, self.rx_history, self.build_cob_table(), self.stats)
 
         #③ 軌道生成器を追加
         self.traj = TrajectoryGenerator()
@@ -99,16 +130,10 @@ class MainWindow(QMainWindow):
 
 
 
-    # --- グラフ用ラインを作成 ---
-        self.lines = {}
-        for nid in range(1, 6):
-            line, = self.ax.plot([], [], color=self.colors[nid], label=f"Axis {nid}")
-            self.lines[nid] = line
-
-        self.ax.legend(loc="upper right")
-
-        # グリッド追加
-        self.ax.grid(True)
+    # --- グラフ（blitting、直近 1000 サンプルのスライド窓） ---
+        self.plotter = BlitPlotter(self.canvas, self.ax, self.history, range(1, 6),
+                                   window=1000, colors=self.colors)
+        self.lines = self.plotter.lines
 
         # 軌道モード選択
         self.combo = QComboBox()
@@ -123,21 +148,21 @@ class MainWindow(QMainWindow):
         self.stop_btn = QPushButton("Stop")
         self.reset_btn = QPushButton("Rset")
         self.estop_btn = QPushButton("E-Stop")
+        self.rec_btn = QPushButton("Rec")
+        self.rec_btn.setCheckable(True)
         btn_layout.addWidget(self.start_btn)
         btn_layout.addWidget(self.stop_btn)
         btn_layout.addWidget(self.reset_btn)
         btn_layout.addWidget(self.estop_btn)
+        btn_layout.addWidget(self.rec_btn)
 
         layout.addLayout(btn_layout)
 
-        # タイマー（10ms周期）
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_sim)
-        self.timer.start(20) # 20ms周期で update_sim を呼ぶ
         self.start_btn.clicked.connect(self.start_motion)
         self.stop_btn.clicked.connect(self.stop_motion)
         self.reset_btn.clicked.connect(self.reset_motion)
         self.estop_btn.clicked.connect(self.emergency_stop)
+        self.rec_btn.toggled.connect(self.toggle_record)
 
         # --- 5軸の現在位置表示ラベル ---
         self.pos_labels = []
@@ -151,34 +176,98 @@ class MainWindow(QMainWindow):
 
         layout.addLayout(pos_layout)
 
+        # --- 周期計測（p50/p99/max）表示 ---
+        self.stats_label = QLabel()
+        self.stats_label.setStyleSheet("font-family: monospace;")
+        layout.addWidget(self.stats_label)
+        self.display_count = 0
 
+        # 表示タイマー（約30Hz、シミュレーション周期とは別）
+        self.display_timer = QTimer()
+        self.display_timer.timeout.connect(self.refresh_display)
+        self.display_timer.start(33)
 
+        # シミュレーションは専用スレッドで 20ms 周期（描画やウィンドウ操作に引きずられない）
+        self.running = False
+        self.recorder = None    # Rec 中だけ TraceRecorder
+        self.signals = None     # Rec 中だけ SignalExporter
+        self.sim_failed.connect(self.on_sim_failed)
+        self.sim_thread = SimThread(self.update_sim, 0.020, stats=self.stats,
+                                    on_error=lambda exc: self.sim_failed.emit(repr(exc)))
+        self.sim_thread.start()
+
+
+    def closeEvent(self, event):
+        self.sim_thread.stop()
+        self._stop_record()
+        self.display_timer.stop()
+        self.notifier.stop()
+        self.rpdo_rx.close()
+        self.rx_bus.shutdown()
+        self.network.disconnect()
+        super().closeEvent(event)
+
+    def on_sim_failed(self, message):
+        # シミュレーションスレッドは止まっているので、記録はここで閉じる
+        self.sim_thread.join()
+        self._stop_record()
+        self.rec_btn.setChecked(False)
+        self.statusBar().showMessage(f"simulation stopped: {message}")
+
+    # --- ボタン等の操作はシミュレーションスレッドに渡して周期の頭で実行する ---
     def change_mode(self, mode):
-        self.traj.mode = mode
+        self.sim_thread.call(setattr, self.traj, "mode", mode)
 
     def start_motion(self):
-        self.running = True
+        self.sim_thread.call(setattr, self, "running", True)
 
     def stop_motion(self):
-        self.running = False
-        for axis in self.axes:
-            axis.slow_stop()
+        self.sim_thread.call(self._stop_motion)
 
     def reset_motion(self):
+        self.sim_thread.call(self._reset_motion)
+
+    def emergency_stop(self):
+        self.sim_thread.call(self._emergency_stop)
+
+    def toggle_record(self, on):
+        self.sim_thread.call(self._start_record if on else self._stop_record)
+
+    def _start_record(self):
+        # 送信フレームと周期ごとの状態を trace_日時.frames / .state に、
+        # 全軸の信号を trace_日時_signals/ に列ごとに書く
+        name = time.strftime("trace_%Y%m%d_%H%M%S")
+        self.recorder = TraceRecorder(name)
+        self.recorder.attach(self.network)
+        self.signals = SignalExporter(name + "_signals", [axis.node_id for axis in self.axes])
+
+    def _stop_record(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        if self.signals is not None:
+            self.signals.close()
+            self.signals = None
+
+    def _stop_motion(self):
+        # Halt（bit 8）で減速停止。Operation Enabled のまま
+        self.running = False
+        self.setpoints.column(0x6040)[:] |= CW_HALT
+
+    def _reset_motion(self):
+        self.bank.reset()
         for axis in self.axes:
-            axis.actual_position = 0
-            axis.velocity = 0
             axis.node.object_dictionary[0x6064].value = 0
             axis.node.object_dictionary[0x607A].value = 0
+        self.setpoints.column(0x607A)[:] = 0
 
     # グラフもクリア
-        for nid in range(1, 6):
-            self.history[nid].clear()
+        self.history.clear()
 
-    def emergency_stop(self):
+    def _emergency_stop(self):
+        # Quick Stop → 止まったら Switch On Disabled。再スタートで enable し直す
         self.running = False
-        for axis in self.axes:
-            axis.velocity = 0
+        self.setpoints.column(0x6040)[:] = CW_QUICK_STOP
 
     def update_motion(self):
         # 軌道生成
@@ -192,13 +281,12 @@ class MainWindow(QMainWindow):
             if target is None:
                 target = 0
 
-            axis.node.object_dictionary[0x607A].raw = int(target)
+            self.setpoints.column(0x607A)[i - 1] = int(target)     # RPDO で送る
 
-            # モーター更新
-            axis.update()
+            # モーター更新は bank.step()（CiA 402 の状態に従う）で行う
 
             # 履歴に追加
-            self.history[i].append(axis.position)
+            self.history.append(i, "position", axis.position)
 
         self.frame += 1
 
@@ -207,68 +295,66 @@ class MainWindow(QMainWindow):
     def update_sim(self):
 
         self.update_motion()
-        self.update_graph()
-        if not getattr(self, "running", False):
-            return
-        
+
         # ここに CANopen の処理を入れる
-        self.frame += 1
+        store = self.bank.store
+        if self.running:
+            self.frame += 1
 
-        # ① 軌道生成
-        targets = self.traj.generate(self.frame)
-        for axis, target in zip(self.axes, targets):
-            axis.node.object_dictionary[0x607A].value = target
+            # ① 軌道生成
+            targets = self.traj.generate(self.frame)
+            setpoints = self.setpoints
+            setpoints.column(0x607A)[:] = targets     # 全軸の 0x607A に一度に書く
+
+            # Operation Enabled まで進める（Fault は reset してから）
+            setpoints.column(0x6040)[:] = enable_controlword(store.column(0x6041), reset_faults=True)
 
-        # ② PDO受信
-        while True:
-            msg = self.rx_bus.recv(timeout=0.001)
-            if msg is None:
-             break
+        # 停止中も SYNC は送り続ける（Halt / Quick Stop の減速を進めるため）
 
-            if 0x180 <= msg.arbitration_id <= 0x185:
-                nid = msg.arbitration_id - 0x180
-                actual = int.from_bytes(msg.data[:4], 'little', signed=True)
-                self.history[nid].append(actual)
+        # ② 全軸の目標値を RPDO で送り、ドライブ側で SYNC の前にまとめて反映する
+        #   （TPDO の受信は self.receiver（Notifier スレッド）が行う）
+        t = time.perf_counter()
+        self.rpdo_rx.subscribe()
+        self.rpdo.send(self.setpoints.values, self.rpdo_send)
+        self.rpdo_rx.apply()
+        self.stats.record("rpdo", time.perf_counter() - t)
 
         # ③ SYNC送信
         sync = can.Message(arbitration_id=0x80, data=[1,0], is_extended_id=False)
+        t = time.perf_counter()
         self.network.bus.send(sync)
+        self.stats.record("sync", time.perf_counter() - t)
+        self.stats.mark_sync(t)
 
-        # ④ 各軸 on_sync()
-        for axis in self.axes:
-            axis.on_sync()
-
-        # ⑤ グラフ更新(低速版)
-        #self.ax.clear()
-        #for nid in range(1, 6):
-        #    self.ax.plot(self.history[nid][-200:], label=f"Axis {nid}")
-        # --- グラフ更新（高速版） ---
+        # ④ 全軸まとめて状態遷移 + モーター更新 → 送る TPDO だけ送信
+        self.bank.step()
+        t = time.perf_counter()
+        self.tpdo.on_sync(t, self.network.bus.send)
+        self.stats.record("on_sync", time.perf_counter() - t)
 
+        # Rec 中は周期ごとの状態も記録
+        if self.recorder is not None:
+            self.recorder.record_state(self.frame, self.bank.store, [axis.node_id for axis in self.axes])
+            self.signals.append(self.frame, self.frame * self.sim_thread.period, self.bank.store)
 
-        self.canvas.draw()
+        # ⑤ グラフ・ラベルは refresh_display（表示タイマー）で更新
 
+    def refresh_display(self):
+        # グラフ更新（ライン artist だけ再描画）
+        t = time.perf_counter()
+        self.plotter.refresh()
+        self.stats.record("redraw", time.perf_counter() - t)
 
-        self.ax.legend()
-        self.ax.set_ylim(-1500, 1500)
-        self.canvas.draw()
-
-        # ⑥ 数値ラベル更新
+        # 数値ラベル更新
         for axis in self.axes:
-            pos = axis.position
+            pos = self.receiver.latest[axis.node_id]    # マスタが受信した最新位置
             self.pos_labels[axis.node_id - 1].setText(f"Axis {axis.node_id}: {pos}")
 
-        # グリッド追加
-        self.ax.grid(True)
-
-    def update_graph(self):
-        for nid in range(1, 6):
-            y = self.history[nid]
-            x = list(range(len(y)))
-            self.lines[nid].set_data(x, y)
-
-        # 自動スケール
-        self.ax.relim()
-        self.ax.autoscale_view()
+        # 周期計測は約1秒ごとに表示
+        self.display_count += 1
+        if self.display_count % 30 == 0:
+            self.stats_label.setText(
+                self.stats.report() + f"\noverruns {self.sim_thread.overruns}")
 
     #5軸分の位置を1つにまとめる
 
@@ -281,7 +367,13 @@ class MainWindow(QMainWindow):
             data += int(pos).to_bytes(4, 'little', signed=True)
 
         msg = can.Message(arbitration_id=arb_id, data=data, is_extended_id=False)
-        self.bus.send(msg)
+        self.network.bus.send(msg)
+
+    # 受信 PDO のデコード表（全軸の TPDO1〜4 + 0x300 の多軸 PDO）
+    def build_cob_table(self):
+        table = CobIdTable.from_axes(self.axes, self.rx_history.signals)
+        table.add_multi_axis(0x300, [axis.node_id for axis in self.axes])
+        return table
 
     #TPDO make fanction
     def create_pdo_row(self, axis, pdo_num):
@@ -325,7 +417,22 @@ class MainWindow(QMainWindow):
                 od = int(widget.currentText(), 16)
                 new_list.append(od)
 
-        axis.tpdo_map[pdo_num] = new_list
+        # 8 byte 超などはここで弾く（ステータスバーは GUI スレッドで出す）
+        new_map = dict(axis.tpdo_map)
+        new_map[pdo_num] = new_list
+        try:
+            compile_tpdo_map(axis.node.object_dictionary, axis.node_id, new_map, axis.tpdo_cob_ids)
+        except ValueError as e:
+            self.statusBar().showMessage(f"TPDO{pdo_num}: {e}", 5000)
+            return
+
+        # 差し替えは TPDO を送っているシミュレーションスレッドで周期の頭に行う
+        self.sim_thread.call(self._set_pdo_map, axis, pdo_num, new_list)
+
+    def _set_pdo_map(self, axis, pdo_num, od_list):
+        # マッピング変更時だけ TPDO を再コンパイルし、受信側のデコード表も差し替える
+        axis.set_tpdo_map(pdo_num, od_list)
+        self.receiver.table = self.build_cob_table()
   
     #OD function
     def add_pdo_entry(self, axis, pdo_num):
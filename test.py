@@ -12,6 +12,11 @@ from matplotlib.figure import Figure
 
 from trajectory import TrajectoryGenerator
 from axis import Axis
+from core.history import HistoryBuffer
+from core.receiver import start_receiver
+from core.eds import load_od
+from core.dispatch import CobIdTable
+from core.pdo import PdoLayout, tpdo_cob_id
 
 class MainWindow(QWidget):
     def __init__(self):
@@ -30,7 +35,7 @@ class MainWindow(QWidget):
 class Axis:
     def __init__(self, network, node_id, eds):
         self.network = network
-        self.node = canopen.LocalNode(node_id, eds)
+        self.node = canopen.LocalNode(node_id, load_od(eds, node_id))   # EDS の解析は1回だけ
         self.node_id = node_id
         network.add_node(self.node)
 
@@ -179,8 +184,16 @@ network.nmt.state = 'OPERATIONAL'
 #  マスタ側（PDO受信＋グラフ描画）
 # ============================
 
-# データバッファ
-history = {nid: [] for nid in range(1, 6)}
+# データバッファ（固定長リングバッファ）
+history = HistoryBuffer(range(1, 6), capacity=5000)
+
+# PDO 受信（Notifier スレッドで history に書き込む）
+# 各軸の TPDO1 = Actual Position（INTEGER32）
+cob_table = CobIdTable()
+for nid in range(1, 6):
+    cob_table.add_tpdo(nid, 1, PdoLayout(tpdo_cob_id(nid, 1), [0x6064], [0x0004]))
+
+notifier, receiver = start_receiver(rx_bus, history, cob_table)
 
 # matplotlib 準備
 fig, ax = plt.subplots()
@@ -212,26 +225,9 @@ def update(frame):
         axis.node.sdo[0x607A].raw = target
     
     # ----------------------------- 
-    # ② 前フレームのPDOを受信 
+    # ② 前フレームのPDOは receiver がバックグラウンドで受信済み
     # -----------------------------
 
- 
-    while True:
-        msg = rx_bus.recv(timeout=0.01)
-
-        if msg is None:
-            #print("PDO:", msg.arbitration_id, actual)
-            break
-
-        print("RECV:", hex(msg.arbitration_id), list(msg.data))
-        
-        # PDO (0x180〜0x185)
-        if 0x180 <= msg.arbitration_id <= 0x185:
-            nid = msg.arbitration_id - 0x180
-            actual = int.from_bytes(msg.data[:4], byteorder='little', signed=True)
-            #print("PDO:", msg.arbitration_id, actual)
-            history[nid].append(actual)
-    
     # ----------------------------- 
     # ③ SYNC送信 
     # -----------------------------
@@ -247,9 +243,9 @@ def update(frame):
 #  ⑤ グラフ更新 
 #  -----------------------------
     for nid in range(1, 6):
-        lines[nid].set_data(range(len(history[nid])), history[nid])
+        lines[nid].set_data(history.indices(nid, "position"), history.window(nid, "position"))
 
-    ax.set_xlim(0, max(200, len(history[1])))
+    ax.set_xlim(0, max(200, history.total(1, "position")))
     ax.set_ylim(-1200, 1200)
     #print({nid: len(history[nid]) for nid in history})
     return list(lines.values())
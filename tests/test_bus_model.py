@@ -0,0 +1,102 @@
+import can
+import pytest
+
+from core.bus_model import BusModel, frame_bits
+
+BITRATE = 500000
+
+# 手で数えた値（SOF〜CRC + スタッフビット + CRC デリミタ・ACK・EOF・フレーム間スペース 13）
+#   0x7FF / データなし: 34 + 3 + 13（ID の 1 が 11 個続く所に 2、その後の 0 が 7 個続く所に 1）
+#   0x000 / 0 が 8 byte: 98 + 16 + 13（CRC-15 = 001010001011011）
+ID_7FF_NO_DATA = 50
+ID_000_EIGHT_ZEROS = 127
+ID_181_FOUR_BYTES = 86      # 0x181 / 01 02 03 04: 66 + 7 + 13
+
+
+def _message(cob_id, data=b""):
+    return can.Message(arbitration_id=cob_id, data=data, is_extended_id=False)
+
+
+def _model(clock):
+    return BusModel(BITRATE, clock=lambda: clock[0])
+
+
+def test_frame_bits_id_7ff_no_data():
+    assert frame_bits(0x7FF, b"") == ID_7FF_NO_DATA
+
+
+def test_frame_bits_id_000_eight_zero_bytes():
+    assert frame_bits(0x000, bytes(8)) == ID_000_EIGHT_ZEROS
+
+
+def test_frame_bits_pdo():
+    assert frame_bits(0x181, bytes([1, 2, 3, 4])) == ID_181_FOUR_BYTES
+
+
+def test_arbitration_in_priority_order():
+    # 同時に送ったフレームは送った順ではなく COB-ID の小さい順に送り終わる
+    clock = [0.0]
+    bus = _model(clock)
+    bus.record_frame(_message(0x7FF))
+    bus.record_frame(_message(0x181, bytes([1, 2, 3, 4])))
+    bus.record_frame(_message(0x000, bytes(8)))
+    bus.advance(0.001)
+
+    assert bus.sent == 3
+    assert bus.worst_latency[0x000] == pytest.approx(ID_000_EIGHT_ZEROS / BITRATE)
+    assert bus.worst_latency[0x181] == pytest.approx((ID_000_EIGHT_ZEROS + ID_181_FOUR_BYTES) / BITRATE)
+    assert bus.worst_latency[0x7FF] == pytest.approx(
+        (ID_000_EIGHT_ZEROS + ID_181_FOUR_BYTES + ID_7FF_NO_DATA) / BITRATE)
+
+    total = ID_7FF_NO_DATA + ID_000_EIGHT_ZEROS + ID_181_FOUR_BYTES
+    assert bus.load.values()[-1] == pytest.approx(total / BITRATE / 0.001)
+    assert bus.worst_pdo_latency() == pytest.approx(bus.worst_latency[0x181])
+
+
+def test_frame_on_the_bus_is_not_preempted():
+    # 0x7FF の送信中に 0x000 が来ても、0x7FF を送り終わってから 0x000 を送る
+    clock = [0.0]
+    bus = _model(clock)
+    bus.record_frame(_message(0x7FF))
+    clock[0] = 10e-6
+    bus.record_frame(_message(0x000, bytes(8)))
+    bus.advance(0.001)
+
+    assert bus.worst_latency[0x7FF] == pytest.approx(ID_7FF_NO_DATA / BITRATE)
+    assert bus.worst_latency[0x000] == pytest.approx(
+        (ID_7FF_NO_DATA + ID_000_EIGHT_ZEROS) / BITRATE - 10e-6)
+
+
+def test_frames_left_over_are_deferred_to_the_next_cycle():
+    # 1周期（200 bit 分）に入りきらない 0x7FF は次の周期に送られる
+    period = 200 / BITRATE
+    clock = [0.0]
+    bus = _model(clock)
+    bus.record_frame(_message(0x7FF))
+    bus.record_frame(_message(0x000, bytes(8)))
+    bus.record_frame(_message(0x181, bytes([1, 2, 3, 4])))
+    bus.advance(period)
+    assert bus.sent == 2
+    assert bus.backlog == 1
+
+    bus.advance(2 * period)
+    assert bus.sent == 3
+    assert bus.deferred == 1
+
+
+def test_offered_load_over_bitrate_and_carried_load_capped():
+    # 1周期（200 bit 分）に 3 フレーム（263 bit）を出し続けると、送れるのは 100% まで
+    period = 200 / BITRATE
+    clock = [0.0]
+    bus = _model(clock)
+    for k in range(4):
+        clock[0] = k * period
+        bus.record_frame(_message(0x7FF))
+        bus.record_frame(_message(0x000, bytes(8)))
+        bus.record_frame(_message(0x181, bytes([1, 2, 3, 4])))
+        bus.advance((k + 1) * period)
+
+    total = ID_7FF_NO_DATA + ID_000_EIGHT_ZEROS + ID_181_FOUR_BYTES
+    assert bus.average_load(4 * period) == pytest.approx(total / 200)
+    assert bus.carried_load() == pytest.approx(1.0)
+    assert bus.peak_load == pytest.approx(1.0)
@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+from core.cia402 import (
+    COMMANDS, CW_DISABLE_VOLTAGE, CW_ENABLE_OPERATION, CW_FAULT_RESET, CW_HALT, CW_QUICK_STOP,
+    CW_SHUTDOWN, CW_SWITCH_ON, DISABLE_VOLTAGE, ENABLE_OPERATION, FAULT, FAULT_REACTION_ACTIVE,
+    FAULT_RESET, NEXT_STATE, NOT_READY_TO_SWITCH_ON, OPERATION_ENABLED, QUICK_STOP, QUICK_STOP_ACTIVE,
+    READY_TO_SWITCH_ON, SHUTDOWN, STATE_NAMES, STATUSWORDS, SW_REMOTE, SW_SETPOINT_ACK,
+    SW_TARGET_REACHED, SW_VOLTAGE_ENABLED, SWITCH_ON, SWITCH_ON_DISABLED, SWITCHED_ON,
+    Cia402StateMachine, decode_state, enable_controlword,
+)
+
+# CiA 402 の controlword（bit 7, 3〜0）→ コマンド
+COMMAND_CASES = [
+    (CW_SHUTDOWN, SHUTDOWN),                # 0xxx x110
+    (CW_SWITCH_ON, SWITCH_ON),              # 0xxx 0111
+    (CW_ENABLE_OPERATION, ENABLE_OPERATION),    # 0xxx 1111
+    (CW_QUICK_STOP, QUICK_STOP),            # 0xxx x01x
+    (0x000B, QUICK_STOP),
+    (CW_DISABLE_VOLTAGE, DISABLE_VOLTAGE),  # 0xxx xx0x
+    (0x000D, DISABLE_VOLTAGE),
+    (0x000E, SHUTDOWN),
+]
+
+# (遷移番号, 元の状態, controlword, 停止しているか, 次の状態)
+TRANSITIONS = [
+    (1, NOT_READY_TO_SWITCH_ON, CW_DISABLE_VOLTAGE, False, SWITCH_ON_DISABLED),
+    (2, SWITCH_ON_DISABLED, CW_SHUTDOWN, False, READY_TO_SWITCH_ON),
+    (3, READY_TO_SWITCH_ON, CW_SWITCH_ON, False, SWITCHED_ON),
+    (4, SWITCHED_ON, CW_ENABLE_OPERATION, False, OPERATION_ENABLED),
+    (5, OPERATION_ENABLED, CW_SWITCH_ON, False, SWITCHED_ON),
+    (6, SWITCHED_ON, CW_SHUTDOWN, False, READY_TO_SWITCH_ON),
+    (7, READY_TO_SWITCH_ON, CW_DISABLE_VOLTAGE, False, SWITCH_ON_DISABLED),
+    (7, READY_TO_SWITCH_ON, CW_QUICK_STOP, False, SWITCH_ON_DISABLED),
+    (8, OPERATION_ENABLED, CW_SHUTDOWN, False, READY_TO_SWITCH_ON),
+    (9, OPERATION_ENABLED, CW_DISABLE_VOLTAGE, False, SWITCH_ON_DISABLED),
+    (10, SWITCHED_ON, CW_DISABLE_VOLTAGE, False, SWITCH_ON_DISABLED),
+    (10, SWITCHED_ON, CW_QUICK_STOP, False, SWITCH_ON_DISABLED),
+    (11, OPERATION_ENABLED, CW_QUICK_STOP, False, QUICK_STOP_ACTIVE),
+    (12, QUICK_STOP_ACTIVE, CW_QUICK_STOP, True, SWITCH_ON_DISABLED),
+    (12, QUICK_STOP_ACTIVE, CW_DISABLE_VOLTAGE, False, SWITCH_ON_DISABLED),
+    (14, FAULT_REACTION_ACTIVE, CW_DISABLE_VOLTAGE, True, FAULT),
+    (15, FAULT, CW_FAULT_RESET, False, SWITCH_ON_DISABLED),
+    (16, QUICK_STOP_ACTIVE, CW_ENABLE_OPERATION, False, OPERATION_ENABLED),
+]
+
+
+def _machine(state, n_axes=1):
+    sm = Cia402StateMachine(n_axes)
+    sm.state[:] = state
+    return sm
+
+
+@pytest.mark.parametrize("controlword, command", COMMAND_CASES)
+def test_command_table(controlword, command):
+    assert COMMANDS[controlword] == command
+    # bit 4〜6（運転モード固有）はコマンドに関係しない
+    for extra in (0x10, 0x20, 0x40, 0x70):
+        assert COMMANDS[controlword | extra] == command
+
+
+def test_command_table_covers_bits_0_to_6():
+    assert COMMANDS.shape == (128,)
+    assert set(COMMANDS.tolist()) == {DISABLE_VOLTAGE, QUICK_STOP, SHUTDOWN, SWITCH_ON, ENABLE_OPERATION}
+
+
+def test_transition_table_shape():
+    assert NEXT_STATE.shape == (len(STATE_NAMES), FAULT_RESET + 1)
+    # 電源投入直後と Fault Reaction Active はコマンドで抜けない（Fault は fault reset だけ）
+    assert (NEXT_STATE[NOT_READY_TO_SWITCH_ON] == SWITCH_ON_DISABLED).all()
+    assert (NEXT_STATE[FAULT_REACTION_ACTIVE] == FAULT_REACTION_ACTIVE).all()
+    assert (NEXT_STATE[FAULT, :FAULT_RESET] == FAULT).all()
+
+
+@pytest.mark.parametrize("number, state, controlword, stopped, expected", TRANSITIONS)
+def test_transition(number, state, controlword, stopped, expected):
+    sm = _machine(state)
+    statusword = sm.step(np.array([controlword]), np.array([stopped]))
+    assert sm.state[0] == expected, f"transition {number}"
+    assert statusword[0] == STATUSWORDS[expected]
+
+
+def test_transition_13_fault_from_any_state():
+    for state in range(len(STATE_NAMES)):
+        if state == FAULT:
+            continue
+        sm = _machine(state)
+        sm.raise_fault([0])
+        sm.step(np.array([CW_ENABLE_OPERATION]), np.array([False]))
+        assert sm.state[0] == FAULT_REACTION_ACTIVE, STATE_NAMES[state]
+
+
+def test_fault_stays_until_stopped_and_reset():
+    sm = _machine(FAULT_REACTION_ACTIVE)
+    sm.step(np.array([CW_FAULT_RESET]), np.array([False]))
+    assert sm.state[0] == FAULT_REACTION_ACTIVE
+
+    # fault reset は立ち上がりだけ（押しっぱなしでは2回目の遷移は起きない）
+    sm = _machine(FAULT)
+    sm.step(np.array([CW_FAULT_RESET]), np.array([True]))
+    assert sm.state[0] == SWITCH_ON_DISABLED
+    sm.step(np.array([CW_FAULT_RESET | CW_SHUTDOWN]), np.array([True]))
+    assert sm.state[0] == READY_TO_SWITCH_ON
+
+
+def test_quick_stop_waits_until_stopped():
+    sm = _machine(QUICK_STOP_ACTIVE)
+    sm.step(np.array([CW_QUICK_STOP]), np.array([False]))
+    assert sm.state[0] == QUICK_STOP_ACTIVE
+
+
+def test_halt_keeps_operation_enabled():
+    sm = _machine(OPERATION_ENABLED)
+    sm.step(np.array([CW_ENABLE_OPERATION | CW_HALT]), np.array([False]))
+    assert sm.state[0] == OPERATION_ENABLED
+
+
+def test_rows_are_independent():
+    sm = _machine(SWITCH_ON_DISABLED, n_axes=3)
+    sm.step(np.array([CW_SHUTDOWN]), np.array([False]), rows=[1])
+    np.testing.assert_array_equal(sm.state, [SWITCH_ON_DISABLED, READY_TO_SWITCH_ON, SWITCH_ON_DISABLED])
+
+
+def test_statusword_table_decodes_back():
+    np.testing.assert_array_equal(decode_state(STATUSWORDS), np.arange(len(STATE_NAMES)))
+    assert (STATUSWORDS & SW_REMOTE).all()
+    powered = [READY_TO_SWITCH_ON, SWITCHED_ON, OPERATION_ENABLED, QUICK_STOP_ACTIVE, FAULT_REACTION_ACTIVE]
+    for state in range(len(STATE_NAMES)):
+        assert bool(STATUSWORDS[state] & SW_VOLTAGE_ENABLED) == (state in powered), STATE_NAMES[state]
+
+
+def test_decode_state_ignores_other_bits():
+    # target reached / setpoint acknowledge / warning（bit 7）などは状態の判定に使わない
+    extra = SW_TARGET_REACHED | SW_SETPOINT_ACK | 0x0080
+    np.testing.assert_array_equal(decode_state(STATUSWORDS | extra), np.arange(len(STATE_NAMES)))
+
+
+def test_enable_controlword_reaches_operation_enabled():
+    sm = Cia402StateMachine(2)
+    statusword = np.zeros(2, dtype=np.int64)
+    for _ in range(4):
+        statusword = sm.step(enable_controlword(statusword), np.ones(2, dtype=bool))
+    np.testing.assert_array_equal(sm.state, OPERATION_ENABLED)
+
+
+def test_enable_controlword_resets_faults_only_when_asked():
+    statusword = STATUSWORDS[[FAULT]]
+    assert enable_controlword(statusword)[0] == CW_SHUTDOWN
+    assert enable_controlword(statusword, reset_faults=True)[0] == CW_FAULT_RESET
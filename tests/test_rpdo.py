@@ -0,0 +1,174 @@
+import asyncio
+import struct
+
+import can
+import canopen
+import numpy as np
+import pytest
+from canopen import objectdictionary
+from canopen.objectdictionary import ODVariable
+from canopen.sdo import SdoAbortedError
+
+from core.eds import load_template
+from core.master import AsyncMaster
+from core.od_store import OdStore
+from core.pdo import ABORT_CANNOT_MAP, ABORT_PDO_LENGTH
+from core.rpdo import RpdoMapping, RpdoMaster, RpdoReceiver, loopback_send
+from core.sdo import drive_node
+from core.simulator import Simulator
+
+
+def _u8(value):
+    return bytes([value])
+
+
+def _u32(value):
+    return struct.pack("<L", value)
+
+
+def _mapping(n_axes=2):
+    template = load_template()
+    nodes = [drive_node(nid, template.build(nid)) for nid in range(1, n_axes + 1)]
+    store = OdStore(n_axes)
+    for row, node in enumerate(nodes):
+        store.attach(node.object_dictionary, row)
+    return RpdoMapping(store, nodes), nodes
+
+
+def _layouts(mapping, row):
+    """row 行の軸の {pdo_num: (COB-ID, (index, ...))}"""
+    objects = mapping.store.objects
+    result = {}
+    for group in mapping.groups:
+        for i, group_row in enumerate(group.rows.tolist()):
+            if group_row == row:
+                indices = tuple(objects[col] for col in group.columns.tolist())
+                result[group.pdo_num] = (group.messages[i].arbitration_id, indices)
+    return result
+
+
+def _round_trip(mapping, channel):
+    """マスタの目標値を RPDO で送り、ドライブ側の store に書く（(書いたフレーム数, 送った COB-ID)）"""
+    n_axes = len(mapping.nodes)
+    image = OdStore(n_axes)
+    image.column(0x6040)[:] = 0x1000F          # UNSIGNED16 に切り詰められて 0x000F
+    image.column(0x607A)[:] = [-100000, 2 ** 31 - 1, 42][:n_axes]
+    image.column(0x60FF)[:] = [7, -8, 9][:n_axes]
+
+    # Notifier は使わない（loopback_send が network.notify() で直接渡す）
+    network = canopen.Network(can.interface.Bus(interface="virtual", channel=channel))
+    sent = []
+    send = loopback_send(network)
+    try:
+        rx = RpdoReceiver(network, mapping)
+        rx.subscribe()
+        RpdoMaster(mapping).send(image.values, lambda msg: (sent.append(msg.arbitration_id), send(msg)))
+        applied = rx.apply()
+        rx.close()
+    finally:
+        network.bus.shutdown()
+    return applied, sent
+
+
+def test_default_mapping_from_eds():
+    mapping, _ = _mapping()
+    assert _layouts(mapping, 0) == {1: (0x201, (0x6040, 0x607A)), 2: (0x301, (0x60FF,))}
+    assert mapping.count == 4
+
+
+def test_remap_is_applied_on_the_next_build():
+    mapping, nodes = _mapping()
+    version = mapping.version
+    node = nodes[0]
+    node.set_data(0x1600, 0, _u8(0), check_writable=True)
+    node.set_data(0x1600, 1, _u32(0x607A0020), check_writable=True)
+    node.set_data(0x1600, 0, _u8(1), check_writable=True)
+
+    assert _layouts(mapping, 0)[1] == (0x201, (0x607A,))
+    assert _layouts(mapping, 1)[1] == (0x202, (0x6040, 0x607A))
+    assert mapping.version > version
+
+
+def test_remap_outside_process_data_is_aborted():
+    mapping, nodes = _mapping()
+    before = _layouts(mapping, 0)
+    with pytest.raises(SdoAbortedError) as exc:
+        nodes[0].set_data(0x1600, 1, _u32(0x10000020), check_writable=True)
+    assert exc.value.code == ABORT_CANNOT_MAP
+    assert _layouts(mapping, 0) == before
+
+    # bit 長が違う / subindex が無いのもマッピングできない
+    with pytest.raises(SdoAbortedError) as exc:
+        nodes[0].set_data(0x1600, 2, _u32(0x607A0010), check_writable=True)
+    assert exc.value.code == ABORT_CANNOT_MAP
+    with pytest.raises(SdoAbortedError) as exc:
+        nodes[0].set_data(0x1600, 0, _u8(3), check_writable=True)
+    assert exc.value.code == ABORT_CANNOT_MAP
+
+
+def test_remap_longer_than_8_bytes_is_aborted():
+    template = load_template()
+    od = template.build(1)
+    entry = ODVariable("Mapped object 3", 0x1600, 3)
+    entry.data_type = objectdictionary.UNSIGNED32
+    entry.access_type = "rw"
+    entry.default = 0x60FF0020
+    od[0x1600].add_member(entry)
+    node = drive_node(1, od)
+    store = OdStore(1)
+    store.attach(node.object_dictionary, 0)
+    mapping = RpdoMapping(store, [node])
+    before = _layouts(mapping, 0)
+
+    with pytest.raises(SdoAbortedError) as exc:
+        node.set_data(0x1600, 0, _u8(3), check_writable=True)      # 2 + 4 + 4 byte
+    assert exc.value.code == ABORT_PDO_LENGTH
+    assert _layouts(mapping, 0) == before
+
+
+def test_sdo_remap_through_the_master():
+    async def remap(channel):
+        async with AsyncMaster(channel) as master:
+            await master.download(1, 0x1600, 0, _u8(0))
+            await master.download(1, 0x1600, 1, _u32(0x607A0020))
+            await master.download(1, 0x1600, 0, _u8(1))
+            with pytest.raises(SdoAbortedError) as exc:
+                await master.download(1, 0x1600, 1, _u32(0x10000020))
+            return exc.value.code
+
+    with Simulator(n_axes=2, channel="test-rpdo-remap") as sim:
+        assert asyncio.run(remap("test-rpdo-remap")) == ABORT_CANNOT_MAP
+        sim.run(5)
+
+        assert _layouts(sim.rpdo.mapping, 0)[1] == (0x201, (0x607A,))
+        assert sim.rpdo_rx.errors == 0
+        assert sim.store.column(0x607A)[0] == sim.setpoints.column(0x607A)[0]
+
+
+def test_round_trip_to_store_columns():
+    mapping, _ = _mapping(3)
+    applied, sent = _round_trip(mapping, "test-rpdo-round-trip")
+    assert applied == 6
+    assert sorted(sent) == [0x201, 0x202, 0x203, 0x301, 0x302, 0x303]
+
+    store = mapping.store
+    np.testing.assert_array_equal(store.column(0x6040), [0x000F] * 3)
+    np.testing.assert_array_equal(store.column(0x607A), [-100000, 2 ** 31 - 1, 42])
+    np.testing.assert_array_equal(store.column(0x60FF), [7, -8, 9])
+    # マッピングしていない列は書かない
+    np.testing.assert_array_equal(store.column(0x6064), 0)
+
+
+def test_cob_id_from_0x1400():
+    mapping, nodes = _mapping(2)
+    nodes[0].set_data(0x1400, 1, _u32(0x250), check_writable=True)
+    nodes[1].set_data(0x1401, 1, _u32(0x80000302), check_writable=True)    # RPDO2 を無効に
+    assert _layouts(mapping, 0) == {1: (0x250, (0x6040, 0x607A)), 2: (0x301, (0x60FF,))}
+    assert _layouts(mapping, 1) == {1: (0x202, (0x6040, 0x607A))}
+
+    applied, sent = _round_trip(mapping, "test-rpdo-cob-id")
+    assert applied == 3
+    assert sorted(sent) == [0x202, 0x250, 0x301]
+    store = mapping.store
+    np.testing.assert_array_equal(store.column(0x607A), [-100000, 2 ** 31 - 1])
+    np.testing.assert_array_equal(store.column(0x60FF), [7, 0])
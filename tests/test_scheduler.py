@@ -0,0 +1,32 @@
+from core.scheduler import SimThread
+
+
+def test_step_exception_stops_the_thread_and_is_reported():
+    errors = []
+    calls = []
+
+    def step():
+        calls.append(len(calls))
+        if len(calls) == 3:
+            raise RuntimeError("boom")
+
+    thread = SimThread(step, 0.001, on_error=errors.append)
+    thread.start()
+    thread.join(1.0)
+
+    assert not thread.is_alive()
+    assert thread.cycles == 2
+    assert isinstance(thread.error, RuntimeError)
+    assert errors == [thread.error]
+
+
+def test_call_exception_is_reported_too():
+    errors = []
+    thread = SimThread(lambda: None, 0.001, on_error=errors.append)
+    thread.call(int, "not a number")
+    thread.start()
+    thread.join(1.0)
+
+    assert not thread.is_alive()
+    assert isinstance(thread.error, ValueError)
+    assert errors == [thread.error]
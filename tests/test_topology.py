@@ -0,0 +1,27 @@
+import pytest
+
+from core.topology import Topology
+
+CONFIG = {"period": 0.005,
+          "segments": [{"name": "fast", "axes": 2, "channel": "test-topology-fast"},
+                       {"name": "slow", "axes": 2, "period": 0.01, "channel": "test-topology-slow"}]}
+
+
+def test_realtime_run_sets_the_stats_period_of_each_segment():
+    with Topology.from_config(CONFIG, stats=True) as topology:
+        topology.run(4, realtime=100.0)
+        # 基本周期 5 ms の 100 倍速、slow は 2 回に1回進む
+        assert [segment.sim.stats.period for segment in topology.segments] == pytest.approx([50e-6, 100e-6])
+
+        topology.run(2)
+        assert [segment.sim.stats.period for segment in topology.segments] == [None, None]
+
+
+def test_report_has_offered_and_carried_load():
+    with Topology.from_config(CONFIG) as topology:
+        topology.run(4)
+        header, *rows = topology.report().splitlines()
+        assert "offered[%]" in header and "carried[%]" in header
+        assert len(rows) == 2
+        for segment in topology.segments:
+            assert 0.0 < segment.bus.carried_load() <= 1.0
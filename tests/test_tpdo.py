@@ -0,0 +1,166 @@
+import struct
+
+import canopen
+import pytest
+
+from core.axis import Axis
+from core.axis_bank import AxisBank
+from core.dispatch import CobIdTable
+from core.eds import load_template
+from core.sdo import drive_node
+from core.tpdo import TpdoScheduler
+
+PERIOD = 0.01
+
+
+def _u8(value):
+    return bytes([value])
+
+
+def _u32(value):
+    return struct.pack("<L", value)
+
+
+def _scheduler(n_axes=2):
+    template = load_template()
+    network = canopen.Network()
+    bank = AxisBank(n_axes)
+    axes = []
+    for row in range(n_axes):
+        nid = row + 1
+        node = drive_node(nid, template.build(nid))
+        axes.append(Axis(node, nid, network, bank, row))
+    return TpdoScheduler(axes), axes, bank.store
+
+
+def _run(scheduler, cycles, change=None, start=0):
+    """cycles 回 SYNC を送り、周期ごとに送った COB-ID のリストを返す（change(k) で値を変える）"""
+    frames = []
+    for k in range(start, start + cycles):
+        if change is not None:
+            change(k)
+        sent = []
+        scheduler.on_sync(k * PERIOD, lambda msg: sent.append(msg.arbitration_id))
+        frames.append(sorted(sent))
+    return frames
+
+
+def test_default_transmission_type_sends_every_sync():
+    # EDS の 0x1800sub2 = 1、0x1801 は無いので既定の 1
+    scheduler, _, _ = _scheduler()
+    assert _run(scheduler, 3) == [[0x181, 0x182, 0x281, 0x282]] * 3
+    assert scheduler.sent == 12
+    assert scheduler.skipped == 0
+
+
+@pytest.mark.parametrize("trans_type", [2, 3, 240])
+def test_cyclic_every_nth_sync(trans_type):
+    scheduler, _, _ = _scheduler(1)
+    scheduler.configure(trans_type=trans_type)
+    frames = _run(scheduler, 2 * trans_type)
+    sent_at = [k for k, sent in enumerate(frames) if sent]
+    # sync_count は 1 から数える
+    assert sent_at == [trans_type - 1, 2 * trans_type - 1]
+    assert frames[trans_type - 1] == [0x181, 0x281]
+
+
+def test_acyclic_sends_only_changes():
+    scheduler, _, store = _scheduler(2)
+    scheduler.configure(trans_type=0)
+
+    def change(k):
+        if k == 2:
+            store.column(0x6064)[1] = 100      # 軸2 の位置だけ
+        if k == 4:
+            store.column(0x6077)[0] = -5       # 軸1 のトルク（TPDO2）
+
+    frames = _run(scheduler, 6, change)
+    assert frames[0] == [0x181, 0x182, 0x281, 0x282]      # まだ送っていないので全部
+    assert frames[1] == []
+    assert frames[2] == [0x182]
+    assert frames[3] == []
+    assert frames[4] == [0x281]
+    assert frames[5] == []
+
+
+@pytest.mark.parametrize("trans_type", [254, 255])
+def test_event_driven_sends_on_change(trans_type):
+    scheduler, _, store = _scheduler(1)
+    scheduler.configure(pdo_num=1, trans_type=trans_type)
+    scheduler.configure(pdo_num=2, trans_type=0)
+
+    def change(k):
+        if k in (3, 4):
+            store.column(0x6064)[0] = k
+
+    frames = _run(scheduler, 6, change)
+    assert [0x181 in sent for sent in frames] == [True, False, False, True, True, False]
+
+
+def test_inhibit_time():
+    scheduler, _, store = _scheduler(1)
+    scheduler.configure(trans_type=255, inhibit=0.035)
+
+    def change(k):
+        store.column(0x6064)[0] = k            # 毎周期変わる
+
+    frames = _run(scheduler, 9, change)
+    # 0 ms に送ったら 35 ms あけて 40 ms、80 ms
+    assert [k for k, sent in enumerate(frames) if 0x181 in sent] == [0, 4, 8]
+
+
+def test_event_timer():
+    scheduler, _, _ = _scheduler(1)
+    scheduler.configure(trans_type=254, event_timer=0.03)
+    frames = _run(scheduler, 8)
+    # 値は変わらないので event timer（30 ms）ごとだけ
+    assert [k for k, sent in enumerate(frames) if 0x181 in sent] == [0, 3, 6]
+
+
+def test_invalid_bit_in_0x1800sub1():
+    scheduler, axes, _ = _scheduler(2)
+    axes[0].node.set_data(0x1800, 1, _u32(0x80000181), check_writable=True)
+    assert _run(scheduler, 1) == [[0x182, 0x281, 0x282]]
+
+    axes[0].node.set_data(0x1800, 1, _u32(0x181), check_writable=True)
+    assert _run(scheduler, 1, start=1) == [[0x181, 0x182, 0x281, 0x282]]
+
+
+def test_sdo_change_of_transmission_type():
+    scheduler, axes, _ = _scheduler(1)
+    assert _run(scheduler, 2) == [[0x181, 0x281]] * 2
+
+    axes[0].node.set_data(0x1800, 2, _u8(0), check_writable=True)      # SYNC acyclic
+    frames = _run(scheduler, 3, start=2)
+    # 組み直した直後は未送信扱いなので1回送り、その後は値が変わらないので送らない
+    assert frames == [[0x181, 0x281], [0x281], [0x281]]
+
+
+def test_sync_between_callback_and_store_uses_the_written_value():
+    # canopen は write callback の後で data_store に入れる。その間に SYNC が来ても新しい値で組む
+    scheduler, axes, _ = _scheduler(1)
+    _run(scheduler, 1)
+    node = axes[0].node
+    during = []
+    node.add_write_callback(lambda **kw: during.extend(_run(scheduler, 1, start=1)))
+
+    node.set_data(0x1800, 2, _u8(2), check_writable=True)      # 2 回目の SYNC ごと
+    assert node.data_store[0x1800][2] == _u8(2)
+    assert during == [[0x181, 0x281]]          # sync_count 2
+    assert _run(scheduler, 2, start=2) == [[0x281], [0x181, 0x281]]
+
+
+def test_cob_id_from_0x1800sub1():
+    scheduler, axes, _ = _scheduler(2)
+    axes[0].node.set_data(0x1800, 1, _u32(0x1A1), check_writable=True)
+    assert axes[0].tpdo_cob_ids == {1: 0x1A1}
+    assert _run(scheduler, 1) == [[0x182, 0x1A1, 0x281, 0x282]]
+
+    # 無効ビットを落とした 11 bit が COB-ID、有効に戻すとその COB-ID で送る
+    axes[0].node.set_data(0x1800, 1, _u32(0x800001A5), check_writable=True)
+    assert _run(scheduler, 1, start=1) == [[0x182, 0x281, 0x282]]
+    axes[0].node.set_data(0x1800, 1, _u32(0x1A5), check_writable=True)
+    assert _run(scheduler, 1, start=2) == [[0x182, 0x1A5, 0x281, 0x282]]
+
+    table = CobIdTable.from_axes(axes)
+    assert sorted(table.entries) == [0x182, 0x1A5, 0x281, 0x282]
@@ -0,0 +1,84 @@
+import can
+import numpy as np
+import pytest
+
+from core.od_store import OdStore
+from core.trace import (FRAME_DTYPE, FRAME_STRUCT, MAX_DATA, PAYLOAD_SUFFIX, TraceRecorder,
+                        TraceReplayer)
+
+
+def _frames():
+    return [
+        can.Message(arbitration_id=0x080, data=b"", is_extended_id=False),
+        can.Message(arbitration_id=0x181, data=bytes([1, 2, 3, 4]), is_extended_id=False),
+        can.Message(arbitration_id=0x300, data=bytes(range(20)), is_extended_id=False),     # 5 軸分の位置
+        can.Message(arbitration_id=0x1ABCDE, data=bytes(8), is_extended_id=True),
+        can.Message(arbitration_id=0x281, is_remote_frame=True, dlc=6, is_extended_id=False),
+        can.Message(arbitration_id=0x301, data=bytes(range(MAX_DATA)), is_extended_id=False),
+        can.Message(arbitration_id=0x182, data=bytes([9, 8]), is_extended_id=False),
+    ]
+
+
+def _key(msg):
+    return (msg.arbitration_id, msg.is_extended_id, msg.is_remote_frame, msg.dlc, bytes(msg.data))
+
+
+def test_record_replay_round_trip(tmp_path):
+    path = str(tmp_path / "trace")
+    clock = [0.0]
+    store = OdStore(2)
+    store.column(0x6064)[:] = [100, -200]
+    store.column(0x6041)[:] = 0x0237
+
+    frames = _frames()
+    with TraceRecorder(path, buffer_size=2, clock=lambda: clock[0]) as recorder:
+        for i, msg in enumerate(frames):
+            clock[0] = i * 0.001
+            recorder.record_frame(msg)
+        recorder.record_state(7, store, [1, 2])
+
+    replayer = TraceReplayer(path)
+    replayed = list(replayer.messages())
+    assert [_key(msg) for msg in replayed] == [_key(msg) for msg in frames]
+    assert [msg.timestamp for msg in replayed] == pytest.approx([i * 0.001 for i in range(len(frames))])
+
+    # 8 byte 以下のフレームのレコードは 24 byte のまま、超えた分だけ .payload に入る
+    assert FRAME_DTYPE.itemsize == FRAME_STRUCT.size == 24
+    assert len(replayer.frames) == len(frames)
+    assert len(replayer.payload) == 20 + MAX_DATA
+
+    states = replayer.state(7)
+    np.testing.assert_array_equal(states["node_id"], [1, 2])
+    np.testing.assert_array_equal(states["position"], [100, -200])
+    np.testing.assert_array_equal(states["statusword"], 0x0237)
+
+
+def test_replay_onto_a_bus(tmp_path):
+    path = str(tmp_path / "trace")
+    frames = _frames()
+    with TraceRecorder(path) as recorder:
+        for msg in frames:
+            recorder.record_frame(msg)
+
+    sent = []
+
+    class Bus:
+        def send(self, msg):
+            sent.append(msg)
+
+    assert TraceReplayer(path).replay(Bus(), speed=None) == len(frames)
+    assert [_key(msg) for msg in sent] == [_key(msg) for msg in frames]
+
+
+def test_no_payload_file_without_long_frames(tmp_path):
+    path = str(tmp_path / "trace")
+    with TraceRecorder(path) as recorder:
+        recorder.record_frame(can.Message(arbitration_id=0x181, data=bytes(8), is_extended_id=False))
+    assert not (tmp_path / ("trace" + PAYLOAD_SUFFIX)).exists()
+    assert len(TraceReplayer(path).payload) == 0
+
+
+def test_frame_longer_than_max_data_is_rejected(tmp_path):
+    with TraceRecorder(str(tmp_path / "trace")) as recorder:
+        with pytest.raises(ValueError):
+            recorder.record_frame(can.Message(arbitration_id=0x300, data=bytes(MAX_DATA + 1)))